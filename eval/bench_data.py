@@ -0,0 +1,101 @@
+import os
+import json
+import time
+
+import fire
+
+from dense.storage import FramedDataset, iter_instances
+from dense.storage.frames import frame_index_path
+
+def time_it(func, repeat):
+    """
+    Return the best wall time of `repeat` calls of func, in seconds, and the result of the last call.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def print_row(name, seconds, bytes_read, num_instances, baseline_seconds):
+    print(
+        f"    {name:<32} {seconds:>8.2f} s {baseline_seconds / seconds:>7.1f}x "
+        f"{bytes_read / 2**20:>10.1f} MiB read {num_instances:>8} instances"
+    )
+
+def bench_task(path, bounds, num_workers, repeat):
+    """
+    Compare json.load of the plain task file with streaming it and with reading its framed, compressed copy.
+    """
+    index_path = frame_index_path(path)
+    if not os.path.exists(index_path):
+        print(f"{path}: no frame index {index_path}, run eval/data.py to_framed first.")
+        return
+    length_lower_bound, length_upper_bound, seed_num = bounds
+
+    def selected(elem):
+        seed = int(elem["seed_id"].split("_")[-1])
+        return length_lower_bound <= elem["token_level"] <= length_upper_bound and seed <= seed_num
+
+    def json_load():
+        with open(path) as file:
+            return json.load(file)
+
+    plain_bytes = os.path.getsize(path)
+    framed = FramedDataset(index_path)
+    print(f"{path}: {plain_bytes / 2**20:.1f} MiB as JSON, {framed.size / 2**20:.1f} MiB framed "
+          f"({len(framed.frames)} frames), slice {bounds}")
+
+    baseline, data = time_it(json_load, repeat)
+    print_row("json.load (whole file)", baseline, plain_bytes, len(data), baseline)
+    seconds, data = time_it(lambda: [elem for elem in json_load() if selected(elem)], repeat)
+    print_row("json.load + filter (slice)", seconds, plain_bytes, len(data), baseline)
+    seconds, data = time_it(lambda: list(iter_instances(path, selected)), repeat)
+    print_row("streamed (slice)", seconds, plain_bytes, len(data), baseline)
+
+    for workers in sorted({1, num_workers or os.cpu_count() or 1}):
+        for name, read in (
+            ("whole file", lambda dataset: list(dataset.iter_instances())),
+            ("slice", lambda dataset: dataset.select_slices([bounds])[bounds]),
+        ):
+            datasets = []
+
+            def read_framed():
+                datasets.append(FramedDataset(index_path, num_workers=workers))
+                return read(datasets[-1])
+
+            seconds, data = time_it(read_framed, repeat)
+            print_row(f"framed, {workers} threads ({name})", seconds, datasets[-1].bytes_read, len(data), baseline)
+
+def main(
+    data_dir: str = "data",
+    tasks: str = None,
+    length_lower_bound: int = 0,
+    length_upper_bound: int = 128000,
+    seed_num: int = 1,
+    num_workers: int = None,
+    repeat: int = 3,
+):
+    """
+    Benchmark the load time and the bytes read of the task files: json.load of {task}.json, as the data is loaded
+    today, against the framed, compressed copy written by eval/data.py to_framed, whole and for a slice.
+
+    Parameters:
+    data_dir (str): The directory of the task files.
+    tasks (str): Comma-separated tasks. Defaults to every task with a frame index in data_dir.
+    length_lower_bound (int): The lower bound of the token levels of the slice.
+    length_upper_bound (int): The upper bound of the token levels of the slice.
+    seed_num (int): The number of seeds of the slice.
+    num_workers (int): The number of decompression threads compared with 1. Defaults to the number of CPUs.
+    repeat (int): The number of timed repetitions; the best one is reported.
+    """
+    if tasks:
+        tasks = tasks.split(",")
+    else:
+        tasks = sorted(name[:-len(".frames.json")] for name in os.listdir(data_dir) if name.endswith(".frames.json"))
+    for task in tasks:
+        bench_task(os.path.join(data_dir, f"{task}.json"), (length_lower_bound, length_upper_bound, seed_num), num_workers, repeat)
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import random
+
+import fire
+
+from dense.storage import Codec, ResponseCache, train_dictionary
+from dense.storage.codec import zstandard
+
+def time_it(func, repeat):
+    """
+    Return the best wall time of `repeat` calls of func, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def print_row(name, num_bytes, raw_bytes, write_seconds, read_seconds):
+    mib = raw_bytes / 2**20
+    print(
+        f"    {name:<22} {num_bytes / 2**20:>10.2f} MiB {raw_bytes / max(num_bytes, 1):>7.1f}x "
+        f"{mib / write_seconds:>10.1f} MiB/s {mib / read_seconds:>10.1f} MiB/s"
+    )
+
+def bench_results(paths, repeat):
+    """
+    Compare indented JSON (json.dump / json.load, as results.json is written today) with the compressed artifacts.
+    """
+    objects = []
+    for path in paths:
+        with open(path) as file:
+            objects.append(json.load(file))
+    raw_bytes = sum(len(json.dumps(obj, indent=4).encode("utf-8")) for obj in objects)
+    print(f"Results: {len(objects)} files, {raw_bytes / 2**20:.2f} MiB as indented JSON")
+    print(f"    {'format':<22} {'size':>14} {'ratio':>8} {'write':>16} {'read':>16}")
+
+    def write_json():
+        return [json.dumps(obj, indent=4).encode("utf-8") for obj in objects]
+
+    blobs = write_json()
+    print_row("json (indent=4)", raw_bytes, raw_bytes, time_it(write_json, repeat), time_it(lambda: [json.loads(blob) for blob in blobs], repeat))
+
+    configs = [("gzip", 6, 0)]
+    if zstandard is not None:
+        configs += [("zstd", 3, 0), ("zstd", 3, -1), ("zstd", 10, -1), ("zstd", 19, -1)]
+    for codec_name, level, threads in configs:
+        codec = Codec(codec_name, level=level, threads=threads)
+
+        def write_compressed():
+            return [codec.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8")) for obj in objects]
+
+        blobs = write_compressed()
+        read_seconds = time_it(lambda: [json.loads(codec.decompress(blob)) for blob in blobs], repeat)
+        name = f"{codec_name}-{level}" + (" (threads)" if threads else "")
+        print_row(name, sum(map(len, blobs)), raw_bytes, time_it(write_compressed, repeat), read_seconds)
+
+def bench_cache(cache_dir, max_entries, repeat):
+    """
+    Compare the codecs on response cache entries, with a dictionary trained on half of them and measured on the other half.
+    """
+    cache = ResponseCache(cache_dir)
+    keys = list(cache.keys())
+    random.Random(0).shuffle(keys)
+    samples = [json.dumps(cache.get(key)).encode("utf-8") for key in keys[:max_entries]]
+    if len(samples) < 2:
+        print(f"Cache: not enough entries in {cache_dir}.")
+        return
+    train, test = samples[:len(samples) // 2], samples[len(samples) // 2:]
+    raw_bytes = sum(map(len, test))
+    print(f"Cache: {len(test)} entries measured, {raw_bytes / 2**20:.2f} MiB as JSON")
+    print(f"    {'format':<22} {'size':>14} {'ratio':>8} {'write':>16} {'read':>16}")
+
+    codecs = {"none": Codec("none"), "gzip-6": Codec("gzip")}
+    if zstandard is not None:
+        codecs["zstd-3"] = Codec("zstd")
+        try:
+            codecs["zstd-3 + dictionary"] = Codec("zstd", dictionary=train_dictionary(train))
+        except Exception as e:
+            print(f"    (no dictionary: {e})")
+    for name, codec in codecs.items():
+        blobs = [codec.compress(sample) for sample in test]
+        write_seconds = time_it(lambda: [codec.compress(sample) for sample in test], repeat)
+        read_seconds = time_it(lambda: [codec.decompress(blob) for blob in blobs], repeat)
+        print_row(name, sum(map(len, blobs)), raw_bytes, write_seconds, read_seconds)
+
+def main(results_root: str = "res", cache_dir: str = ".cache", max_results: int = 20, max_entries: int = 5000, repeat: int = 3):
+    """
+    Benchmark the size and the read/write throughput of the storage codecs on existing results and cache entries.
+
+    Parameters:
+    results_root (str): The result directory; up to max_results uncompressed results.json files are read from it.
+    cache_dir (str): The response cache directory.
+    max_results (int): The number of results.json files used.
+    max_entries (int): The number of cache entries used.
+    repeat (int): The number of timed repetitions; the best one is reported.
+    """
+    paths = []
+    for dirpath, _, filenames in os.walk(results_root):
+        if "results.json" in filenames:
+            paths.append(os.path.join(dirpath, "results.json"))
+    if paths:
+        bench_results(sorted(paths)[:max_results], repeat)
+    else:
+        print(f"Results: no uncompressed results.json under {results_root}.")
+    bench_cache(cache_dir, max_entries, repeat)
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,185 @@
+import os
+
+import fire
+
+from dense.storage import (
+    ResponseCache,
+    dump_json,
+    export_bundle,
+    import_bundle,
+    load_json,
+    merge_bundles,
+    serve,
+    verify_bundle,
+)
+
+def train_dictionary(cache_dir: str = ".cache", dict_size: int = 112640, max_samples: int = 5000, recompress: bool = True):
+    """
+    Train a zstd dictionary on the cached responses; new entries are compressed with it.
+
+    Parameters:
+    cache_dir (str): The response cache directory.
+    dict_size (int): The maximum size of the dictionary in bytes.
+    max_samples (int): The number of entries sampled for training.
+    recompress (bool): Also rewrite the existing entries with the new dictionary.
+    """
+    cache = ResponseCache(cache_dir)
+    print(f"Trained {cache.train_dictionary(dict_size=dict_size, max_samples=max_samples)}.")
+    if recompress:
+        before, after = cache.recompress()
+        print(f"Recompressed the entries: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB.")
+
+def compress_results(root: str = "res", codec: str = "zstd"):
+    """
+    Compress every results.json under a result directory, e.g. res/, in place.
+
+    Parameters:
+    root (str): The result directory.
+    codec (str): "zstd" or "gzip".
+    """
+    before = after = 0
+    for dirpath, _, filenames in os.walk(root):
+        if "results.json" not in filenames:
+            continue
+        path = os.path.join(dirpath, "results.json")
+        before += os.path.getsize(path)
+        after += os.path.getsize(dump_json(load_json(path), path, compress=codec))
+    print(f"Compressed the results in {root}: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB.")
+
+def export(bundle: str, cache_dir: str = ".cache", models: str = None, tasks: str = None, since: str = None, until: str = None):
+    """
+    Export cached responses into a bundle file.
+
+    Parameters:
+    bundle (str): The path of the bundle to write, e.g. gpt-sql.bundle.zst.
+    cache_dir (str): The response cache directory.
+    models (str): Comma-separated API model names to export (e.g. "gpt-4o-mini,qwen2.5-*"). Defaults to all.
+    tasks (str): Comma-separated tasks to export (e.g. "table_sql_*"). Defaults to all.
+    since (str): Only export the entries created at or after this date, e.g. 2024-10-01.
+    until (str): Only export the entries created before this date.
+    """
+    num_entries = export_bundle(ResponseCache(cache_dir), bundle, models=models, tasks=tasks, since=since, until=until)
+    print(f"Exported {num_entries} entries to {bundle}.")
+
+def import_(bundle: str, cache_dir: str = ".cache", overwrite: bool = False, models: str = None, tasks: str = None):
+    """
+    Import a bundle into the response cache, after checking its integrity.
+
+    Parameters:
+    bundle (str): The path of the bundle.
+    cache_dir (str): The response cache directory.
+    overwrite (bool): Replace the entries the cache already has.
+    models (str): Only import these API model names.
+    tasks (str): Only import these tasks.
+    """
+    num_imported, num_skipped = import_bundle(ResponseCache(cache_dir), bundle, overwrite=overwrite, models=models, tasks=tasks)
+    print(f"Imported {num_imported} entries from {bundle} ({num_skipped} already cached).")
+
+def merge(output: str, *bundles: str):
+    """
+    Merge bundles into one, after checking each of them.
+
+    Parameters:
+    output (str): The path of the merged bundle.
+    bundles (str): The paths of the bundles to merge.
+    """
+    print(f"Merged {merge_bundles(list(bundles), output)} entries into {output}.")
+
+def verify(*bundles: str):
+    """
+    Check the integrity of bundles.
+    """
+    for bundle in bundles:
+        print(f"{bundle}: {verify_bundle(bundle)} entries, OK.")
+
+def gc(cache_dir: str = ".cache", max_size: str = None, policy: str = None, ttl: str = None, num_workers: int = 8):
+    """
+    Delete the expired entries and evict entries beyond the size cap. Safe to run while evaluations use the cache.
+
+    Parameters:
+    cache_dir (str): The response cache directory.
+    max_size (str): The size cap, e.g. 20G. Defaults to LLM_CACHE_MAX_SIZE.
+    policy (str): The eviction policy, "lru" or "lfu". Defaults to LLM_CACHE_EVICTION, or "lru".
+    ttl (str): Per-model TTLs, e.g. "gpt-4o-mini=30d,*=90d". Defaults to LLM_CACHE_TTL.
+    num_workers (int): The number of threads deleting files.
+    """
+    result = ResponseCache(cache_dir).gc(max_size=max_size, policy=policy, ttl=ttl, num_workers=num_workers)
+    print(
+        f"Indexed {result['indexed']} entries, deleted {result['expired']} expired and {result['evicted']} evicted "
+        f"entries, reclaimed {result['reclaimed_bytes'] / 2**20:.1f} MiB."
+    )
+
+def stats(cache_dir: str = ".cache"):
+    """
+    Print the number of entries, size and hits of the response cache by model and task.
+
+    Parameters:
+    cache_dir (str): The response cache directory. Run gc first to index entries written by older versions.
+    """
+    rows = ResponseCache(cache_dir).stats()
+    print(f"{'model':<40} {'task':<28} {'entries':>8} {'MiB':>10} {'hits':>8}")
+    for row in rows:
+        print(f"{str(row['model']):<40} {str(row['task']):<28} {row['entries']:>8} {row['bytes'] / 2**20:>10.2f} {row['hits']:>8}")
+    print(f"{'total':<69} {sum(row['entries'] for row in rows):>8} {sum(row['bytes'] for row in rows) / 2**20:>10.2f}")
+
+def import_joblib(cache_dir: str = ".cache", overwrite: bool = False):
+    """
+    Import the responses cached by joblib's Memory (older versions, in {cache_dir}/joblib/) into the response cache.
+
+    Parameters:
+    cache_dir (str): The response cache directory.
+    overwrite (bool): Replace the entries the cache already has.
+    """
+    # Imported here: loading the LLM backends registers the signatures of their cached functions
+    import dense.llm.llm
+
+    num_imported, num_skipped = ResponseCache(cache_dir).import_joblib(overwrite=overwrite)
+    print(f"Imported {num_imported} responses cached by joblib ({num_skipped} skipped). Runs use them with "
+          f"LLM_CACHE_LEGACY_KEYS=1, which moves each of them to its prompt-digest key on first use.")
+
+def warm(root: str = "res", models: str = None, tasks: str = None, temp: float = 0.0, top_p: float = 0.9):
+    """
+    Seed the response cache (.cache, or the service at LLM_CACHE_URL) from the results.json files of past runs.
+
+    Parameters:
+    root (str): The result directory, laid out as res/{model}/{task}[_head|_tail]/results.json.
+    models (str): Comma-separated models to seed (e.g. "gpt,qwen_7b"). Defaults to all.
+    tasks (str): Comma-separated tasks to seed. Defaults to all.
+    temp (float): The temperature the runs used.
+    top_p (float): The top_p the runs used.
+    """
+    # Imported here: it loads the LLM backends, which the other commands do not need
+    from dense.runner.warm import warm_cache
+
+    def split(value):
+        return value.split(",") if isinstance(value, str) else value
+
+    counts = warm_cache(root, models=split(models), tasks=split(tasks), temp=temp, top_p=top_p)
+    print(f"Stored {sum(stored for stored, _ in counts.values())} responses from {len(counts)} results files.")
+
+def serve_(cache_dir: str = ".cache-service", host: str = "127.0.0.1", port: int = 8765, verbose: bool = False):
+    """
+    Run the shared response-cache service. Runs use it when LLM_CACHE_URL=http://host:port is set.
+
+    Parameters:
+    cache_dir (str): The directory where the service stores the entries.
+    host (str): The interface to listen on, e.g. 0.0.0.0 to serve other machines.
+    port (int): The port to listen on.
+    verbose (bool): Log every request.
+    """
+    serve(cache_dir, host=host, port=port, verbose=verbose)
+
+if __name__ == "__main__":
+    fire.Fire({
+        "train_dictionary": train_dictionary,
+        "compress_results": compress_results,
+        "export": export,
+        "import": import_,
+        "merge": merge,
+        "verify": verify,
+        "serve": serve_,
+        "gc": gc,
+        "warm": warm,
+        "import_joblib": import_joblib,
+        "stats": stats,
+    })
@@ -0,0 +1,238 @@
+import glob
+import json
+import os
+
+import fire
+
+from dense.storage import convert_to_columnar, convert_to_framed, convert_to_jsonl, convert_to_segments
+from dense.storage import find_task_file
+from dense.synth import generate_task_file, write_variants
+from dense.synth.generator import split_task
+from dense.synth.validate import validate_file
+
+def json_task_files(data_dir):
+    """
+    Return the {task}.json files of data_dir, without the frame indexes ({task}.frames.json).
+    """
+    return sorted(path for path in glob.glob(os.path.join(data_dir, "*.json")) if not path.endswith(".frames.json"))
+
+def to_jsonl(data_dir: str = "data", tasks: str = None, compress: str = None):
+    """
+    Convert the task files to JSONL, which the loaders stream one instance per line.
+
+    Parameters:
+    data_dir (str): The directory of the task files.
+    tasks (str): Comma-separated tasks to convert. Defaults to every {task}.json in data_dir.
+    compress (str): Compress the JSONL files with "zstd" or "gzip".
+    """
+    if tasks:
+        paths = [os.path.join(data_dir, f"{task}.json") for task in tasks.split(",")]
+    else:
+        paths = json_task_files(data_dir)
+    for path in paths:
+        output, num_instances = convert_to_jsonl(path, compress=compress)
+        print(f"{path} -> {output}: {num_instances} instances, {os.path.getsize(output) / 2**20:.1f} MiB.")
+
+def to_columnar(data_dir: str = "data", tasks: str = None, row_group_mb: float = 32):
+    """
+    Convert the task files to the columnar format ({task}.meta.parquet and {task}.text.parquet, requires pyarrow),
+    from which slices are selected on the metadata columns without reading the other contexts. A columnar copy is
+    ignored once its {task}.json changes: convert the task again.
+
+    Parameters:
+    data_dir (str): The directory of the task files.
+    tasks (str): Comma-separated tasks to convert. Defaults to every {task}.json in data_dir.
+    row_group_mb (float): The approximate size of a row group of the text file, in MiB.
+    """
+    if tasks:
+        paths = [os.path.join(data_dir, f"{task}.json") for task in tasks.split(",")]
+    else:
+        paths = json_task_files(data_dir)
+    for path in paths:
+        meta_path, text_path, num_instances = convert_to_columnar(path, row_group_bytes=int(row_group_mb * 2**20))
+        size = (os.path.getsize(meta_path) + os.path.getsize(text_path)) / 2**20
+        print(f"{path} -> {text_path}: {num_instances} instances, {size:.1f} MiB.")
+
+def to_segments(data_dir: str = "data", tasks: str = None, store: str = None):
+    """
+    Move the contexts of the task files into a deduplicated segment store, writing {task}.refs.jsonl files
+    whose instances refer to their contexts by segment ids.
+
+    Parameters:
+    data_dir (str): The directory of the task files.
+    tasks (str): Comma-separated tasks to convert. Defaults to every {task}.json in data_dir.
+    store (str): The path of the segment store, shared by the tasks. Defaults to {data_dir}/contexts.
+    """
+    store = store or os.path.join(data_dir, "contexts")
+    if tasks:
+        paths = [os.path.join(data_dir, f"{task}.json") for task in tasks.split(",")]
+    else:
+        paths = json_task_files(data_dir)
+    for path in paths:
+        output, num_instances, num_bytes, unique_bytes = convert_to_segments(path, store)
+        print(f"{path} -> {output}: {num_instances} instances, {num_bytes / 2**20:.1f} MiB of contexts.")
+    print(f"The store {store} holds {unique_bytes / 2**20:.1f} MiB of unique segments.")
+
+def to_framed(data_dir: str = "data", tasks: str = None, compress: str = "auto", frame_mb: float = 8):
+    """
+    Convert the task files to compressed JSONL written in independent frames, with a frame index ({task}.frames.json)
+    from which slices are read without decompressing the other frames.
+
+    Parameters:
+    data_dir (str): The directory of the task files.
+    tasks (str): Comma-separated tasks to convert. Defaults to every {task}.json in data_dir.
+    compress (str): "zstd", "gzip" or "auto" (zstd when the zstandard package is installed).
+    frame_mb (float): The approximate size of a frame before compression, in MiB.
+    """
+    if tasks:
+        paths = [os.path.join(data_dir, f"{task}.json") for task in tasks.split(",")]
+    else:
+        paths = json_task_files(data_dir)
+    for path in paths:
+        output, index_path, num_instances = convert_to_framed(path, compress=compress, frame_bytes=int(frame_mb * 2**20))
+        with open(index_path) as file:
+            num_frames = len(json.load(file)["frames"])
+        ratio = os.path.getsize(path) / os.path.getsize(output)
+        print(f"{path} -> {output}: {num_instances} instances in {num_frames} frames, "
+              f"{os.path.getsize(output) / 2**20:.1f} MiB ({ratio:.1f}x).")
+
+def generate(
+    tasks: str,
+    token_levels: str = "512000,1000000",
+    num_seeds: int = 5,
+    data_dir: str = "data",
+    num_levels: int = 8,
+    num_relevant: int = None,
+    compress: str = None,
+    salt: int = 0,
+):
+    """
+    Generate synthetic task files ({data_dir}/{task}.jsonl) with new token levels or more seeds.
+
+    Parameters:
+    tasks (str): Comma-separated tasks to generate, e.g. table_sql_absolute,history_reorder_relative.
+    token_levels (str): Comma-separated token levels; every (token level, seed) has one instance per level.
+    num_seeds (int): The number of seeds of every token level (seed_1 to seed_{num_seeds}).
+    data_dir (str): The directory to write to; it should not have a data file for these tasks yet.
+    num_levels (int): The number of levels of the placement of the relevant items.
+    num_relevant (int): The number of relevant items of every instance. Defaults to the task's.
+    compress (str): Compress the files with "zstd" or "gzip".
+    salt (int): Draw a different dataset with the same parameters.
+    """
+    if not isinstance(tasks, (list, tuple)):
+        tasks = str(tasks).split(",")
+    if not isinstance(token_levels, (list, tuple)):
+        token_levels = str(token_levels).split(",")
+    token_levels = [int(token_level) for token_level in token_levels]
+    for task in tasks:
+        output, num_instances = generate_task_file(
+            task, token_levels, num_seeds, data_dir=data_dir, compress=compress,
+            num_levels=num_levels, num_relevant=num_relevant, salt=salt,
+        )
+        print(f"{task} -> {output}: {num_instances} instances, {os.path.getsize(output) / 2**20:.1f} MiB.")
+
+def variants(
+    tasks: str,
+    num_levels: int,
+    placement: str = None,
+    data_dir: str = "data",
+    output_dir: str = None,
+    store: str = None,
+    base_level: str = "level 0",
+):
+    """
+    Write the positional variants of the instances of the task files, on a grid of num_levels levels, to
+    {output_dir}/{name}_{placement}.jsonl. A variant only holds its placement: its context is assembled from the
+    segment store of its base when its prompt is built. Evaluate them with --data_dir {output_dir}.
+
+    Parameters:
+    tasks (str): Comma-separated tasks of the base instances, e.g. table_sql_absolute.
+    num_levels (int): The number of levels of the grid of every base instance.
+    placement (str): "absolute" or "relative". Defaults to the placement of the task.
+    data_dir (str): The directory of the task files.
+    output_dir (str): The directory to write to; it should not have a data file for these tasks yet.
+        Defaults to {data_dir}/variants.
+    store (str): The segment store of the base contexts, shared with to_segments. Defaults to {data_dir}/contexts.
+    base_level (str): Only the instances at this level are bases (one per token level and seed); "" uses all.
+    """
+    if not isinstance(tasks, (list, tuple)):
+        tasks = str(tasks).split(",")
+    output_dir = output_dir or os.path.join(data_dir, "variants")
+    store = store or os.path.join(data_dir, "contexts")
+    os.makedirs(output_dir, exist_ok=True)
+    for task in tasks:
+        synthetic_task, task_placement = split_task(task)
+        variant_task = f"{synthetic_task.name}_{placement or task_placement}"
+        try:
+            existing = find_task_file(variant_task, output_dir)
+        except FileNotFoundError:
+            existing = None
+        if existing is not None:
+            raise FileExistsError(f"{output_dir} already has a data file for {variant_task}: {existing}.")
+        output = os.path.join(output_dir, f"{variant_task}.jsonl")
+        num_variants = write_variants(
+            find_task_file(task, data_dir), task, placement or task_placement, num_levels, store, output,
+            base_level=base_level or None,
+        )
+        print(f"{task} -> {output}: {num_variants} variants, {os.path.getsize(output) / 2**20:.1f} MiB.")
+
+def validate(tasks: str, data_dir: str = "data", num_workers: int = None, report: str = None):
+    """
+    Check that every instance of the task files is solvable from its context and that its answers and location
+    match the reference solution. The solvers read the item formats of the task files (see dense.synth.solvers):
+    instances in other formats are counted as "format" and not solved.
+
+    Parameters:
+    tasks (str): Comma-separated tasks to validate.
+    data_dir (str): The directory of the task files.
+    num_workers (int): The number of processes. Defaults to the number of CPUs.
+    report (str): Save the reports of the tasks to this JSON file.
+    """
+    if not isinstance(tasks, (list, tuple)):
+        tasks = str(tasks).split(",")
+    reports = []
+    for task in tasks:
+        task_report = validate_file(task, data_dir=data_dir, num_workers=num_workers)
+        reports.append(task_report)
+        problems = ", ".join(f"{count} {problem}" for problem, count in task_report["problems"].items() if count)
+        print(
+            f"{task_report['path']}: {task_report['num_valid']} of {task_report['num_instances']} instances valid"
+            f"{f' ({problems})' if problems else ''} in {task_report['seconds']}s."
+        )
+        for result in task_report["invalid"]:
+            print(f"    {result['id']} ({result['token_level']}, {result['level']}): {', '.join(result['problems'])}")
+    if report:
+        with open(report, "w") as file:
+            json.dump(reports, file, indent=4)
+
+def index_tokens(tasks: str, model: str = "gpt", data_dir: str = "data", num_workers: int = None):
+    """
+    Index the token positions of the answer items of the task files ({task}.tokens.jsonl), with the tokenizer
+    of a model. Only the contexts missing from the index are tokenized.
+
+    Parameters:
+    tasks (str): Comma-separated tasks to index.
+    model (str): The model key whose tokenizer is used, e.g. gpt or qwen_7b.
+    data_dir (str): The directory of the task files.
+    num_workers (int): The number of processes. Defaults to the number of CPUs.
+    """
+    # Imported here: dense.llm creates the API clients, which the other commands do not need
+    from dense.runner.token_index import build_token_index
+
+    if not isinstance(tasks, (list, tuple)):
+        tasks = str(tasks).split(",")
+    for task in tasks:
+        path, num_indexed, num_cached = build_token_index(task, model, data_dir=data_dir, num_workers=num_workers)
+        print(f"{path}: {num_indexed} contexts tokenized, {num_cached} instances already indexed.")
+
+if __name__ == "__main__":
+    fire.Fire({
+        "to_jsonl": to_jsonl,
+        "to_columnar": to_columnar,
+        "to_segments": to_segments,
+        "to_framed": to_framed,
+        "generate": generate,
+        "variants": variants,
+        "validate": validate,
+        "index_tokens": index_tokens,
+    })
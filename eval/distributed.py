@@ -0,0 +1,47 @@
+import fire
+
+from dense.runner.queue import open_queue
+from dense.runner.sweep import load_spec
+from dense.runner.distributed import Worker, submit_sweep
+
+def submit(spec: str, queue: str, num_shards: int = 1):
+    """
+    Add the units of a sweep spec to a work queue.
+
+    Parameters:
+    spec (str): The path of the JSON sweep spec (see dense/runner/sweep.py).
+    queue (str): The queue URL, e.g. sqlite:///res/queue.db or redis://host:6379/0.
+    num_shards (int): The number of units each cell is split into.
+    """
+    num_units = submit_sweep(open_queue(queue), load_spec(spec), num_shards=num_shards)
+    print(f"Submitted {num_units} units.")
+
+def work(queue: str, data_dir: str = "data", worker_id: str = None, lease_seconds: int = 300, max_units: int = None):
+    """
+    Lease and run units from a work queue until it is drained.
+
+    Parameters:
+    queue (str): The queue URL.
+    data_dir (str): The directory of the task files on this machine.
+    worker_id (str): The name of this worker in the queue. Defaults to hostname-pid.
+    lease_seconds (int): How long a lease lasts without a heartbeat.
+    max_units (int): Stop after this many units.
+    """
+    worker = Worker(open_queue(queue), data_dir=data_dir, worker_id=worker_id, lease_seconds=lease_seconds)
+    print(f"Completed {worker.run(max_units=max_units)} units.")
+
+def merge(spec: str, queue: str, num_shards: int = 1, data_dir: str = "data"):
+    """
+    Merge the cells whose shards are all done but which have no results.json yet.
+    """
+    worker = Worker(open_queue(queue), data_dir=data_dir)
+    print(f"Merged {worker.merge_done_cells(load_spec(spec), num_shards=num_shards)} cells.")
+
+def status(queue: str):
+    """
+    Print the number of units in each state.
+    """
+    print(open_queue(queue).stats())
+
+if __name__ == "__main__":
+    fire.Fire({"submit": submit, "work": work, "merge": merge, "status": status})
@@ -1,28 +1,5 @@
 import os
 import fire
-import json
-
-from dense.llm import llm_generate
-from dense.eval import EquationSolutionMetric, HistoryReorderMetric, SQLMetric
-
-# Mapping for the model and metric
-Metric = {
-    "history_reorder_absolute": HistoryReorderMetric,
-    "history_reorder_relative": HistoryReorderMetric,
-    "table_sql_absolute": SQLMetric,
-    "table_sql_relative": SQLMetric,
-    "equation_solution_absolute": EquationSolutionMetric,
-    "equation_solution_relative": EquationSolutionMetric,
-}
-
-def select_prompt(head_query: bool, tail_query: bool):
-    assert head_query or tail_query, "At least one of head_query and tail_query should be True."
-    if head_query and tail_query:
-        return "default_prompt"
-    elif head_query:
-        return "query_head_prompt"
-    elif tail_query:
-        return "query_tail_prompt"
 
 def main(
     model: str,
@@ -31,7 +8,17 @@ def main(
     length_upper_bound: int,
     seed_num: int,
     head_query: bool,
-    tail_query: bool
+    tail_query: bool,
+    resume: bool = False,
+    flush_every: int = 8,
+    num_workers: int = 1,
+    preflight: str = "reject",
+    retry_time_budget_seconds: float = None,
+    temp: float = 0.0,
+    n: int = 1,
+    compress: str = None,
+    offline: bool = False,
+    shard: str = None,
 ):
     """
     Main function to process the data and evaluate using specified model and task.
@@ -42,78 +29,91 @@ def main(
     length_lower_bound (int): The lower bound of length for sampling data.
     length_upper_bound (int): The upper bound of length for sampling data.
     num_per_grid (int): The number of samples per grid.
+    resume (bool): Continue an interrupted run in save_dir, skipping the instances already logged.
+    flush_every (int): The number of responses buffered before they are flushed to the log.
+    num_workers (int): The number of concurrent requests; the longest prompts are dispatched first.
+    preflight (str): What to do with prompts that exceed the model's context window: "reject" drops them
+        before dispatch, "flag" sends them anyway and marks them in the results, "off" skips the check.
+        Without the model's tokenizer the counts are estimated, and prompts are flagged rather than rejected.
+    retry_time_budget_seconds (float): The total time the retries of this run may spend waiting.
+        Defaults to LLM_RETRY_TIME_BUDGET (1800 seconds).
+    temp (float): The sampling temperature.
+    n (int): The number of samples per instance. With n > 1, every sample is scored and results.json stores
+        'llm_responses', 'scores', and their mean ('score') and variance ('score_variance').
+    compress (str): Save the results compressed, to results.json.zst ("zstd") or results.json.gz ("gzip").
+    offline (bool): Serve every response from the cache and never contact the API (no .env or API key needed).
+        The run fails before generating anything if responses are missing, and lists all of them.
+    shard (str): Only generate the responses of shard "i/N" of the instances, e.g. for the i-th task of an array job.
+        The shards are balanced by estimated prompt tokens and write their own files to save_dir; once all
+        are done, eval/merge.py scores them into results.json.
     """
-    if head_query and tail_query:
-        save_dir = f"res/{model}/{task}"
-    elif head_query:
-        save_dir = f"res/{model}/{task}_head"
-    elif tail_query:
-        save_dir = f"res/{model}/{task}_tail"
-    
-    # Ensure the save directory exists and is empty
-    os.makedirs(save_dir, exist_ok=True)
-    assert len(os.listdir(save_dir)) == 0, "The save_dir should be empty. Please check the path."
-    
-    # Load and sample data
-    with open(f"data/{task}.json") as file:
-        data = json.load(file)
-    
-    # sample a subset
-    def valid_length(elem):
-        return length_lower_bound <= elem['token_level'] <= length_upper_bound
-    
-    def valid_seed_num(elem):
-        int_seed = int(elem['seed_id'].split('_')[-1])
-        return int_seed <= seed_num
+    if offline:
+        # Set before the backends are imported, so that they skip .env and create no API client
+        os.environ["LLM_OFFLINE"] = "1"
+    from dense.llm.errors import retry_time_budget
+    from dense.runner.pipeline import (
+        build_inputs,
+        default_save_dir,
+        describe_cell,
+        evaluate_cell,
+        load_task_slice,
+        select_prompt,
+    )
+    from dense.runner.shards import parse_shard, run_shard
 
-    sampled_data = [elem for elem in data if valid_length(elem) and valid_seed_num(elem)]
+    save_dir = default_save_dir(model, task, head_query, tail_query)
 
-    metric = Metric[task]()
+    # Stream the data file, keeping only the sampled instances
+    sampled_data = load_task_slice(task, length_lower_bound, length_upper_bound, seed_num)
     
     # Prepare inputs for inference
     prompt_type = select_prompt(head_query, tail_query)
-    
-    inputs = [
-        {
-            "system_prompt": elem[prompt_type]['system_prompt'],
-            "user_message": elem[prompt_type]["user_message"].format(
-                context=elem['context'], 
-                query=elem['question']
-            )
-        }
-        for elem in sampled_data
-    ]
-    
-    # Perform inference and get responses
-    str_responses = llm_generate(inputs, model)
-    
-    # Extract labels and evaluate responses
-    labels = [elem["answers"] for elem in sampled_data]
-    
-    # Append responses to the sampled data
-    for i, elem in enumerate(sampled_data):
-        elem["llm_response"] = str_responses[i]
-    
-    with open(os.path.join(save_dir, "generates.json"), 'w') as file:
-        json.dump(sampled_data, file, indent=4)
-    
-    with open(os.path.join(save_dir, "generates.json"), 'r') as file:
-        sampled_data = json.load(file)
+    inputs = build_inputs(sampled_data, prompt_type, task)
+    # Recorded in save_dir, so that a resumed run is checked to be of the same cell
+    cell = describe_cell(model, task, length_lower_bound, length_upper_bound, seed_num, prompt_type)
 
-    str_responses = [elem["llm_response"] for elem in sampled_data]
-    labels = [elem['answers'] for elem in sampled_data]
-        
-    scores = metric.evaluate(str_responses, labels)    
-    # Append scores to the sampled data
-    for i, elem in enumerate(sampled_data):
-        elem["score"] = scores[i]
-    
-    # Analyze and save the results
-    with open(os.path.join(save_dir, "results.json"), 'w') as file:
-        json.dump(sampled_data, file, indent=4)
-        
-    # if successfully saved, remove the generates.json because all the information is in results.json
-    os.remove(os.path.join(save_dir, "generates.json"))
+    if retry_time_budget_seconds is not None:
+        retry_time_budget.reset(retry_time_budget_seconds)
+
+    if shard is not None:
+        # Pre-flight and inference of this shard only; the results are saved to save_dir/generates.{i}-of-{N}.jsonl
+        index, num_shards = parse_shard(shard)
+        num_instances = run_shard(
+            sampled_data,
+            inputs,
+            model,
+            save_dir,
+            index,
+            num_shards,
+            resume=resume,
+            flush_every=flush_every,
+            preflight=preflight,
+            cell=cell,
+            n=n,
+            temp=temp,
+            num_workers=num_workers,
+            offline=offline,
+        )
+        print(f"Shard {shard}: {num_instances} of {len(sampled_data)} instances generated.")
+        return
+
+    # Pre-flight, inference and scoring, after checking save_dir; the results are saved to save_dir/results.json
+    evaluate_cell(
+        sampled_data,
+        inputs,
+        model,
+        task,
+        save_dir,
+        resume=resume,
+        flush_every=flush_every,
+        preflight=preflight,
+        n=n,
+        compress=compress,
+        cell=cell,
+        temp=temp,
+        num_workers=num_workers,
+        offline=offline,
+    )
 
 if __name__ == "__main__":
     fire.Fire(main)
@@ -0,0 +1,42 @@
+import fire
+
+from dense.runner.pipeline import build_inputs, default_save_dir, load_task_slice, select_prompt
+from dense.runner.shards import merge_shards
+
+def main(
+    model: str,
+    task: str,
+    length_lower_bound: int,
+    length_upper_bound: int,
+    seed_num: int,
+    head_query: bool,
+    tail_query: bool,
+    num_shards: int,
+    n: int = 1,
+    compress: str = None,
+):
+    """
+    Merge the shards of a cell run with eval.py --shard i/N into its results.json.
+
+    The instances the shards rejected in their pre-flight are combined into preflight_rejected.json. The merge
+    fails, writing nothing, if another instance has no response or was generated by several shards, e.g. when a
+    shard is still running, crashed, or ran with another number of shards.
+
+    Parameters:
+    model (str): The model of the cell.
+    task (str): The task of the cell.
+    length_lower_bound (int): The lower bound of length the shards sampled with.
+    length_upper_bound (int): The upper bound of length the shards sampled with.
+    seed_num (int): The number of seeds the shards sampled with.
+    num_shards (int): The number of shards N.
+    n (int): The number of samples per instance the shards drew.
+    compress (str): Save the results compressed, to results.json.zst ("zstd") or results.json.gz ("gzip").
+    """
+    save_dir = default_save_dir(model, task, head_query, tail_query)
+    sampled_data = load_task_slice(task, length_lower_bound, length_upper_bound, seed_num)
+    inputs = build_inputs(sampled_data, select_prompt(head_query, tail_query), task)
+    num_instances = merge_shards(sampled_data, inputs, task, save_dir, num_shards, n=n, compress=compress)
+    print(f"Merged the {num_shards} shards of {save_dir}: {num_instances} instances.")
+
+if __name__ == "__main__":
+    fire.Fire(main)
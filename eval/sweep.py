@@ -0,0 +1,32 @@
+import os
+import sys
+import fire
+
+def main(spec: str, data_dir: str = "data", retry_time_budget_seconds: float = None, offline: bool = False):
+    """
+    Run every cell of a sweep spec in a single process.
+
+    Parameters:
+    spec (str): The path of the JSON sweep spec (see dense/runner/sweep.py and eval/specs/).
+    data_dir (str): The directory of the task files.
+    retry_time_budget_seconds (float): The total time the retries of every cell may spend waiting.
+    offline (bool): Serve every response from the cache and never contact the API (no .env or API key needed);
+        the cells with missing responses fail and list them.
+    """
+    if offline:
+        # Set before the backends are imported, so that they skip .env and create no API client
+        os.environ["LLM_OFFLINE"] = "1"
+    from dense.llm.errors import retry_time_budget
+    from dense.runner.sweep import load_spec, run_sweep
+
+    if retry_time_budget_seconds is not None:
+        retry_time_budget.reset(retry_time_budget_seconds)
+
+    failures = run_sweep(load_spec(spec), data_dir=data_dir)
+    if failures:
+        print(f"{len(failures)} cells failed: {', '.join(failures)}")
+        sys.exit(1)
+    print("All evaluations completed successfully.")
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -12,6 +12,9 @@ class NLGMetric(ABC):
     evaluate(self, llm_responses: List[str], labels: List[List[str]]) -> List[List[float]]:
         Calculate the metric for each generated text and its labels.
 
+    evaluate_samples(self, llm_responses: List[List[str]], labels: List[List[str]]) -> List[List[float]]:
+        Calculate the metric for every sample generated for each input and its labels.
+
     _evaluate_pair(self, llm_response: str, labels: List[str]) -> List[float]:
         Calculate the metric for a single pair of generated text and a list of labels.
     """
@@ -33,6 +36,22 @@ class NLGMetric(ABC):
             results.append(scores)
         return results
 
+    def evaluate_samples(self, llm_responses: List[List[str]], labels: List[List[str]], *args, **kwargs) -> List[List[float]]:
+        """
+        Calculate the metric for every sample generated for each input and its labels.
+
+        Parameters:
+        llm_responses (List[List[str]]): A list of lists, where each sublist contains the samples generated for one input.
+        labels (List[List[str]]): A list of lists, where each sublist contains reference texts for each input.
+
+        Returns:
+        List[List[float]]: For each input, the metric value of each of its samples.
+        """
+        results = []
+        for samples, label_list in zip(llm_responses, labels):
+            results.append(self.evaluate(samples, [label_list] * len(samples), *args, **kwargs))
+        return results
+
     @abstractmethod
     def _evaluate_pair(self, llm_response: str, labels: List[str], *args, **kwargs) -> float:
         """
@@ -1,48 +1,29 @@
-import os
-import tqdm
 from openai import OpenAI
-from joblib import Memory
+from dense.storage import open_cache
 from dotenv import load_dotenv
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
-)
+from .pool import ClientPool, offline_mode
+from .engine import generate_all
+from .errors import llm_retry
 
-# Load API keys from the environment variable file
-load_dotenv('.env')
+# Load API keys from the environment variable file (offline runs need no key)
+if not offline_mode():
+    load_dotenv('.env')
 
 # Set up caching
-memory = Memory(location=".cache", verbose=0)
+memory = open_cache(location=".cache")
 
-# Initialize the OpenAI client using the API key for the Claude-3-Haiku model
-client = OpenAI(api_key=os.environ.get("YOUR_OPENAI_API_KEY"), base_url=os.environ.get("YOUR_OPENAI_BASE_URL"))
+# Initialize the pool of OpenAI clients using the API key(s) for the Claude-3-Haiku model;
+# offline runs (LLM_OFFLINE=1) serve every response from the cache and create none
+client = None if offline_mode() else ClientPool.from_env(OpenAI, "YOUR_OPENAI_API_KEY", "YOUR_OPENAI_BASE_URL")
 
-def retry_callback(retry_state):
-    """
-    Callback function during retries to notify the user about the retry attempt and exception information.
-    """
-    print(
-        f"Retrying {retry_state.fn.__name__} due to {retry_state.outcome.exception()}."
-    )
-    print(
-        f"Attempt {retry_state.attempt_number} of {retry_state.retry_object.stop.max_attempt_number}."
-    )
-
-@retry(
-    reraise=True,  # Re-raise the last exception if the retry attempts are exhausted
-    stop=stop_after_attempt(8),  # Retry a maximum of 8 times
-    wait=wait_exponential(min=2, max=32),  # Exponential backoff strategy with wait times between 2 to 32 seconds
-    retry=retry_if_exception_type(Exception),  # Retry on any type of exception
-    before_sleep=retry_callback,  # Callback function to call before each retry
-)
+@llm_retry  # Retry retryable errors within their budgets, fail fast on terminal ones
 @memory.cache  # Cache the function results to avoid redundant API calls
 def claude_single_generate(
     input_dict,
     model="claude-3-haiku-20240307",
     temp=0.0,
     top_p=0.9,
+    sample_id=0,
 ):
     """
     Generate a single response using the Claude-3-Haiku model.
@@ -52,6 +33,8 @@ def claude_single_generate(
         model (str, optional): The name of the model to use. Defaults to "claude-3-haiku-20240307".
         temp (float, optional): The temperature for generation. Defaults to 0.0.
         top_p (float, optional): The nucleus sampling parameter. Defaults to 0.9.
+        sample_id (int, optional): The index of the sample when several are drawn for the same input. It only
+            distinguishes the cache entries of the samples, since this API generates one sample per request. Defaults to 0.
 
     Returns:
         str: The response generated by the model.
@@ -79,6 +62,11 @@ def claude_generate(
     temp=0.0,
     top_p=0.9,
     mute_tqdm=False,
+    callback=None,
+    num_workers=1,
+    schedule="auto",
+    n=1,
+    limiter=None,
 ):
     """
     Generate responses from Claude-3-Haiku for a set of inputs.
@@ -92,27 +80,29 @@ def claude_generate(
         temp (float, optional): The temperature for generation. Defaults to 0.0.
         top_p (float, optional): The nucleus sampling parameter. Defaults to 0.9.
         mute_tqdm (bool, optional): Whether to disable the tqdm progress bar. Defaults to False.
+        callback (Callable[[int, str, Dict], None], optional): Called with (index, response, error) as soon as each input is done. Defaults to None.
+        num_workers (int, optional): The number of requests in flight at the same time. Defaults to 1.
+        schedule (str, optional): The dispatch order: "fifo", "longest_first" or "auto" (longest first when num_workers > 1). Defaults to "auto".
+        n (int, optional): The number of samples per input. Defaults to 1.
+        limiter (threading.Semaphore, optional): Held during every request to cap the requests in flight to the provider. Defaults to None.
 
     Returns:
-        List[str]: A list of responses generated by the model.
+        List[str]: A list of responses generated by the model (lists of n responses when n > 1, None for the requests that failed).
     """
-    responses = []
-
-    for input_dict in tqdm.tqdm(
+    return generate_all(
+        claude_single_generate,
         inputs,
-        disable=mute_tqdm,
         desc=f"Inference {model}",
-        leave=False,
-    ):
-        response = claude_single_generate(
-            input_dict,
-            model=model,
-            temp=temp,
-            top_p=top_p,
-        )
-        responses.append(response)
-
-    return responses
+        mute_tqdm=mute_tqdm,
+        callback=callback,
+        num_workers=num_workers,
+        schedule=schedule,
+        n=n,
+        limiter=limiter,
+        model=model,
+        temp=temp,
+        top_p=top_p,
+    )
 
 
 if __name__ == "__main__":
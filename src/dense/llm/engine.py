@@ -0,0 +1,309 @@
+"""
+Module: engine
+
+The generation loop shared by every backend. A backend provides a function that
+generates a single response; the engine runs it over a list of inputs, shows
+progress and reports every response as soon as it is available.
+
+With several workers, requests are dispatched longest-job-first: inputs are sorted
+by estimated cost (prompt tokens plus the expected output budget) so the slowest
+calls start early instead of being left at the tail of the run. This is the LPT
+rule for scheduling on identical machines, and the predicted makespan it reports
+is the simulated finish time of that schedule.
+
+With n > 1 samples per input, backends whose API has a native `n` parameter get one
+request per input; the others fan out into n cached requests distinguished by their
+`sample_id`.
+
+The inputs may be any sequence. Inputs built lazily (see dense.runner.pipeline.PromptList)
+are only built when their request is dispatched and released once it is answered, so
+the prompts alive at any time are those of the requests in flight; their sizes and
+cache keys are read without building them.
+
+A request that still fails after its retries does not stop the run: it gets a None
+response and a structured error record (see errors.error_record). Programming errors
+are the exception and are raised immediately.
+
+Offline runs (`generate_cached`) send no request at all: every response is looked up
+in the cache of the backend, and if any is missing the run fails before reporting
+anything, with the list of all the missing ones rather than one at a time.
+"""
+
+import time
+import heapq
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tqdm
+
+from dense.storage import CacheMiss
+from .errors import CacheMissError, classify_exception, error_record
+
+# Rough number of characters per token, used when no tokenizer is involved
+CHARS_PER_TOKEN = 4
+# Output budget assumed for every request when estimating its cost
+EXPECTED_OUTPUT_TOKENS = 512
+
+
+def estimate_cost(input_dict, expected_output_tokens=EXPECTED_OUTPUT_TOKENS):
+    """
+    Estimate the cost of a request in tokens: prompt tokens plus the expected output budget.
+
+    Args:
+        input_dict (Dict[str, str]): A dictionary containing 'system_prompt' and 'user_message'.
+        expected_output_tokens (int, optional): The output budget of the request. Defaults to EXPECTED_OUTPUT_TOKENS.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    num_chars = len(input_dict["system_prompt"]) + len(input_dict["user_message"])
+    return num_chars // CHARS_PER_TOKEN + expected_output_tokens
+
+
+def estimate_costs(inputs, expected_output_tokens=EXPECTED_OUTPUT_TOKENS):
+    """
+    Estimate the cost of every input, see `estimate_cost`.
+
+    Inputs built lazily (see dense.runner.pipeline.PromptList) report the size of their prompts through
+    `num_chars(i)`, so they are not built to be scheduled.
+    """
+    num_chars = getattr(inputs, "num_chars", None)
+    if num_chars is None:
+        return [estimate_cost(input_dict, expected_output_tokens) for input_dict in inputs]
+    return [num_chars(i) // CHARS_PER_TOKEN + expected_output_tokens for i in range(len(inputs))]
+
+
+def key_inputs(inputs, order):
+    """
+    Return the inputs at `order` as they are needed to compute their cache keys: lazily built inputs
+    provide them through `key_input(i)` without building the prompts.
+    """
+    key_input = getattr(inputs, "key_input", None)
+    if key_input is None:
+        return [inputs[i] for i in order]
+    return [key_input(i) for i in order]
+
+
+def simulate_makespan(costs, num_workers):
+    """
+    Simulate list scheduling of jobs, in the given order, on `num_workers` identical workers.
+
+    Args:
+        costs (List[float]): The cost of every job, in dispatch order.
+        num_workers (int): The number of workers.
+
+    Returns:
+        float: The time at which the last job finishes, in the unit of the costs.
+    """
+    loads = [0.0] * max(min(num_workers, len(costs)), 1)
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def schedule_order(costs, num_workers, schedule="auto"):
+    """
+    Return the order in which the inputs are dispatched.
+
+    Args:
+        costs (List[float]): The estimated cost of every input.
+        num_workers (int): The number of workers.
+        schedule (str, optional): "fifo" keeps the input order, "longest_first" sorts by decreasing cost and
+            "auto" uses "longest_first" when running concurrently. Defaults to "auto".
+
+    Returns:
+        List[int]: The indices of the inputs, in dispatch order.
+    """
+    assert schedule in ("auto", "fifo", "longest_first"), f"Unknown schedule {schedule}."
+    if schedule == "auto":
+        schedule = "longest_first" if num_workers > 1 else "fifo"
+    order = list(range(len(costs)))
+    if schedule == "longest_first":
+        order.sort(key=lambda i: costs[i], reverse=True)
+    return order
+
+
+def sample_calls(input_dict, n, native_n, kwargs):
+    """
+    Return the (args, kwargs) calls of `single_generate` that draw the n samples of an input.
+    """
+    if n == 1:
+        return [((input_dict,), kwargs)]
+    if native_n:
+        return [((input_dict,), dict(kwargs, n=n))]
+    return [((input_dict,), dict(kwargs, sample_id=k)) for k in range(n)]
+
+
+def generate_all(
+    single_generate,
+    inputs,
+    desc="Inference",
+    mute_tqdm=False,
+    callback=None,
+    num_workers=1,
+    schedule="auto",
+    n=1,
+    native_n=False,
+    limiter=None,
+    **kwargs,
+):
+    """
+    Generate a response for every input with `single_generate`.
+
+    Args:
+        single_generate (Callable): The backend function generating one response from one input dictionary.
+        inputs (Sequence[Dict[str, Any]]): The input dictionaries containing 'system_prompt' and 'user_message',
+            possibly built lazily.
+        desc (str, optional): The description of the progress bar. Defaults to "Inference".
+        mute_tqdm (bool, optional): Whether to disable the tqdm progress bar. Defaults to False.
+        callback (Callable[[int, str, Dict], None], optional): Called with (index, response, error) as soon as
+            inputs[index] is done, e.g. to persist it. On success error is None; on failure response is None and
+            error is a structured error record. Always called from the calling thread. Defaults to None.
+        num_workers (int, optional): The number of requests in flight at the same time. Defaults to 1.
+        schedule (str, optional): The dispatch order, see `schedule_order`. Defaults to "auto".
+        n (int, optional): The number of samples per input. Defaults to 1.
+        native_n (bool, optional): Whether `single_generate` accepts `n` and returns a list of n responses.
+            Otherwise it is called n times with `sample_id` 0 to n-1. Defaults to False.
+        limiter (threading.Semaphore, optional): Held during every request, to cap the requests in flight to a
+            provider across concurrent calls of generate_all. Defaults to None.
+        **kwargs: Extra keyword arguments passed to `single_generate` (model, temp, top_p, ...).
+
+    Returns:
+        List[str]: A list of responses, in the order of the inputs. With n > 1, every response is a list of
+        n samples. Failed inputs get None.
+    """
+    if n == 1 or native_n:
+        # The prompt is sent once and n outputs are generated
+        costs = estimate_costs(inputs, EXPECTED_OUTPUT_TOKENS * n)
+    else:
+        costs = [cost * n for cost in estimate_costs(inputs)]
+    order = schedule_order(costs, num_workers, schedule)
+    responses = [None] * len(inputs)
+
+    # Caches that support it (e.g. the shared cache service) fetch the entries of the whole run at once
+    prefetch = getattr(single_generate, "prefetch", None)
+    if prefetch is not None:
+        prefetch([call for input_dict in key_inputs(inputs, order) for call in sample_calls(input_dict, n, native_n, kwargs)])
+    durations = {}
+    failures = {}
+
+    def generate_samples(i):
+        # The prompt is only built here, when the request is dispatched, and released once it is answered
+        input_dict = inputs[i]
+        samples = [single_generate(*args, **call_kwargs) for args, call_kwargs in sample_calls(input_dict, n, native_n, kwargs)]
+        return samples if n > 1 and not native_n else samples[0]
+
+    def timed_generate(i):
+        if limiter is None:
+            start = time.monotonic()
+            response = generate_samples(i)
+        else:
+            with limiter:
+                start = time.monotonic()
+                response = generate_samples(i)
+        durations[i] = time.monotonic() - start
+        return response
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        # The executor starts queued jobs in submission order, so submitting in `order` is the schedule.
+        # Every request runs in the context of the caller, e.g. with the retry budget of its run
+        futures = {executor.submit(contextvars.copy_context().run, timed_generate, i): i for i in order}
+        try:
+            for future in tqdm.tqdm(
+                as_completed(futures),
+                total=len(futures),
+                disable=mute_tqdm,
+                desc=desc,
+                leave=False,
+            ):
+                i = futures[future]
+                error = None
+                try:
+                    responses[i] = future.result()
+                except Exception as e:
+                    if classify_exception(e) == "programming":
+                        raise
+                    error = error_record(e)
+                    failures[error["type"]] = failures.get(error["type"], 0) + 1
+                if callback is not None:
+                    callback(i, responses[i], error)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    actual_makespan = time.monotonic() - start
+
+    if failures:
+        print(f"{desc}: {sum(failures.values())} of {len(inputs)} requests failed: {failures}.")
+
+    if num_workers > 1 and durations and not mute_tqdm:
+        # Calibrate the cost unit (tokens) into seconds with the requests that were actually timed
+        seconds_per_token = sum(durations.values()) / sum(costs[i] for i in durations)
+        predicted = simulate_makespan([costs[i] for i in order], num_workers) * seconds_per_token
+        fifo = simulate_makespan(costs, num_workers) * seconds_per_token
+        print(
+            f"{desc}: predicted makespan {predicted:.1f}s (input order: {fifo:.1f}s), "
+            f"actual makespan {actual_makespan:.1f}s with {num_workers} workers."
+        )
+
+    return responses
+
+
+def generate_cached(
+    single_generate,
+    inputs,
+    desc="Offline inference",
+    mute_tqdm=False,
+    callback=None,
+    n=1,
+    native_n=False,
+    **kwargs,
+):
+    """
+    Serve the response of every input from the cache of `single_generate`, without sending any request.
+
+    Args:
+        single_generate (Callable): The cached backend function, see `generate_all`. Its `lookup` is used.
+        inputs (List[Dict[str, Any]]): A list of input dictionaries containing 'system_prompt' and 'user_message'.
+        desc (str, optional): The description of the progress bar. Defaults to "Offline inference".
+        mute_tqdm (bool, optional): Whether to disable the tqdm progress bar. Defaults to False.
+        callback (Callable[[int, str, Dict], None], optional): Called with (index, response, None) for every input,
+            once all of them are found. Defaults to None.
+        n (int, optional): The number of samples per input. Defaults to 1.
+        native_n (bool, optional): See `generate_all`. Defaults to False.
+        **kwargs: Extra keyword arguments of `single_generate` (model, temp, top_p, ...). Those that only
+            matter when sending requests (num_workers, schedule, limiter) are ignored.
+
+    Returns:
+        List[str]: A list of responses, in the order of the inputs, as returned by `generate_all`.
+
+    Raises:
+        CacheMissError: If any response is not cached; its `misses` are the indices of those inputs.
+    """
+    for name in ("num_workers", "schedule", "limiter"):
+        kwargs.pop(name, None)
+
+    prefetch = getattr(single_generate, "prefetch", None)
+    if prefetch is not None:
+        order = range(len(inputs))
+        prefetch([call for input_dict in key_inputs(inputs, order) for call in sample_calls(input_dict, n, native_n, kwargs)])
+
+    responses = [None] * len(inputs)
+    misses = []
+    for i in tqdm.tqdm(range(len(inputs)), disable=mute_tqdm, desc=desc, leave=False):
+        try:
+            samples = [
+                single_generate.lookup(*args, **call_kwargs)
+                for args, call_kwargs in sample_calls(inputs[i], n, native_n, kwargs)
+            ]
+        except CacheMiss:
+            misses.append(i)
+            continue
+        responses[i] = samples if n > 1 and not native_n else samples[0]
+    if misses:
+        raise CacheMissError(misses, desc)
+
+    if callback is not None:
+        for i, response in enumerate(responses):
+            callback(i, response, None)
+    return responses
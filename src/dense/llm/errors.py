@@ -0,0 +1,265 @@
+"""
+Module: errors
+
+Classification of the exceptions raised by the backends, and the retry policy built on it.
+
+Every exception is mapped to an error class. Retryable classes (rate limits, timeouts,
+connection and server errors) are retried with exponential backoff, each with its own
+attempt budget; terminal classes (context length, authentication, content filter, other
+bad requests) are not retried at all, and neither are programming errors. On top of the
+per-class budgets, the time spent waiting between retries is capped for the whole run
+(LLM_RETRY_TIME_BUDGET seconds, 1800 by default), so a bad batch fails in seconds
+instead of backing off for hours. Runs sharing a process (the cells of a sweep) each get
+a budget of their own with `retry_budget_scope`, so early cells cannot spend the
+retries of later ones.
+
+An exception is classified by the error code or type the provider returned (e.g.
+OpenAI's "context_length_exceeded", Zhipu's "1301") first, then by its HTTP status and
+exception class. Only client errors (4xx, or no status) without a known code are
+matched on phrases of their message, and those phrases are specific to one class.
+"""
+
+import os
+import re
+import threading
+import contextlib
+import contextvars
+
+from tenacity import retry, retry_if_exception, wait_exponential
+
+# Maximum number of attempts (including the first one) for every retryable error class
+RETRY_BUDGETS = {
+    "rate_limit": 8,
+    "timeout": 4,
+    "connection": 6,
+    "server": 5,
+    "unknown": 3,
+}
+
+# Error classes that are never retried: the same request would fail again
+TERMINAL_ERRORS = ("context_length", "auth", "content_filter", "bad_request")
+
+# Errors raised by our own code rather than by the provider: never retried, never recorded
+PROGRAMMING_ERRORS = (TypeError, KeyError, AttributeError, NameError, IndexError, AssertionError, NotImplementedError)
+
+# Error codes and types returned by the providers (OpenAI and OpenAI-compatible APIs, Azure, DashScope, Zhipu)
+ERROR_CODES = {
+    "context_length_exceeded": "context_length",
+    "string_above_max_length": "context_length",
+    "1261": "context_length",  # Zhipu: prompt too long
+    "content_filter": "content_filter",
+    "content_policy_violation": "content_filter",
+    "data_inspection_failed": "content_filter",  # DashScope
+    "1301": "content_filter",  # Zhipu: unsafe or sensitive content
+    "rate_limit_exceeded": "rate_limit",
+    "1302": "rate_limit",  # Zhipu: too many concurrent requests
+    "1303": "rate_limit",  # Zhipu: too many requests
+    "1305": "rate_limit",  # Zhipu: traffic limit
+    "insufficient_quota": "auth",
+    "invalid_api_key": "auth",
+    "1113": "auth",  # Zhipu: account in arrears
+    "server_error": "server",
+}
+
+_CONTEXT_LENGTH_HINTS = (
+    "maximum context length",
+    "context length exceeded",
+    "context_length_exceeded",
+    "prompt is too long",
+    "input is too long",
+    "exceeds the maximum number of tokens",
+    "reduce the length of the messages",
+    "range of input length",
+)
+_CONTENT_FILTER_HINTS = (
+    "content management policy",
+    "content_filter",
+    "content filtering policy",
+    "violating our usage policy",
+    "data_inspection_failed",
+    "inappropriate content",
+)
+_ERROR_CODE = re.compile(r'"code"\s*:\s*"?([\w.-]+)')
+
+
+def provider_error_code(exception):
+    """
+    Return the error code (or else the error type) a provider returned with an exception, or None.
+
+    The OpenAI client exposes them as attributes of the exception and in its `body`; other clients (e.g. zhipuai)
+    only include the JSON body of the response in the message.
+    """
+    body = getattr(exception, "body", None)
+    if isinstance(body, dict) and isinstance(body.get("error"), dict):
+        body = body["error"]
+    body = body if isinstance(body, dict) else {}
+    for value in (getattr(exception, "code", None), body.get("code"), getattr(exception, "type", None), body.get("type")):
+        if value is not None and str(value).lower() in ERROR_CODES:
+            return str(value).lower()
+    match = _ERROR_CODE.search(str(exception))
+    if match is not None and match.group(1).lower() in ERROR_CODES:
+        return match.group(1).lower()
+    return None
+
+
+def classify_exception(exception):
+    """
+    Map an exception raised while generating a response to an error class.
+
+    Args:
+        exception (BaseException): The exception.
+
+    Returns:
+        str: One of the keys of RETRY_BUDGETS, one of TERMINAL_ERRORS, or "programming".
+    """
+    if isinstance(exception, PROGRAMMING_ERRORS):
+        return "programming"
+
+    code = provider_error_code(exception)
+    if code is not None:
+        return ERROR_CODES[code]
+
+    name = type(exception).__name__
+    message = str(exception).lower()
+    status_code = getattr(exception, "status_code", None)
+
+    if status_code == 429 or "RateLimit" in name or "ReachLimit" in name or "FlowExceed" in name:
+        return "rate_limit"
+    if status_code in (401, 403) or "Authentication" in name or "PermissionDenied" in name:
+        return "auth"
+    if not isinstance(status_code, int) or 400 <= status_code < 500:
+        if any(hint in message for hint in _CONTEXT_LENGTH_HINTS):
+            return "context_length"
+        if any(hint in message for hint in _CONTENT_FILTER_HINTS):
+            return "content_filter"
+    if "Timeout" in name or isinstance(exception, TimeoutError):
+        return "timeout"
+    if "Connection" in name or isinstance(exception, ConnectionError):
+        return "connection"
+    if isinstance(status_code, int) and status_code >= 500 or "InternalServer" in name or "InternalError" in name:
+        return "server"
+    if isinstance(status_code, int) and 400 <= status_code < 500 or "BadRequest" in name or "RequestFailed" in name:
+        return "bad_request"
+    return "unknown"
+
+
+class CacheMissError(RuntimeError):
+    """
+    Raised by offline runs (see engine.generate_cached) when some responses are not cached.
+    `misses` lists all of them, e.g. their input indices or instance ids.
+    """
+
+    def __init__(self, misses, desc="Offline inference"):
+        self.misses = list(misses)
+        self.desc = desc
+        super().__init__(
+            f"{desc}: {len(self.misses)} responses are not cached and cannot be generated offline: "
+            + ", ".join(str(miss) for miss in self.misses)
+        )
+
+
+def is_retryable(exception):
+    return classify_exception(exception) in RETRY_BUDGETS
+
+
+def error_record(exception):
+    """
+    Describe a failed generation as a JSON-serializable dictionary, to be stored in the results.
+    """
+    error_class = classify_exception(exception)
+    return {
+        "type": error_class,
+        "retryable": error_class in RETRY_BUDGETS,
+        "exception": type(exception).__name__,
+        "message": str(exception)[:1000],
+    }
+
+
+class RetryTimeBudget:
+    """
+    The total time the retries of a run may spend waiting, shared by all backends and threads.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def reset(self, seconds=None):
+        with self._lock:
+            if seconds is not None:
+                self.seconds = seconds
+            self.spent = 0.0
+
+    def consume(self, seconds):
+        with self._lock:
+            self.spent += seconds
+
+    def exhausted(self):
+        return self.spent >= self.seconds
+
+
+retry_time_budget = RetryTimeBudget(float(os.environ.get("LLM_RETRY_TIME_BUDGET", 1800)))
+
+# The budget of the current run, when it has its own (see retry_budget_scope)
+_scoped_budget = contextvars.ContextVar("retry_time_budget", default=None)
+
+
+def active_retry_budget():
+    """
+    Return the retry time budget of the current run: that of the enclosing `retry_budget_scope`, or the process-wide one.
+    """
+    return _scoped_budget.get() or retry_time_budget
+
+
+@contextlib.contextmanager
+def retry_budget_scope(seconds=None):
+    """
+    Give the requests sent within the block (and by the threads of engine.generate_all) a retry time budget of their own.
+
+    Args:
+        seconds (float, optional): The budget. Defaults to that of the process-wide `retry_time_budget`.
+
+    Yields:
+        RetryTimeBudget: The budget of the block.
+    """
+    budget = RetryTimeBudget(retry_time_budget.seconds if seconds is None else seconds)
+    token = _scoped_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _scoped_budget.reset(token)
+
+
+def stop_by_error_class(retry_state):
+    """
+    tenacity stop condition: stop once the budget of the error class (or of the run) is spent.
+    """
+    error_class = classify_exception(retry_state.outcome.exception())
+    max_attempts = RETRY_BUDGETS.get(error_class, 1)
+    return retry_state.attempt_number >= max_attempts or active_retry_budget().exhausted()
+
+
+def retry_callback(retry_state):
+    """
+    Callback function during retries to notify the user about the retry attempt and exception information.
+    """
+    exception = retry_state.outcome.exception()
+    error_class = classify_exception(exception)
+    active_retry_budget().consume(retry_state.next_action.sleep)
+    print(
+        f"Retrying {retry_state.fn.__name__} due to {error_class} error: {exception}."
+    )
+    print(
+        f"Attempt {retry_state.attempt_number} of {RETRY_BUDGETS[error_class]}."
+    )
+
+
+# Retry policy shared by the backends
+llm_retry = retry(
+    reraise=True,  # Re-raise the last exception if the retry attempts are exhausted
+    stop=stop_by_error_class,  # Stop once the budget of the error class or of the run is exhausted
+    wait=wait_exponential(min=2, max=32),  # Exponential backoff strategy with wait times between 2 to 32 seconds
+    retry=retry_if_exception(is_retryable),  # Only retry on retryable error classes
+    before_sleep=retry_callback,  # Callback function to call before each retry
+)
@@ -1,48 +1,29 @@
-import os
-import tqdm
 from openai import OpenAI
-from joblib import Memory
+from dense.storage import open_cache
 from dotenv import load_dotenv
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
-)
+from .pool import ClientPool, offline_mode
+from .engine import generate_all
+from .errors import llm_retry
 
-# Load API keys from the environment variable file
-load_dotenv('.env')
+# Load API keys from the environment variable file (offline runs need no key)
+if not offline_mode():
+    load_dotenv('.env')
 
 # Set up caching
-memory = Memory(location=".cache", verbose=0)
+memory = open_cache(location=".cache")
 
-# Initialize the OpenAI client using the API key for the gpt-4o-mini model
-client = OpenAI(api_key=os.environ.get("YOUR_OPENAI_API_KEY"), base_url=os.environ.get("YOUR_OPENAI_BASE_URL"))
+# Initialize the pool of OpenAI clients using the API key(s) for the gpt-4o-mini model;
+# offline runs (LLM_OFFLINE=1) serve every response from the cache and create none
+client = None if offline_mode() else ClientPool.from_env(OpenAI, "YOUR_OPENAI_API_KEY", "YOUR_OPENAI_BASE_URL")
 
-def retry_callback(retry_state):
-    """
-    Callback function during retries to notify the user about the retry attempt and exception information.
-    """
-    print(
-        f"Retrying {retry_state.fn.__name__} due to {retry_state.outcome.exception()}."
-    )
-    print(
-        f"Attempt {retry_state.attempt_number} of {retry_state.retry_object.stop.max_attempt_number}."
-    )
-
-@retry(
-    reraise=True,  # Re-raise the last exception if the retry attempts are exhausted
-    stop=stop_after_attempt(8),  # Retry a maximum of 8 times
-    wait=wait_exponential(min=2, max=32),  # Exponential backoff strategy with wait times between 2 to 32 seconds
-    retry=retry_if_exception_type(Exception),  # Retry on any type of exception
-    before_sleep=retry_callback,  # Callback function to call before each retry
-)
+@llm_retry  # Retry retryable errors within their budgets, fail fast on terminal ones
 @memory.cache  # Cache the function results to avoid redundant API calls
 def gpt_single_generate(
     input_dict,
     model="gpt-4o-mini",
     temp=0.0,
     top_p=0.9,
+    n=1,
 ):
     """
     Generate a single response using the gpt-4o-mini model.
@@ -52,9 +33,10 @@ def gpt_single_generate(
         model (str, optional): The name of the model to use. Defaults to "gpt-4o-mini".
         temp (float, optional): The temperature for generation. Defaults to 0.0.
         top_p (float, optional): The nucleus sampling parameter. Defaults to 0.9.
+        n (int, optional): The number of samples generated by the request. Defaults to 1.
 
     Returns:
-        str: The response generated by the model.
+        str: The response generated by the model, or the list of n responses when n > 1.
     """
     chat_completion = client.chat.completions.create(
         messages=[
@@ -69,9 +51,12 @@ def gpt_single_generate(
         ],
         model=model,
         temperature=temp,
-        top_p=top_p
+        top_p=top_p,
+        n=n,
     )
-    return chat_completion.choices[0].message.content
+    if n == 1:
+        return chat_completion.choices[0].message.content
+    return [choice.message.content for choice in chat_completion.choices]
 
 def gpt_generate(
     inputs,
@@ -79,6 +64,11 @@ def gpt_generate(
     temp=0.0,
     top_p=0.9,
     mute_tqdm=False,
+    callback=None,
+    num_workers=1,
+    schedule="auto",
+    n=1,
+    limiter=None,
 ):
     """
     Generate responses from gpt-4o-mini for a set of inputs.
@@ -92,27 +82,30 @@ def gpt_generate(
         temp (float, optional): The temperature for generation. Defaults to 0.0.
         top_p (float, optional): The nucleus sampling parameter. Defaults to 0.9.
         mute_tqdm (bool, optional): Whether to disable the tqdm progress bar. Defaults to False.
+        callback (Callable[[int, str, Dict], None], optional): Called with (index, response, error) as soon as each input is done. Defaults to None.
+        num_workers (int, optional): The number of requests in flight at the same time. Defaults to 1.
+        schedule (str, optional): The dispatch order: "fifo", "longest_first" or "auto" (longest first when num_workers > 1). Defaults to "auto".
+        n (int, optional): The number of samples per input. Defaults to 1.
+        limiter (threading.Semaphore, optional): Held during every request to cap the requests in flight to the provider. Defaults to None.
 
     Returns:
-        List[str]: A list of responses generated by the model.
+        List[str]: A list of responses generated by the model (lists of n responses when n > 1, None for the requests that failed).
     """
-    responses = []
-
-    for input_dict in tqdm.tqdm(
+    return generate_all(
+        gpt_single_generate,
         inputs,
-        disable=mute_tqdm,
         desc=f"Inference {model}",
-        leave=False,
-    ):
-        response = gpt_single_generate(
-            input_dict,
-            model=model,
-            temp=temp,
-            top_p=top_p,
-        )
-        responses.append(response)
-
-    return responses
+        mute_tqdm=mute_tqdm,
+        callback=callback,
+        num_workers=num_workers,
+        schedule=schedule,
+        n=n,
+        native_n=True,
+        limiter=limiter,
+        model=model,
+        temp=temp,
+        top_p=top_p,
+    )
 
 
 if __name__ == "__main__":
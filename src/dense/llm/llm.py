@@ -1,15 +1,49 @@
+from .pool import offline_mode
+from .engine import generate_cached
+
 # new api interfaces for commercial models
-from .claude3haiku import claude_generate
-from .gpt4omini import gpt_generate
-from .glm import glm_generate
-from .gemini import gemini_generate
-from .deepseek import deepseek_generate
+from .claude3haiku import claude_generate, claude_single_generate
+from .gpt4omini import gpt_generate, gpt_single_generate
+from .glm import glm_generate, glm_single_generate
+from .gemini import gemini_generate, gemini_single_generate
+from .deepseek import deepseek_generate, deepseek_single_generate
 
 
 # new api interfaces for open-source models
-from .qwen import qwen_generate
-from .llama import llama3_generate
-from .wizard import wizard_generate
+from .qwen import qwen_generate, qwen_single_generate
+from .llama import llama3_generate, llama3_single_generate
+from .wizard import wizard_generate, wizard_single_generate
+
+# Provider (API account) serving each model, used to cap the requests in flight per provider
+PROVIDERS = {
+    "claude": "openai",
+    "gpt": "openai",
+    "gemini": "openai",
+    "glm": "zhipuai",
+    "deepseek": "deepseek",
+    "qwen_7b": "bailian",
+    "qwen_14b": "bailian",
+    "qwen_32b": "bailian",
+    "qwen_72b": "bailian",
+    "llama_70b": "deepinfra",
+    "wizard": "deepinfra",
+}
+
+# Function generating a single response of each model, the model name it is called with, and whether it
+# draws n samples natively (see engine.generate_all); used to rebuild the cache keys of past calls
+SINGLE_GENERATE = {
+    "claude": (claude_single_generate, "claude-3-haiku-20240307", False),
+    "gpt": (gpt_single_generate, "gpt-4o-mini", True),
+    "gemini": (gemini_single_generate, "gemini-1.5-flash", False),
+    "glm": (glm_single_generate, "glm-4-air", False),
+    "deepseek": (deepseek_single_generate, "deepseek-chat", False),
+    "qwen_7b": (qwen_single_generate, "qwen2.5-7b-instruct", False),
+    "qwen_14b": (qwen_single_generate, "qwen2.5-14b-instruct", False),
+    "qwen_32b": (qwen_single_generate, "qwen2.5-32b-instruct", False),
+    "qwen_72b": (qwen_single_generate, "qwen2.5-72b-instruct", False),
+    "llama_70b": (llama3_single_generate, "meta-llama/Meta-Llama-3.1-70B-Instruct", True),
+    "wizard": (wizard_single_generate, "microsoft/WizardLM-2-8x22B", True),
+}
 
 def llm_generate(
     inputs,
@@ -17,26 +51,42 @@ def llm_generate(
     temp=0.0,
     top_p=0.9,
     mute_tqdm=False,
+    offline=False,
+    **kwargs,
 ):
+    if offline or offline_mode():
+        # Serve every response from the cache, failing with the list of all misses (see engine.generate_cached)
+        single_generate, model_name, native_n = SINGLE_GENERATE[model]
+        return generate_cached(
+            single_generate,
+            inputs,
+            desc=f"Offline inference {model_name}",
+            mute_tqdm=mute_tqdm,
+            native_n=native_n,
+            model=model_name,
+            temp=temp,
+            top_p=top_p,
+            **kwargs,
+        )
     if model == "claude":
-        return claude_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return claude_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "gpt":
-        return gpt_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return gpt_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "glm":
-        return glm_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return glm_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "gemini":
-        return gemini_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return gemini_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "deepseek":
-        return deepseek_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return deepseek_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "qwen_7b":
-        return qwen_generate(inputs, model="qwen2.5-7b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return qwen_generate(inputs, model="qwen2.5-7b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "qwen_14b":
-        return qwen_generate(inputs, model="qwen2.5-14b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return qwen_generate(inputs, model="qwen2.5-14b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "qwen_32b":
-        return qwen_generate(inputs, model="qwen2.5-32b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return qwen_generate(inputs, model="qwen2.5-32b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "qwen_72b":
-        return qwen_generate(inputs, model="qwen2.5-72b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return qwen_generate(inputs, model="qwen2.5-72b-instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "llama_70b":
-        return llama3_generate(inputs, model="meta-llama/Meta-Llama-3.1-70B-Instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
+        return llama3_generate(inputs, model="meta-llama/Meta-Llama-3.1-70B-Instruct", temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
     elif model == "wizard":
-        return wizard_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm)
\ No newline at end of file
+        return wizard_generate(inputs, temp=temp, top_p=top_p, mute_tqdm=mute_tqdm, **kwargs)
\ No newline at end of file
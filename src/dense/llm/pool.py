@@ -0,0 +1,256 @@
+"""
+Module: ClientPool
+
+A pool of API clients for a single model. Each entry is one (base_url, api_key)
+pair, so a model can be served by several accounts or deployments at once.
+
+The pool is configured from the same environment variables the backends already
+read. Any of them may hold a comma-separated list:
+
+    YOUR_OPENAI_API_KEY="sk-a,sk-b,sk-c"
+    YOUR_OPENAI_BASE_URL="https://api.example.com/v1"      # shared by all keys
+    YOUR_OPENAI_API_KEY_WEIGHTS="2,1,1"                     # optional
+
+A single base URL is shared by every key and a single key is shared by every base
+URL; otherwise both lists must have the same length. A weight of 0 disables an
+endpoint (it gets no request) without removing its key. The balancing strategy is
+read from LLM_POOL_STRATEGY ("least_outstanding" by default, or "weighted").
+
+A pool can be used in place of a single client: every method call made through it,
+e.g. `pool.chat.completions.create(...)`, is routed to one endpoint of the pool.
+
+With LLM_OFFLINE=1 (see `offline_mode`), the backends build no pool at all: every
+response is served from the cache and no API key is needed.
+"""
+
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+STRATEGIES = ("least_outstanding", "weighted")
+
+
+def offline_mode():
+    """
+    Check whether LLM_OFFLINE is set: no client is created and no request is sent, every response comes from the cache.
+    """
+    return os.environ.get("LLM_OFFLINE", "").strip().lower() not in ("", "0", "false", "no")
+
+
+def _split_env(name):
+    """
+    Read a comma-separated environment variable into a list of stripped, non-empty items.
+    """
+    if name is None:
+        return []
+    value = os.environ.get(name, "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _is_rate_limit(exception):
+    """
+    Check whether an exception raised by a client is a rate-limit (HTTP 429) error.
+    """
+    if getattr(exception, "status_code", None) == 429:
+        return True
+    return type(exception).__name__ == "RateLimitError"
+
+
+def _retry_after(exception):
+    """
+    Read the Retry-After header (in seconds) from a rate-limit error, if the server sent one.
+    """
+    response = getattr(exception, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Endpoint:
+    """
+    One (base_url, api_key) pair of a pool, together with its load and rate-limit state.
+    """
+
+    def __init__(self, client, base_url=None, weight=1.0, name=None):
+        self.client = client
+        self.base_url = base_url
+        self.weight = weight
+        self.name = name or base_url or "default"
+        self.outstanding = 0  # Requests currently in flight on this endpoint
+        self.num_requests = 0
+        self.num_rate_limited = 0
+        self.consecutive_rate_limits = 0
+        self.cooldown_until = 0.0  # Monotonic time until which the endpoint is skipped
+
+    def is_available(self, now):
+        return now >= self.cooldown_until
+
+
+class _PooledAttribute:
+    """
+    Attribute path on a pooled client (e.g. `chat.completions.create`), resolved on a
+    borrowed client only when it is called.
+    """
+
+    def __init__(self, pool, path):
+        self._pool = pool
+        self._path = path
+
+    def __getattr__(self, name):
+        return _PooledAttribute(self._pool, self._path + (name,))
+
+    def __call__(self, *args, **kwargs):
+        with self._pool.client() as client:
+            target = client
+            for name in self._path:
+                target = getattr(target, name)
+            return target(*args, **kwargs)
+
+
+class ClientPool:
+    """
+    Balance requests for one model across several endpoints.
+
+    Two strategies are supported:
+        - "least_outstanding": pick the endpoint with the fewest in-flight requests per unit of weight.
+        - "weighted": pick an endpoint at random, proportionally to its weight.
+
+    Endpoints that return a rate-limit error are put on cooldown (honouring Retry-After when the
+    server sends it, otherwise with a per-endpoint exponential backoff) and skipped until it expires.
+    """
+
+    def __init__(self, endpoints, strategy="least_outstanding", base_cooldown=2.0, max_cooldown=60.0):
+        assert all(e.weight >= 0 for e in endpoints), "The weights of the endpoints should be non-negative."
+        assert strategy in STRATEGIES, f"Unknown pool strategy {strategy}, expected one of {STRATEGIES}."
+        # Endpoints of weight 0 are disabled
+        self.endpoints = [e for e in endpoints if e.weight > 0]
+        assert len(self.endpoints) > 0, "A client pool needs at least one endpoint with a positive weight."
+        self.strategy = strategy
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, client_cls, key_var, base_var=None, strategy=None):
+        """
+        Build a pool from (possibly comma-separated) environment variables.
+
+        Args:
+            client_cls (type): The client class to instantiate, e.g. openai.OpenAI.
+            key_var (str): The environment variable holding the API key(s).
+            base_var (str, optional): The environment variable holding the base URL(s). Clients that
+                take no base URL (e.g. ZhipuAI) should leave this as None.
+            strategy (str, optional): The balancing strategy. Defaults to LLM_POOL_STRATEGY or "least_outstanding".
+
+        Returns:
+            ClientPool: The pool of clients.
+        """
+        keys = _split_env(key_var) or [None]
+        bases = _split_env(base_var) or [None]
+        if len(keys) == 1:
+            keys = keys * len(bases)
+        if len(bases) == 1:
+            bases = bases * len(keys)
+        if len(keys) != len(bases):
+            raise ValueError(
+                f"{key_var} has {len(keys)} entries but {base_var} has {len(bases)}; "
+                "use one shared value or the same number of entries."
+            )
+
+        weights = [float(w) for w in _split_env(f"{key_var}_WEIGHTS")] or [1.0] * len(keys)
+        if len(weights) != len(keys):
+            raise ValueError(f"{key_var}_WEIGHTS has {len(weights)} entries but there are {len(keys)} endpoints.")
+
+        endpoints = []
+        for i, (key, base, weight) in enumerate(zip(keys, bases, weights)):
+            kwargs = {"api_key": key}
+            if base_var is not None:
+                kwargs["base_url"] = base
+            endpoints.append(Endpoint(client_cls(**kwargs), base_url=base, weight=weight, name=f"{key_var}[{i}]"))
+
+        strategy = strategy or os.environ.get("LLM_POOL_STRATEGY", "least_outstanding")
+        return cls(endpoints, strategy=strategy)
+
+    def _pick(self, candidates):
+        if self.strategy == "weighted":
+            return random.choices(candidates, weights=[e.weight for e in candidates], k=1)[0]
+        return min(candidates, key=lambda e: (e.outstanding / e.weight, e.num_requests / e.weight))
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [e for e in self.endpoints if e.is_available(now)]
+                if candidates:
+                    endpoint = self._pick(candidates)
+                    endpoint.outstanding += 1
+                    endpoint.num_requests += 1
+                    return endpoint
+                wait = min(e.cooldown_until for e in self.endpoints) - now
+            # Every endpoint is rate limited: wait for the first one to cool down
+            time.sleep(max(wait, 0.0))
+
+    def _release(self, endpoint, exception=None):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if exception is not None and _is_rate_limit(exception):
+                endpoint.num_rate_limited += 1
+                endpoint.consecutive_rate_limits += 1
+                cooldown = _retry_after(exception)
+                if cooldown is None:
+                    cooldown = min(self.base_cooldown * 2 ** (endpoint.consecutive_rate_limits - 1), self.max_cooldown)
+                endpoint.cooldown_until = time.monotonic() + cooldown
+            elif exception is None:
+                endpoint.consecutive_rate_limits = 0
+
+    @contextmanager
+    def client(self):
+        """
+        Borrow a client for the duration of one request.
+
+        Usage:
+            with pool.client() as client:
+                client.chat.completions.create(...)
+        """
+        endpoint = self._acquire()
+        error = None
+        try:
+            yield endpoint.client
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Also on KeyboardInterrupt or cancellation, so the slot is never leaked
+            self._release(endpoint, error)
+
+    def __getattr__(self, name):
+        # Only reached for attributes the pool does not define itself, i.e. the client API
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _PooledAttribute(self, (name,))
+
+    def stats(self):
+        """
+        Return the request and rate-limit counters of every endpoint.
+
+        Returns:
+            List[Dict[str, Any]]: One dictionary per endpoint.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "name": e.name,
+                    "base_url": e.base_url,
+                    "weight": e.weight,
+                    "outstanding": e.outstanding,
+                    "requests": e.num_requests,
+                    "rate_limited": e.num_rate_limited,
+                    "cooldown_remaining": max(e.cooldown_until - now, 0.0),
+                }
+                for e in self.endpoints
+            ]
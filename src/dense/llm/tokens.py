@@ -0,0 +1,176 @@
+"""
+Module: tokens
+
+Token counting with the tokenizer of each model, and the context window of each model.
+
+Tokenizers are loaded lazily and cached. tiktoken and transformers are optional:
+when the library a model needs is not installed (or the tokenizer cannot be
+downloaded), counts fall back to a characters-per-token estimate and a warning
+is printed once per model. Counts with the proxy tokenizer of a model that does not
+publish its own are estimates too. Offline (LLM_OFFLINE=1), transformers tokenizers are only
+loaded from the local Hugging Face cache.
+"""
+
+import warnings
+from functools import lru_cache
+
+from .pool import offline_mode
+from .engine import CHARS_PER_TOKEN
+
+# Context window (prompt + output tokens) of every model key accepted by llm_generate
+CONTEXT_WINDOWS = {
+    "claude": 200000,
+    "gpt": 128000,
+    "glm": 128000,
+    "gemini": 1048576,
+    "deepseek": 64000,
+    "qwen_7b": 131072,
+    "qwen_14b": 131072,
+    "qwen_32b": 131072,
+    "qwen_72b": 131072,
+    "llama_70b": 131072,
+    "wizard": 65536,
+}
+
+# Tokenizer of every model key, as (library, name, exact). Claude and Gemini do not publish
+# their tokenizers, so an OpenAI encoding is used as a proxy: their counts are estimates.
+TOKENIZERS = {
+    "claude": ("tiktoken", "cl100k_base", False),
+    "gpt": ("tiktoken", "o200k_base", True),
+    "glm": ("transformers", "THUDM/glm-4-9b-chat", True),
+    "gemini": ("tiktoken", "o200k_base", False),
+    "deepseek": ("transformers", "deepseek-ai/DeepSeek-V2.5", True),
+    "qwen_7b": ("transformers", "Qwen/Qwen2.5-7B-Instruct", True),
+    "qwen_14b": ("transformers", "Qwen/Qwen2.5-14B-Instruct", True),
+    "qwen_32b": ("transformers", "Qwen/Qwen2.5-32B-Instruct", True),
+    "qwen_72b": ("transformers", "Qwen/Qwen2.5-72B-Instruct", True),
+    "llama_70b": ("transformers", "meta-llama/Meta-Llama-3.1-70B-Instruct", True),
+    "wizard": ("transformers", "alpindale/WizardLM-2-8x22B", True),
+}
+
+# Tokens added by the chat template around each message
+MESSAGE_OVERHEAD_TOKENS = 8
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(model):
+    """
+    Load the tokenizer of a model key.
+
+    Args:
+        model (str): The model key, e.g. "gpt" or "qwen_7b".
+
+    Returns:
+        Tuple[str, Any] or None: The library ("tiktoken" or "transformers") and the tokenizer, or None if the
+        tokenizer is not available.
+    """
+    library, name, _ = TOKENIZERS.get(model, (None, None, False))
+    try:
+        if library == "tiktoken":
+            import tiktoken
+
+            return library, tiktoken.get_encoding(name)
+        if library == "transformers":
+            from transformers import AutoTokenizer
+
+            return library, AutoTokenizer.from_pretrained(name, trust_remote_code=True, local_files_only=offline_mode())
+    except Exception as e:
+        warnings.warn(f"Tokenizer {name} for {model} is not available ({e}); estimating token counts.")
+        return None
+    warnings.warn(f"No tokenizer registered for {model}; estimating token counts.")
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model):
+    """
+    Return a function counting the tokens of a string with the tokenizer of a model key.
+
+    Args:
+        model (str): The model key, e.g. "gpt" or "qwen_7b".
+
+    Returns:
+        Callable[[str], int] or None: A function counting the tokens of a string, or None if the
+        tokenizer is not available.
+    """
+    loaded = load_tokenizer(model)
+    if loaded is None:
+        return None
+    library, tokenizer = loaded
+    if library == "tiktoken":
+        return lambda text: len(tokenizer.encode(text, disallowed_special=()))
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def token_starts(text, model):
+    """
+    Tokenize a string and return the character offset at which every token starts.
+
+    Args:
+        text (str): The text to tokenize.
+        model (str): The model key.
+
+    Returns:
+        Tuple[List[int], bool]: The offsets, and whether they are estimated: those of a proxy tokenizer, or every
+        CHARS_PER_TOKEN characters because the tokenizer is not available or cannot report offsets (slow
+        transformers tokenizers).
+    """
+    loaded = load_tokenizer(model)
+    if loaded is not None:
+        library, tokenizer = loaded
+        estimated = not exact_tokenizer(model)
+        if library == "tiktoken":
+            return tokenizer.decode_with_offsets(tokenizer.encode(text, disallowed_special=()))[1], estimated
+        if getattr(tokenizer, "is_fast", False):
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return [start for start, _ in encoding["offset_mapping"]], estimated
+    return list(range(0, len(text), CHARS_PER_TOKEN)), True
+
+
+def exact_tokenizer(model):
+    """
+    Check whether the tokenizer registered for a model key is its own, not a proxy.
+    """
+    return TOKENIZERS.get(model, (None, None, False))[2]
+
+
+def has_tokenizer(model):
+    """
+    Check whether the own tokenizer of a model key is available, i.e. whether its token counts are exact.
+    """
+    return exact_tokenizer(model) and get_tokenizer(model) is not None
+
+
+def count_tokens(text, model):
+    """
+    Count the tokens of a string with the tokenizer of a model key.
+
+    Args:
+        text (str): The text to tokenize.
+        model (str): The model key.
+
+    Returns:
+        int: The number of tokens (estimated if the tokenizer is not available or is a proxy).
+    """
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        return len(text) // CHARS_PER_TOKEN
+    return tokenizer(text)
+
+
+def count_prompt_tokens(input_dict, model):
+    """
+    Count the tokens of a chat request, including the chat template overhead of its two messages.
+
+    Args:
+        input_dict (Dict[str, str]): A dictionary containing 'system_prompt' and 'user_message'.
+        model (str): The model key.
+
+    Returns:
+        int: The number of prompt tokens.
+    """
+    return (
+        count_tokens(input_dict["system_prompt"], model)
+        + count_tokens(input_dict["user_message"], model)
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+    )
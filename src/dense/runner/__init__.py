@@ -0,0 +1 @@
+from .results import ResultLog, instance_id, load_results
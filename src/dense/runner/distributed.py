@@ -0,0 +1,176 @@
+"""
+Module: distributed
+
+Sweeps spread over several machines through a shared work queue (see queue.py).
+
+Every cell of a sweep spec is split into `num_shards` units, one per shard of its
+sampled instances (the shards of eval.py --shard, see shards.py). Workers lease units,
+generate the responses of their shard into its files in the cell's save_dir (which must
+be on storage shared by all workers, e.g. a network filesystem), and heartbeat while
+they work. The worker that completes the last shard of a cell merges the shards, scores
+the cell and writes its results.json.
+"""
+
+import os
+import socket
+import threading
+import traceback
+
+from dense.llm.llm import PROVIDERS
+from .sweep import PLACEMENTS, cell_record, expand_cells, pending_cells
+from .shards import merge_shards, run_shard
+from .pipeline import build_inputs, load_task_slice, results_exist, select_prompt
+
+
+def unit_id(cell, shard, num_shards):
+    return f"{cell['save_dir']}#{shard}-of-{num_shards}"
+
+
+def submit_sweep(queue, spec, num_shards=1):
+    """
+    Add a unit to the queue for every shard of every cell of a sweep spec that has no results.json yet.
+
+    Returns:
+        int: The number of units submitted.
+    """
+    options = {key: spec[key] for key in ("flush_every", "preflight", "temp", "n", "compress")}
+    options["num_workers"] = spec["default_provider_limit"]
+    units = {}
+    for cell in pending_cells(spec):
+        cell_options = dict(options, num_workers=spec["provider_limits"].get(PROVIDERS[cell["model"]], options["num_workers"]))
+        for shard in range(num_shards):
+            units[unit_id(cell, shard, num_shards)] = {
+                "cell": cell,
+                "shard": shard,
+                "num_shards": num_shards,
+                "options": cell_options,
+            }
+    queue.put(units)
+    return len(units)
+
+
+class Worker:
+    """
+    Lease units from a queue and run them until the queue is drained.
+    """
+
+    def __init__(self, queue, data_dir="data", worker_id=None, lease_seconds=300):
+        self.queue = queue
+        self.data_dir = data_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self._samples = {}
+
+    def _sample(self, cell):
+        # Each slice is streamed from its task file once per worker, and only its instances are kept
+        key = (cell["task"], cell["length_lower_bound"], cell["length_upper_bound"], cell["seed_num"])
+        if key not in self._samples:
+            self._samples[key] = load_task_slice(*key, data_dir=self.data_dir)
+        return self._samples[key]
+
+    def _inputs(self, cell, sampled_data):
+        return build_inputs(sampled_data, select_prompt(*PLACEMENTS[cell["placement"]]), cell["task"])
+
+    def run_unit(self, payload):
+        """
+        Generate the responses of one shard of a cell into its files in the cell's save_dir (see shards.run_shard).
+        """
+        cell, shard, num_shards, options = payload["cell"], payload["shard"], payload["num_shards"], payload["options"]
+        sampled_data = self._sample(cell)
+        # A unit may be leased again after a crash: always resume from what its shard log holds
+        run_shard(
+            sampled_data,
+            self._inputs(cell, sampled_data),
+            cell["model"],
+            cell["save_dir"],
+            shard,
+            num_shards,
+            resume=True,
+            flush_every=options["flush_every"],
+            preflight=options["preflight"],
+            cell=cell_record(cell),
+            n=options["n"],
+            temp=options["temp"],
+            num_workers=options["num_workers"],
+        )
+
+    def merge_cell(self, payload):
+        """
+        Merge the shards of a cell, score it and write its results.json (see shards.merge_shards).
+        """
+        cell, num_shards, options = payload["cell"], payload["num_shards"], payload["options"]
+        sampled_data = self._sample(cell)
+        merge_shards(
+            sampled_data,
+            self._inputs(cell, sampled_data),
+            cell["task"],
+            cell["save_dir"],
+            num_shards,
+            n=options["n"],
+            compress=options.get("compress"),
+        )
+
+    def _heartbeat(self, lease, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(lease, self.lease_seconds):
+                print(f"[{self.worker_id}] Lost the lease of {lease.unit_id}.")
+                return
+
+    def run(self, max_units=None):
+        """
+        Lease and run units until the queue has no pending unit left (or max_units were run).
+
+        Returns:
+            int: The number of units completed by this worker.
+        """
+        num_completed = 0
+        while max_units is None or num_completed < max_units:
+            lease = self.queue.lease(self.worker_id, self.lease_seconds)
+            if lease is None:
+                break
+            print(f"[{self.worker_id}] Running {lease.unit_id} (attempt {lease.attempts}).")
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(lease, stop), daemon=True)
+            heartbeat.start()
+            try:
+                self.run_unit(lease.payload)
+            except Exception:
+                self.queue.fail(lease, traceback.format_exc())
+                print(f"[{self.worker_id}] Failed {lease.unit_id}:\n{traceback.format_exc()}")
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            if self.queue.complete(lease):
+                num_completed += 1
+                self._maybe_merge(lease.payload)
+        return num_completed
+
+    def _maybe_merge(self, payload):
+        cell, num_shards = payload["cell"], payload["num_shards"]
+        siblings = [unit_id(cell, shard, num_shards) for shard in range(num_shards)]
+        # Exactly one worker merges a cell: the first to see all its shards done
+        if self.queue.is_done(siblings) and self.queue.claim(f"merge:{cell['save_dir']}"):
+            print(f"[{self.worker_id}] Merging {cell['save_dir']}.")
+            try:
+                self.merge_cell(payload)
+            except Exception:
+                # The shard logs are kept: the cell can be merged again with merge_done_cells
+                print(f"[{self.worker_id}] Failed to merge {cell['save_dir']}:\n{traceback.format_exc()}")
+
+    def merge_done_cells(self, spec, num_shards=1):
+        """
+        Merge every cell of a spec whose shards are all done but which has no results.json yet.
+
+        Returns:
+            int: The number of cells merged.
+        """
+        num_merged = 0
+        for cell in expand_cells(spec):
+            if results_exist(cell["save_dir"]):
+                continue
+            if self.queue.is_done([unit_id(cell, shard, num_shards) for shard in range(num_shards)]):
+                self.merge_cell({"cell": cell, "num_shards": num_shards, "options": {key: spec[key] for key in ("n", "compress")}})
+                num_merged += 1
+        return num_merged
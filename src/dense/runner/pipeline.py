@@ -0,0 +1,424 @@
+"""
+Module: pipeline
+
+The stages of a LongPiBench evaluation of one (model, task, length range, seed count,
+query placement) cell, shared by eval/eval.py and the sweep runner:
+
+    sample -> prompts -> (pre-flight) -> responses -> scores
+
+Every stage only reads the instances it is given; per-cell fields (responses, scores,
+errors) are added to shallow copies, so the sampled data and prompts of one cell can
+be reused by other cells.
+"""
+
+import os
+import json
+import warnings
+import statistics
+from collections.abc import Sequence
+
+from dense.llm import llm_generate
+from dense.llm.errors import CacheMissError, retry_budget_scope
+from dense.eval import EquationSolutionMetric, HistoryReorderMetric, SQLMetric
+from dense.storage import (
+    context_length,
+    context_text,
+    dump_json,
+    find_artifact,
+    find_task_file,
+    iter_instances,
+    open_columnar,
+    open_framed,
+    prompt_digests,
+    strip_context_digest,
+)
+from .results import ResultLog, instance_id, load_results
+from .preflight import preflight_check, summarize_preflight, print_preflight_summary
+
+# Mapping for the model and metric
+Metric = {
+    "history_reorder_absolute": HistoryReorderMetric,
+    "history_reorder_relative": HistoryReorderMetric,
+    "table_sql_absolute": SQLMetric,
+    "table_sql_relative": SQLMetric,
+    "equation_solution_absolute": EquationSolutionMetric,
+    "equation_solution_relative": EquationSolutionMetric,
+}
+
+
+def select_prompt(head_query: bool, tail_query: bool):
+    assert head_query or tail_query, "At least one of head_query and tail_query should be True."
+    if head_query and tail_query:
+        return "default_prompt"
+    elif head_query:
+        return "query_head_prompt"
+    elif tail_query:
+        return "query_tail_prompt"
+
+
+def default_save_dir(model, task, head_query, tail_query, root="res"):
+    if head_query and tail_query:
+        return f"{root}/{model}/{task}"
+    elif head_query:
+        return f"{root}/{model}/{task}_head"
+    elif tail_query:
+        return f"{root}/{model}/{task}_tail"
+
+
+def results_exist(save_dir):
+    """
+    Check whether save_dir holds a results.json, plain or compressed.
+    """
+    return find_artifact(os.path.join(save_dir, "results.json")) is not None
+
+
+def prepare_save_dir(save_dir, resume=False):
+    """
+    Ensure the save directory exists and is empty, unless resuming a previous run.
+
+    Returns:
+        str: The path of the result log in save_dir.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    if resume:
+        assert not results_exist(save_dir), "The run in save_dir is already complete."
+    else:
+        assert len(os.listdir(save_dir)) == 0, "The save_dir should be empty. Please check the path or pass --resume."
+    return os.path.join(save_dir, "generates.jsonl")
+
+
+def describe_cell(model, task, length_lower_bound, length_upper_bound, seed_num, prompt_type):
+    """
+    Return the parameters that identify the results of a cell, recorded in its save_dir by `check_cell`.
+    """
+    return {
+        "model": model,
+        "task": task,
+        "length_lower_bound": length_lower_bound,
+        "length_upper_bound": length_upper_bound,
+        "seed_num": seed_num,
+        "prompt_type": prompt_type,
+    }
+
+
+def check_cell(save_dir, cell):
+    """
+    Record the cell whose results save_dir holds in save_dir/cell.json, or check that it is the cell recorded there.
+
+    A save_dir is reused across runs: resumed, or skipped once it has a results.json. Without the check, the results
+    of another sample (e.g. of a debug run with fewer seeds) would be kept silently.
+
+    Args:
+        save_dir (str): The directory of the results.
+        cell (Dict[str, Any]): The cell, see `describe_cell`.
+
+    Raises:
+        ValueError: If save_dir holds the results of another cell.
+    """
+    path = os.path.join(save_dir, "cell.json")
+    if os.path.exists(path):
+        with open(path) as file:
+            recorded = json.load(file)
+        if recorded != cell:
+            raise ValueError(
+                f"{save_dir} holds the results of another cell: {recorded}, not {cell}. "
+                "Use another save directory (e.g. the save_root of the sweep spec) or remove it."
+            )
+        return
+    if results_exist(save_dir):
+        warnings.warn(f"{save_dir} has results but no cell.json: the cell they were run for cannot be checked.")
+        return
+    os.makedirs(save_dir, exist_ok=True)
+    # Written by every shard of the cell: each writes its own temporary file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(cell, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+def instance_filter(length_lower_bound, length_upper_bound, seed_num):
+    """
+    Return the predicate selecting the instances whose token_level is within the bounds and whose seed is at most seed_num.
+    """
+    def valid_length(elem):
+        return length_lower_bound <= elem['token_level'] <= length_upper_bound
+
+    def valid_seed_num(elem):
+        int_seed = int(elem['seed_id'].split('_')[-1])
+        return int_seed <= seed_num
+
+    return lambda elem: valid_length(elem) and valid_seed_num(elem)
+
+
+def load_task_slices(task, slices, data_dir="data"):
+    """
+    Select several slices of a task, keeping only the selected instances in memory.
+
+    The columnar files of the task (see dense.storage.columnar) are used when they exist: the slices are
+    selected on the metadata columns and only the selected contexts are read. A framed data file (see
+    dense.storage.frames) is read next: only the frames that may hold a selected instance are read, and
+    decompressed in parallel. Otherwise the data file is streamed once and filtered while it is parsed.
+
+    Args:
+        task (str): The task.
+        slices (Iterable[Tuple[int, int, int]]): The (length_lower_bound, length_upper_bound, seed_num) of every slice.
+        data_dir (str, optional): The directory of the task files. Defaults to "data".
+
+    Returns:
+        Dict[Tuple[int, int, int], List[Dict]]: The instances of every slice, in file order. An instance selected
+        by several slices is shared by them.
+    """
+    columnar = open_columnar(task, data_dir)
+    if columnar is not None:
+        return columnar.select_slices(slices)
+    framed = open_framed(task, data_dir)
+    if framed is not None:
+        return framed.select_slices(slices)
+
+    filters = {bounds: instance_filter(*bounds) for bounds in slices}
+    selected = {bounds: [] for bounds in filters}
+    for elem in iter_instances(find_task_file(task, data_dir)):
+        for bounds, accept in filters.items():
+            if accept(elem):
+                selected[bounds].append(elem)
+    return selected
+
+
+def load_task_slice(task, length_lower_bound, length_upper_bound, seed_num, data_dir="data"):
+    """
+    Return the instances of a task selected by `instance_filter`, without loading the others (see `load_task_slices`).
+    """
+    bounds = (length_lower_bound, length_upper_bound, seed_num)
+    return load_task_slices(task, [bounds], data_dir)[bounds]
+
+
+def build_input(elem, prompt_type, task=None):
+    # The 'meta' tags are read by the response cache: the prompt digests make up the cache key in place of
+    # the prompt, and the task labels the entry. A context kept in a segment store is assembled here.
+    return {
+        "system_prompt": elem[prompt_type]['system_prompt'],
+        "user_message": elem[prompt_type]["user_message"].format(
+            context=context_text(elem),
+            query=elem['question']
+        ),
+        "meta": {"task": task, "prompt": prompt_digests(elem, prompt_type)},
+    }
+
+
+class PromptList(Sequence):
+    """
+    The inputs of a list of instances, built on access instead of being held in memory.
+
+    A prompt is built when it is indexed (e.g. by the engine, when a request is dispatched) and released
+    once the caller drops it, so at most one prompt per request in flight is alive at a time. The engine
+    schedules and prefetches with `num_chars` and `key_input`, which do not build the prompt.
+    """
+
+    def __init__(self, sampled_data, prompt_type, task=None):
+        self.sampled_data = sampled_data
+        self.prompt_type = prompt_type
+        self.task = task
+
+    def __len__(self):
+        return len(self.sampled_data)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(range(len(self))[i])
+        return build_input(self.sampled_data[i], self.prompt_type, self.task)
+
+    def take(self, indices):
+        """
+        Return the (lazy) inputs of the instances at `indices`.
+        """
+        return PromptList([self.sampled_data[i] for i in indices], self.prompt_type, self.task)
+
+    def num_chars(self, i):
+        """
+        Return the approximate number of characters of the prompt of input i, without building it.
+        """
+        elem = self.sampled_data[i]
+        template = elem[self.prompt_type]
+        return len(template["system_prompt"]) + len(template["user_message"]) + context_length(elem) + len(elem["question"])
+
+    def key_input(self, i):
+        """
+        Return an input with the cache key of input i but without its prompt text (see dense.storage.cache).
+        """
+        return {"meta": {"task": self.task, "prompt": prompt_digests(self.sampled_data[i], self.prompt_type)}}
+
+
+def build_inputs(sampled_data, prompt_type, task=None):
+    # Prompts are built lazily, when they are sent (see PromptList)
+    return PromptList(sampled_data, prompt_type, task)
+
+
+def take_inputs(inputs, indices):
+    """
+    Select inputs by position, keeping lazily built inputs lazy.
+    """
+    if isinstance(inputs, PromptList):
+        return inputs.take(indices)
+    return [inputs[i] for i in indices]
+
+
+def run_preflight(sampled_data, inputs, model, preflight="reject", rejected_path=None):
+    """
+    Count prompt tokens and compare them with the model's context window before dispatch.
+
+    With preflight="reject", the rejected instances are listed in `rejected_path` (if given). Only exact counts
+    reject an instance: one exceeding the window on an estimated count (no tokenizer) is flagged and dispatched.
+
+    Returns:
+        Tuple[List[Dict], Sequence[Dict]]: The instances and inputs to dispatch.
+    """
+    assert preflight in ("reject", "flag", "off"), "preflight should be one of 'reject', 'flag' and 'off'."
+    if preflight == "off":
+        return sampled_data, inputs
+
+    checks = preflight_check(inputs, model)
+    summary = summarize_preflight(sampled_data, checks)
+    print_preflight_summary(model, summary, "rejected" if preflight == "reject" else "flagged")
+    if preflight == "flag":
+        for elem, check in zip(sampled_data, checks):
+            elem["preflight"] = check
+        return sampled_data, inputs
+
+    for elem, check in zip(sampled_data, checks):
+        if not check["fits"] and check["estimated"]:
+            elem["preflight"] = check
+    rejected = [
+        {"id": instance_id(elem), "token_level": elem["token_level"], **check}
+        for elem, check in zip(sampled_data, checks) if not check["fits"] and not check["estimated"]
+    ]
+    if rejected and rejected_path is not None:
+        with open(rejected_path, 'w') as file:
+            json.dump(rejected, file, indent=4)
+    kept = [i for i, check in enumerate(checks) if check["fits"] or check["estimated"]]
+    return [sampled_data[i] for i in kept], take_inputs(inputs, kept)
+
+
+def generate_responses(sampled_data, inputs, model, log_path, resume=False, flush_every=8, **generate_kwargs):
+    """
+    Generate the responses that are not logged yet, appending each one (or its structured error) to the log.
+    """
+    # Skip the instances already logged by a previous run, except those that failed with a retryable error
+    completed = {
+        key: record for key, record in load_results(log_path).items()
+        if not record.get("error", {}).get("retryable")
+    }
+    pending = [i for i, elem in enumerate(sampled_data) if instance_id(elem) not in completed]
+    if resume:
+        print(f"Resuming: {len(sampled_data) - len(pending)} of {len(sampled_data)} instances already generated.")
+    pending_data = [sampled_data[i] for i in pending]
+    inputs = take_inputs(inputs, pending)
+
+    with ResultLog(log_path, flush_every=flush_every) as log:
+        def log_response(i, response, error=None):
+            record = {"id": instance_id(pending_data[i]), "llm_response": response}
+            if error is not None:
+                record["error"] = error
+            # The pre-flight flag of the instance is logged too, so merged shards keep it without counting again
+            if "preflight" in pending_data[i]:
+                record["preflight"] = pending_data[i]["preflight"]
+            log.append(record)
+
+        try:
+            # The retries of a cell do not spend those of the other cells of a sweep run in the same process
+            with retry_budget_scope():
+                llm_generate(inputs, model, callback=log_response, **generate_kwargs)
+        except CacheMissError as e:
+            # Offline run: name the instances whose responses are missing rather than their positions
+            raise CacheMissError([instance_id(pending_data[i]) for i in e.misses], e.desc) from None
+
+
+def score_responses(sampled_data, log_path, task, n=1):
+    """
+    Attach the logged responses to the instances and score them.
+    """
+    metric = Metric[task]()
+
+    # Append responses to the sampled data, reading them back from the log
+    completed = load_results(log_path)
+    for elem in sampled_data:
+        record = completed[instance_id(elem)]
+        elem["llm_responses" if n > 1 else "llm_response"] = record["llm_response"]
+        for field in ("error", "preflight"):
+            if field in record:
+                elem[field] = record[field]
+
+    labels = [elem['answers'] for elem in sampled_data]
+
+    if n == 1:
+        # Failed generations have no response and are scored as an empty answer
+        str_responses = [elem["llm_response"] or "" for elem in sampled_data]
+        scores = metric.evaluate(str_responses, labels)
+        # Append scores to the sampled data
+        for i, elem in enumerate(sampled_data):
+            elem["score"] = scores[i]
+    else:
+        # Score every sample, and keep the per-instance mean and variance
+        sample_responses = [elem["llm_responses"] or [""] * n for elem in sampled_data]
+        sample_scores = metric.evaluate_samples(sample_responses, labels)
+        for i, elem in enumerate(sampled_data):
+            elem["scores"] = sample_scores[i]
+            elem["score"] = statistics.mean(sample_scores[i])
+            elem["score_variance"] = statistics.pvariance(sample_scores[i])
+
+
+def save_results(sampled_data, save_dir, log_path, compress=None):
+    # Analyze and save the results, through a temporary file so results.json is never half-written
+    # With compress="zstd" (or "gzip"), they are saved to results.json.zst (or .gz) instead
+    records = [strip_context_digest(elem) for elem in sampled_data]
+    dump_json(records, os.path.join(save_dir, "results.json"), compress=compress)
+
+    # if successfully saved, remove the generates.jsonl because all the information is in results.json
+    os.remove(log_path)
+
+
+def evaluate_cell(
+    sampled_data,
+    inputs,
+    model,
+    task,
+    save_dir,
+    resume=False,
+    flush_every=8,
+    preflight="reject",
+    n=1,
+    compress=None,
+    cell=None,
+    **generate_kwargs,
+):
+    """
+    Run the pre-flight, response and score stages of one cell and write save_dir/results.json.
+
+    Args:
+        sampled_data (List[Dict]): The sampled instances. They are not modified.
+        inputs (Sequence[Dict[str, str]]): The prompts of the instances, see `build_inputs`.
+        model (str): The model to use for inference.
+        task (str): The task for evaluation.
+        save_dir (str): The directory of the results.
+        resume (bool, optional): Continue an interrupted run in save_dir. Defaults to False.
+        flush_every (int, optional): The number of responses buffered before they are flushed to the log. Defaults to 8.
+        preflight (str, optional): "reject", "flag" or "off", see `run_preflight`. Defaults to "reject".
+        n (int, optional): The number of samples per instance. Defaults to 1.
+        compress (str, optional): Compress results.json with "zstd" or "gzip", see `dense.storage.dump_json`.
+            Defaults to None.
+        cell (Dict[str, Any], optional): The parameters of the cell, recorded in save_dir and checked when it is
+            resumed, see `check_cell`. Defaults to None (not recorded).
+        **generate_kwargs: Extra keyword arguments passed to llm_generate (temp, num_workers, limiter, offline, ...).
+            Offline, the cell fails with a CacheMissError naming every instance whose response is not cached.
+    """
+    log_path = prepare_save_dir(save_dir, resume)
+    if cell is not None:
+        check_cell(save_dir, cell)
+
+    # Per-cell fields go to shallow copies, so the sampled data can be shared between cells
+    sampled_data = [dict(elem) for elem in sampled_data]
+
+    rejected_path = os.path.join(save_dir, "preflight_rejected.json")
+    sampled_data, inputs = run_preflight(sampled_data, inputs, model, preflight, rejected_path)
+    generate_responses(sampled_data, inputs, model, log_path, resume=resume, flush_every=flush_every, n=n, **generate_kwargs)
+    score_responses(sampled_data, log_path, task, n=n)
+    save_results(sampled_data, save_dir, log_path, compress=compress)
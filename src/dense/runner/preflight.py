@@ -0,0 +1,83 @@
+"""
+Module: preflight
+
+Check, before anything is sent, that every prompt fits in the context window of the
+model once the output budget is reserved. Prompts that cannot fit would only fail
+after a network round-trip (and its retries).
+
+Without the tokenizer of the model, counts are a characters-per-token estimate, or the
+count of a proxy tokenizer for models that do not publish theirs (see dense.llm.tokens):
+a prompt whose estimate exceeds the window may well fit, so it is flagged as 'estimated'
+and never rejected on the estimate alone.
+"""
+
+from collections import defaultdict
+
+from dense.llm.engine import EXPECTED_OUTPUT_TOKENS
+from dense.llm.tokens import CONTEXT_WINDOWS, count_prompt_tokens, has_tokenizer
+
+
+def preflight_check(inputs, model, output_budget=EXPECTED_OUTPUT_TOKENS):
+    """
+    Count the prompt tokens of every input and compare them with the context window of the model.
+
+    Args:
+        inputs (List[Dict[str, str]]): A list of input dictionaries containing 'system_prompt' and 'user_message'.
+        model (str): The model key, e.g. "gpt".
+        output_budget (int, optional): The number of tokens reserved for the response. Defaults to EXPECTED_OUTPUT_TOKENS.
+
+    Returns:
+        List[Dict[str, Any]]: For every input, its 'prompt_tokens', the 'context_window', whether it 'fits' and
+        whether the count is 'estimated'.
+    """
+    context_window = CONTEXT_WINDOWS[model]
+    estimated = not has_tokenizer(model)
+    checks = []
+    for input_dict in inputs:
+        prompt_tokens = count_prompt_tokens(input_dict, model)
+        checks.append({
+            "prompt_tokens": prompt_tokens,
+            "context_window": context_window,
+            "fits": prompt_tokens + output_budget <= context_window,
+            "estimated": estimated,
+        })
+    return checks
+
+
+def summarize_preflight(data, checks):
+    """
+    Count, for every token_level tier, how many instances fit and how many exceed the context window.
+
+    Args:
+        data (List[Dict[str, Any]]): The instances, aligned with `checks`.
+        checks (List[Dict[str, Any]]): The output of `preflight_check`.
+
+    Returns:
+        Dict[int, Dict[str, int]]: For every tier, the 'total' number of instances, how many 'exceed'
+        the window, how many of those only on an 'estimated' count, and the largest 'max_prompt_tokens'.
+    """
+    summary = defaultdict(lambda: {"total": 0, "exceed": 0, "estimated": 0, "max_prompt_tokens": 0})
+    for elem, check in zip(data, checks):
+        tier = summary[elem["token_level"]]
+        tier["total"] += 1
+        tier["exceed"] += int(not check["fits"])
+        tier["estimated"] += int(not check["fits"] and check.get("estimated", False))
+        tier["max_prompt_tokens"] = max(tier["max_prompt_tokens"], check["prompt_tokens"])
+    return dict(sorted(summary.items()))
+
+
+def print_preflight_summary(model, summary, action):
+    """
+    Print the per-tier summary of a pre-flight check. Instances exceeding the window on an estimated count are
+    reported as flagged, whatever the action.
+    """
+    estimated = any(tier["estimated"] for tier in summary.values())
+    note = ", estimated counts: no exact tokenizer available" if estimated else ""
+    print(f"Pre-flight check for {model} (context window {CONTEXT_WINDOWS[model]} tokens{note}):")
+    for token_level, tier in summary.items():
+        exact = tier["exceed"] - tier["estimated"]
+        flagged = f", {tier['estimated']} flagged on an estimated count" if tier["estimated"] else ""
+        print(
+            f"  {token_level}: {exact} of {tier['total']} instances {action}{flagged} "
+            f"(max prompt {tier['max_prompt_tokens']} tokens)"
+        )
@@ -0,0 +1,356 @@
+"""
+Module: queue
+
+Work queues with leases, for sweeps spread over several machines.
+
+A worker leases a unit of work for a limited time, renews the lease with heartbeats
+while it works, and completes it at the end. A lease that is not renewed expires and
+the unit goes back to the queue, so units held by a crashed worker are picked up by
+the others. Every lease carries a token: a worker whose lease has expired (and whose
+unit was leased again) can no longer heartbeat or complete it. A unit is leased at
+most max_attempts times, whether its attempts failed or their leases expired (e.g. a
+worker killed by the OOM killer every time): after that it is marked as failed.
+
+Two backends are provided, selected by URL with `open_queue`:
+    - sqlite:///path/to/queue.db  SQLite, for a single host or a shared filesystem with working locks.
+    - redis://host:6379/0         Redis or any server speaking its protocol (requires the redis package).
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+# Error recorded for a unit whose last lease expired
+EXPIRED_ERROR = "The lease expired on each of its {} attempts: the worker died or was preempted."
+
+
+class Lease:
+    """
+    A unit of work leased by a worker.
+    """
+
+    def __init__(self, unit_id, payload, token, attempts):
+        self.unit_id = unit_id
+        self.payload = payload
+        self.token = token
+        self.attempts = attempts
+
+
+class WorkQueue(ABC):
+    """
+    Abstract base class for work queues.
+
+    Methods:
+    put(self, units): Add units, given as a mapping from unit id to JSON-serializable payload. Known ids are ignored.
+    lease(self, worker_id, lease_seconds): Lease a pending (or expired) unit, or return None if there is none.
+        Expired units that have used max_attempts leases are marked as failed instead.
+    heartbeat(self, lease, lease_seconds): Extend a lease. Returns False if the lease was lost.
+    complete(self, lease): Mark a leased unit as done. Returns False if the lease was lost.
+    fail(self, lease, error): Give a unit back, or mark it as failed once it has used max_attempts leases.
+    claim(self, name): Atomically claim a named one-off task. Returns True for the first caller only.
+    is_done(self, unit_ids): Whether all the given units are done.
+    stats(self): The number of units in each state.
+    """
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    def put(self, units):
+        pass
+
+    @abstractmethod
+    def lease(self, worker_id, lease_seconds=300):
+        pass
+
+    @abstractmethod
+    def heartbeat(self, lease, lease_seconds=300):
+        pass
+
+    @abstractmethod
+    def complete(self, lease):
+        pass
+
+    @abstractmethod
+    def fail(self, lease, error):
+        pass
+
+    @abstractmethod
+    def claim(self, name):
+        pass
+
+    @abstractmethod
+    def is_done(self, unit_ids):
+        pass
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class SQLiteQueue(WorkQueue):
+    """
+    Work queue stored in a SQLite database. Every operation is one short transaction.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        super().__init__(max_attempts)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                "id TEXT PRIMARY KEY, payload TEXT, state TEXT, worker TEXT, token TEXT, "
+                "lease_expires REAL, attempts INTEGER DEFAULT 0, error TEXT)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS claims (name TEXT PRIMARY KEY, claimed_at REAL)")
+
+    @contextmanager
+    def _connect(self):
+        # isolation_level=None: statements autocommit, transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def put(self, units):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO units (id, payload, state) VALUES (?, ?, 'pending')",
+                [(unit_id, json.dumps(payload)) for unit_id, payload in units.items()],
+            )
+
+    def lease(self, worker_id, lease_seconds=300):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE units SET state = 'failed', token = NULL, error = ? "
+                    "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (EXPIRED_ERROR.format(self.max_attempts), now, self.max_attempts),
+                )
+                row = conn.execute(
+                    "SELECT id, payload, attempts FROM units "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                    "ORDER BY rowid LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                unit_id, payload, attempts = row
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE units SET state = 'leased', worker = ?, token = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                    (worker_id, token, now + lease_seconds, attempts + 1, unit_id),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return Lease(unit_id, json.loads(payload), token, attempts + 1)
+
+    def _update_leased(self, lease, assignments, params):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE units SET {assignments} WHERE id = ? AND token = ? AND state = 'leased'",
+                (*params, lease.unit_id, lease.token),
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, lease, lease_seconds=300):
+        return self._update_leased(lease, "lease_expires = ?", (time.time() + lease_seconds,))
+
+    def complete(self, lease):
+        return self._update_leased(lease, "state = 'done', token = NULL", ())
+
+    def fail(self, lease, error):
+        state = "failed" if lease.attempts >= self.max_attempts else "pending"
+        return self._update_leased(lease, "state = ?, token = NULL, error = ?", (state, str(error)))
+
+    def claim(self, name):
+        with self._connect() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO claims (name, claimed_at) VALUES (?, ?)", (name, time.time()))
+            return cursor.rowcount == 1
+
+    def is_done(self, unit_ids):
+        unit_ids = list(unit_ids)
+        with self._connect() as conn:
+            placeholders = ", ".join("?" * len(unit_ids))
+            (num_done,) = conn.execute(
+                f"SELECT COUNT(*) FROM units WHERE state = 'done' AND id IN ({placeholders})", unit_ids
+            ).fetchone()
+        return num_done == len(unit_ids)
+
+    def stats(self):
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT CASE WHEN state = 'leased' AND lease_expires < ? THEN 'expired' ELSE state END, COUNT(*) "
+                "FROM units GROUP BY 1",
+                (now,),
+            ).fetchall()
+        return dict(rows)
+
+
+class RedisQueue(WorkQueue):
+    """
+    Work queue stored in Redis (or a compatible server, e.g. a local stand-in for tests).
+
+    Keys, under `prefix`: 'units' (hash id -> payload), 'pending' (list), 'leases' (sorted set
+    id -> expiry time), 'tokens' (hash id -> lease token), 'attempts' (hash), 'done' (set),
+    'failed' (hash id -> error) and 'claims' (set).
+    """
+
+    def __init__(self, client, prefix="longpibench", max_attempts=3):
+        super().__init__(max_attempts)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def put(self, units):
+        unit_ids = list(units)
+        if not unit_ids:
+            return
+
+        def put(pipe):
+            # A unit and its pending entry are added together, and only if no other client added the unit meanwhile
+            stored = pipe.hmget(self._key("units"), unit_ids)
+            pipe.multi()
+            for unit_id, payload in zip(unit_ids, stored):
+                if payload is None:
+                    pipe.hset(self._key("units"), unit_id, json.dumps(units[unit_id]))
+                    pipe.lpush(self._key("pending"), unit_id)
+
+        self.client.transaction(put, self._key("units"))
+
+    def _transaction(self, func):
+        """
+        Run func(pipe) atomically and return its result: the keys of the lease state are watched, and the
+        transaction is retried if another client changed them between func's reads and its queued writes.
+        """
+        watched = [self._key(name) for name in ("pending", "leases", "tokens")]
+        return self.client.transaction(func, *watched, value_from_callable=True)
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _requeue_expired(self):
+        expired = [self._decode(unit_id) for unit_id in self.client.zrangebyscore(self._key("leases"), "-inf", time.time())]
+
+        def requeue(pipe, unit_id):
+            score = pipe.zscore(self._key("leases"), unit_id)
+            if score is None or score >= time.time():
+                # Completed, failed, renewed or requeued by another client in the meantime
+                return
+            attempts = int(pipe.hget(self._key("attempts"), unit_id) or 0)
+            pipe.multi()
+            pipe.zrem(self._key("leases"), unit_id)
+            pipe.hdel(self._key("tokens"), unit_id)
+            if attempts >= self.max_attempts:
+                pipe.hset(self._key("failed"), unit_id, EXPIRED_ERROR.format(attempts))
+            else:
+                pipe.lpush(self._key("pending"), unit_id)
+
+        for unit_id in expired:
+            self._transaction(lambda pipe: requeue(pipe, unit_id))
+
+    def lease(self, worker_id, lease_seconds=300):
+        self._requeue_expired()
+
+        def lease(pipe):
+            unit_id = self._decode(pipe.lindex(self._key("pending"), -1))
+            if unit_id is None:
+                return None
+            attempts = int(pipe.hget(self._key("attempts"), unit_id) or 0) + 1
+            payload = pipe.hget(self._key("units"), unit_id)
+            token = uuid.uuid4().hex
+            pipe.multi()
+            pipe.rpop(self._key("pending"))
+            pipe.zadd(self._key("leases"), {unit_id: time.time() + lease_seconds})
+            pipe.hset(self._key("tokens"), unit_id, token)
+            pipe.hset(self._key("attempts"), unit_id, attempts)
+            return Lease(unit_id, json.loads(payload), token, attempts)
+
+        return self._transaction(lease)
+
+    def _owns(self, pipe, lease):
+        return self._decode(pipe.hget(self._key("tokens"), lease.unit_id)) == lease.token
+
+    def heartbeat(self, lease, lease_seconds=300):
+        def heartbeat(pipe):
+            if not self._owns(pipe, lease):
+                return False
+            pipe.multi()
+            pipe.zadd(self._key("leases"), {lease.unit_id: time.time() + lease_seconds})
+            return True
+
+        return self._transaction(heartbeat)
+
+    def _release(self, pipe, lease):
+        pipe.zrem(self._key("leases"), lease.unit_id)
+        pipe.hdel(self._key("tokens"), lease.unit_id)
+
+    def complete(self, lease):
+        def complete(pipe):
+            if not self._owns(pipe, lease):
+                return False
+            pipe.multi()
+            self._release(pipe, lease)
+            pipe.sadd(self._key("done"), lease.unit_id)
+            return True
+
+        return self._transaction(complete)
+
+    def fail(self, lease, error):
+        def fail(pipe):
+            if not self._owns(pipe, lease):
+                return False
+            pipe.multi()
+            self._release(pipe, lease)
+            if lease.attempts >= self.max_attempts:
+                pipe.hset(self._key("failed"), lease.unit_id, str(error))
+            else:
+                pipe.lpush(self._key("pending"), lease.unit_id)
+            return True
+
+        return self._transaction(fail)
+
+    def claim(self, name):
+        return bool(self.client.sadd(self._key("claims"), name))
+
+    def is_done(self, unit_ids):
+        return all(self.client.sismember(self._key("done"), unit_id) for unit_id in unit_ids)
+
+    def stats(self):
+        now = time.time()
+        return {
+            "pending": self.client.llen(self._key("pending")),
+            "leased": self.client.zcount(self._key("leases"), now, "+inf"),
+            "expired": self.client.zcount(self._key("leases"), "-inf", now),
+            "done": self.client.scard(self._key("done")),
+            "failed": self.client.hlen(self._key("failed")),
+        }
+
+
+def open_queue(url, max_attempts=3):
+    """
+    Open a work queue from its URL: sqlite:///path/to/queue.db or redis://host:port/db.
+
+    For Redis, an optional '#prefix' fragment namespaces the keys of the queue (default 'longpibench').
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteQueue(url[len("sqlite:///"):], max_attempts=max_attempts)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+
+        url, _, prefix = url.partition("#")
+        return RedisQueue(redis.Redis.from_url(url), prefix=prefix or "longpibench", max_attempts=max_attempts)
+    raise ValueError(f"Unsupported queue URL {url}, expected sqlite:///... or redis://...")
@@ -0,0 +1,109 @@
+"""
+Module: results
+
+Crash-safe storage of generated responses. Responses are appended to a JSONL log
+as they complete and flushed to disk in small batches, so an interrupted run loses
+at most one batch and can be resumed by skipping the instances already logged.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+
+def instance_id(elem):
+    """
+    Return the identifier of a data instance.
+
+    Instances carry a 'uuid'; for records without one, a digest of the fields that
+    identify an instance within a task file is used instead.
+    """
+    if "uuid" in elem:
+        return elem["uuid"]
+    key = json.dumps(
+        [elem.get("seed_id"), elem.get("token_level"), elem.get("level"), elem.get("question")],
+        sort_keys=True,
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def load_results(path):
+    """
+    Load the records of a result log.
+
+    A partially written last line (e.g. after a crash in the middle of a flush) is ignored.
+
+    Args:
+        path (str): The path of the JSONL log.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The logged records, keyed by instance id.
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["id"]] = record
+    return records
+
+
+class ResultLog:
+    """
+    Append-only JSONL log of results, flushed in batches.
+
+    Records are buffered and written once `flush_every` records are pending or
+    `flush_interval` seconds have passed since the last flush. Every flush is
+    fsync'ed. Use it as a context manager so the buffer is flushed on exit,
+    including on exceptions and KeyboardInterrupt.
+    """
+
+    def __init__(self, path, flush_every=8, flush_interval=30.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._truncate_partial_line()
+        self._file = open(path, "a")
+
+    def _truncate_partial_line(self):
+        # Drop a half-written last line so new records do not get glued to it
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as file:
+            content = file.read()
+            if content and not content.endswith(b"\n"):
+                file.truncate(content.rfind(b"\n") + 1)
+
+    def append(self, record):
+        """
+        Add a record (a JSON-serializable dictionary with an 'id' key) to the log.
+        """
+        self._buffer.append(json.dumps(record))
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
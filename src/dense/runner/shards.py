@@ -0,0 +1,201 @@
+"""
+Module: shards
+
+Sharding of one cell, shared by array jobs and distributed sweeps: `eval.py --shard i/N`
+(or a unit leased from a work queue, see distributed.py) generates the responses of the
+i-th of N shards of the cell, and eval/merge.py (or the worker that completes the last
+shard) merges the shards into the cell's results.json once they are all done.
+
+Every shard computes the same partition from the sampled instances, without
+coordination: instances are assigned greedily, largest estimated prompt first, to the
+shard with the fewest estimated tokens so far (ties broken by instance id), so the
+shards take about the same time even though prompt lengths span 8K to 256K tokens.
+The shards share the cell's save_dir, each writing its own files:
+
+    {save_dir}/generates.{i}-of-{N}.jsonl            the result log of shard i
+    {save_dir}/preflight_rejected.{i}-of-{N}.json    its instances rejected by the pre-flight
+
+The merge combines these files: the pre-flight is not run again.
+"""
+
+import os
+import json
+import heapq
+
+from dense.llm.engine import estimate_costs
+from .results import instance_id, load_results
+from .pipeline import (
+    check_cell,
+    generate_responses,
+    results_exist,
+    run_preflight,
+    save_results,
+    score_responses,
+    take_inputs,
+)
+
+
+def parse_shard(shard):
+    """
+    Parse a shard specification "i/N" (0 <= i < N).
+
+    Returns:
+        Tuple[int, int]: The shard index and the number of shards.
+    """
+    try:
+        index, num_shards = (int(part) for part in str(shard).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {shard!r}: expected i/N, e.g. 0/4.") from None
+    if not 0 <= index < num_shards:
+        raise ValueError(f"Invalid shard {shard!r}: the index should be in [0, {num_shards}).")
+    return index, num_shards
+
+
+def shard_paths(save_dir, shard, num_shards):
+    """
+    Return the result log and pre-flight rejection paths of a shard.
+    """
+    suffix = f"{shard}-of-{num_shards}"
+    return os.path.join(save_dir, f"generates.{suffix}.jsonl"), os.path.join(save_dir, f"preflight_rejected.{suffix}.json")
+
+
+def partition(sampled_data, inputs, num_shards):
+    """
+    Split the instances of a cell into shards of about the same estimated number of prompt tokens.
+
+    Returns:
+        List[List[int]]: The positions of the instances of every shard, in order.
+    """
+    costs = estimate_costs(inputs, expected_output_tokens=0)
+    ids = [instance_id(elem) for elem in sampled_data]
+    shards = [[] for _ in range(num_shards)]
+    loads = [(0, shard) for shard in range(num_shards)]
+    for i in sorted(range(len(sampled_data)), key=lambda i: (-costs[i], ids[i])):
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(i)
+        heapq.heappush(loads, (load + costs[i], shard))
+    return [sorted(positions) for positions in shards]
+
+
+def run_shard(
+    sampled_data,
+    inputs,
+    model,
+    save_dir,
+    shard,
+    num_shards,
+    resume=False,
+    flush_every=8,
+    preflight="reject",
+    cell=None,
+    **generate_kwargs,
+):
+    """
+    Run the pre-flight and response stages of one shard of a cell, into its own files in save_dir.
+
+    The cell is scored by `merge_shards` once every shard is done. Other shards may write to
+    save_dir at the same time; only the files of this shard have to be absent, unless resuming.
+
+    Args:
+        sampled_data (List[Dict]): All the sampled instances of the cell. They are not modified.
+        inputs (Sequence[Dict[str, str]]): Their prompts, see `build_inputs`.
+        model (str): The model to use for inference.
+        save_dir (str): The directory of the results, shared by the shards.
+        shard (int): The index of the shard.
+        num_shards (int): The number of shards.
+        resume (bool, optional): Continue an interrupted run of this shard. Defaults to False.
+        flush_every (int, optional): The number of responses buffered before they are flushed to the log. Defaults to 8.
+        preflight (str, optional): "reject", "flag" or "off", see `run_preflight`. Defaults to "reject".
+        cell (Dict[str, Any], optional): The parameters of the cell, recorded in save_dir and checked, see
+            `check_cell`. Defaults to None (not recorded).
+        **generate_kwargs: Extra keyword arguments passed to llm_generate (n, temp, num_workers, offline, ...).
+
+    Returns:
+        int: The number of instances of the shard.
+    """
+    log_path, rejected_path = shard_paths(save_dir, shard, num_shards)
+    os.makedirs(save_dir, exist_ok=True)
+    assert not results_exist(save_dir), "The cell in save_dir is already merged."
+    if cell is not None:
+        check_cell(save_dir, cell)
+    if not resume:
+        assert not os.path.exists(log_path), f"{log_path} already exists. Please check the path or pass --resume."
+
+    positions = partition(sampled_data, inputs, num_shards)[shard]
+    shard_data = [dict(sampled_data[i]) for i in positions]
+    shard_inputs = take_inputs(inputs, positions)
+    shard_data, shard_inputs = run_preflight(shard_data, shard_inputs, model, preflight, rejected_path)
+    generate_responses(shard_data, shard_inputs, model, log_path, resume=resume, flush_every=flush_every, **generate_kwargs)
+    return len(positions)
+
+
+def merge_shards(sampled_data, inputs, task, save_dir, num_shards, n=1, compress=None):
+    """
+    Merge the result logs of the shards of a cell, score it and write save_dir/results.json.
+
+    The instances rejected by the pre-flight of the shards are read from their rejection files and combined into
+    save_dir/preflight_rejected.json; every other instance should have a response. The merge is checked against
+    the partition: it fails, writing nothing, if an instance has no response (a shard is missing or incomplete),
+    is logged by several shards, or is logged by a shard it was not assigned to.
+
+    Args:
+        sampled_data (List[Dict]): All the sampled instances of the cell, as given to the shards.
+        inputs (Sequence[Dict[str, str]]): Their prompts, see `build_inputs`.
+        task (str): The task of the cell.
+        save_dir (str): The directory of the results.
+        num_shards (int): The number of shards.
+        n (int, optional): The number of samples per instance. Defaults to 1.
+        compress (str, optional): Compress results.json with "zstd" or "gzip". Defaults to None.
+
+    Returns:
+        int: The number of instances merged.
+    """
+    assert not results_exist(save_dir), "The cell in save_dir is already merged."
+    owner = {}
+    for shard, positions in enumerate(partition(sampled_data, inputs, num_shards)):
+        owner.update({instance_id(sampled_data[i]): shard for i in positions})
+
+    records, logged_by, misplaced, rejected = {}, {}, [], []
+    for shard in range(num_shards):
+        log_path, rejected_path = shard_paths(save_dir, shard, num_shards)
+        if not os.path.exists(log_path):
+            raise ValueError(f"Shard {shard}/{num_shards} of {save_dir} has no result log ({log_path}).")
+        for key, record in load_results(log_path).items():
+            if owner.get(key) != shard:
+                misplaced.append(key)
+            logged_by.setdefault(key, []).append(shard)
+            records[key] = record
+        if os.path.exists(rejected_path):
+            with open(rejected_path) as file:
+                rejected.extend(json.load(file))
+    duplicated = [key for key, shards in logged_by.items() if len(shards) > 1]
+
+    rejected_ids = {check["id"] for check in rejected}
+    sampled_data = [dict(elem) for elem in sampled_data if instance_id(elem) not in rejected_ids]
+    missing = [instance_id(elem) for elem in sampled_data if instance_id(elem) not in records]
+    problems = [
+        f"{len(keys)} instances {description}, e.g. {keys[:3]}"
+        for keys, description in (
+            (missing, "have no response"),
+            (duplicated, "are logged by several shards"),
+            (misplaced, "are logged by a shard they are not assigned to"),
+        )
+        if keys
+    ]
+    if problems:
+        raise ValueError(f"Cannot merge the {num_shards} shards of {save_dir}: " + "; ".join(problems) + ".")
+
+    if rejected:
+        with open(os.path.join(save_dir, "preflight_rejected.json"), "w") as file:
+            json.dump(rejected, file, indent=4)
+    log_path = os.path.join(save_dir, "generates.jsonl")
+    with open(log_path, "w") as file:
+        for elem in sampled_data:
+            file.write(json.dumps(records[instance_id(elem)]) + "\n")
+    score_responses(sampled_data, log_path, task, n=n)
+    save_results(sampled_data, save_dir, log_path, compress=compress)
+    for shard in range(num_shards):
+        for path in shard_paths(save_dir, shard, num_shards):
+            if os.path.exists(path):
+                os.remove(path)
+    return len(sampled_data)
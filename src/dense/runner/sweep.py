@@ -0,0 +1,225 @@
+"""
+Module: sweep
+
+Run a whole grid of evaluation cells in one process. A sweep is described by a
+declarative JSON spec:
+
+    {
+        "models": ["gpt", "qwen_7b"],
+        "tasks": ["table_sql_absolute", "table_sql_relative"],
+        "length_ranges": [[32000, 32000]],
+        "seed_nums": [20],
+        "placements": ["both"],                       # "both", "head" and/or "tail"
+        "provider_limits": {"openai": 8, "bailian": 4},
+        "default_provider_limit": 4,
+        "resume": true,
+        "preflight": "reject",
+        "temp": 0.0,
+        "n": 1,
+        "compress": null                              # or "zstd" / "gzip" for results.json
+    }
+
+Every combination of models, tasks, length ranges, seed counts and placements is a
+cell. Each data file is streamed once, keeping only the instances of the sampled
+slices, and each stage is computed once and reused: the sample of a (task, length
+range, seed count) and the prompts of a (sample, placement) are shared by all
+models, responses are persisted in the result log of the cell (and the response
+cache), and cells whose results.json exists are skipped. All cells run concurrently; the requests in flight to each provider are capped by
+its limit, so every provider is kept busy at the same time.
+
+The length range and seed count are only part of the save_dir of a cell when the sweep
+varies them, so sweeps with different values share directories: every save_dir records
+its cell (see pipeline.check_cell), and a sweep fails rather than skip or resume the
+results of another cell. Give such sweeps (e.g. a debug sweep) their own save_root.
+"""
+
+import json
+import itertools
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dense.llm.llm import PROVIDERS
+from .pipeline import (
+    build_inputs,
+    check_cell,
+    default_save_dir,
+    describe_cell,
+    evaluate_cell,
+    load_task_slices,
+    results_exist,
+    select_prompt,
+)
+
+PLACEMENTS = {
+    "both": (True, True),
+    "head": (True, False),
+    "tail": (False, True),
+}
+
+DEFAULT_SPEC = {
+    "length_ranges": [[32000, 32000]],
+    "seed_nums": [20],
+    "placements": ["both"],
+    "provider_limits": {},
+    "default_provider_limit": 4,
+    "save_root": "res",
+    "resume": True,
+    "flush_every": 8,
+    "preflight": "reject",
+    "temp": 0.0,
+    "n": 1,
+    "compress": None,
+}
+
+
+def load_spec(path):
+    """
+    Read a sweep spec and fill in the defaults of the optional fields.
+    """
+    with open(path) as file:
+        spec = {**DEFAULT_SPEC, **json.load(file)}
+    for key in ("models", "tasks"):
+        assert spec.get(key), f"The sweep spec should list at least one entry in '{key}'."
+    for placement in spec["placements"]:
+        assert placement in PLACEMENTS, f"Unknown placement {placement}, expected one of {list(PLACEMENTS)}."
+    return spec
+
+
+def expand_cells(spec):
+    """
+    List the cells of a sweep.
+
+    Returns:
+        List[Dict[str, Any]]: One dictionary per cell with its model, task, bounds, seed_num, placement and save_dir.
+    """
+    # The length range and seed count only need to be part of the directory when the sweep varies them
+    suffix_needed = len(spec["length_ranges"]) > 1 or len(spec["seed_nums"]) > 1
+    cells = []
+    for model, task, (lower, upper), seed_num, placement in itertools.product(
+        spec["models"], spec["tasks"], spec["length_ranges"], spec["seed_nums"], spec["placements"]
+    ):
+        head_query, tail_query = PLACEMENTS[placement]
+        save_dir = default_save_dir(model, task, head_query, tail_query, root=spec["save_root"])
+        if suffix_needed:
+            save_dir += f"_{lower}-{upper}_seed{seed_num}"
+        cells.append({
+            "model": model,
+            "task": task,
+            "length_lower_bound": lower,
+            "length_upper_bound": upper,
+            "seed_num": seed_num,
+            "placement": placement,
+            "save_dir": save_dir,
+        })
+    return cells
+
+
+def cell_record(cell):
+    """
+    Return the parameters of a cell of a sweep recorded in its save_dir, see `pipeline.describe_cell`.
+    """
+    return describe_cell(
+        cell["model"],
+        cell["task"],
+        cell["length_lower_bound"],
+        cell["length_upper_bound"],
+        cell["seed_num"],
+        select_prompt(*PLACEMENTS[cell["placement"]]),
+    )
+
+
+def pending_cells(spec):
+    """
+    List the cells of a sweep that have no results.json yet.
+
+    Raises:
+        ValueError: If a complete save_dir holds the results of another cell (see `pipeline.check_cell`).
+    """
+    cells = []
+    for cell in expand_cells(spec):
+        if results_exist(cell["save_dir"]):
+            check_cell(cell["save_dir"], cell_record(cell))
+        else:
+            cells.append(cell)
+    return cells
+
+
+def run_sweep(spec, data_dir="data"):
+    """
+    Run every cell of a sweep.
+
+    Args:
+        spec (Dict[str, Any]): The sweep spec, see `load_spec`.
+        data_dir (str, optional): The directory of the task files. Defaults to "data".
+
+    Returns:
+        Dict[str, str]: The save_dir of every failed cell, mapped to its traceback.
+
+    Raises:
+        ValueError: If a complete save_dir holds the results of another cell.
+    """
+    cells = pending_cells(spec)
+    print(f"Sweep: {len(cells)} cells to run.")
+    if not cells:
+        return {}
+
+    # Stages 1 and 2: stream each data file once, keeping only the instances of the sampled slices
+    slices = {}
+    for cell in cells:
+        slices.setdefault(cell["task"], set()).add((cell["length_lower_bound"], cell["length_upper_bound"], cell["seed_num"]))
+    samples = {}
+    for task, task_slices in sorted(slices.items()):
+        for bounds, instances in load_task_slices(task, task_slices, data_dir).items():
+            samples[(task,) + bounds] = instances
+
+    # Stage 3: one lazy prompt list per key, shared by every model (prompts are built when sent)
+    prompts = {}
+    for cell in cells:
+        sample_key = (cell["task"], cell["length_lower_bound"], cell["length_upper_bound"], cell["seed_num"])
+        prompt_key = sample_key + (cell["placement"],)
+        if prompt_key not in prompts:
+            prompt_type = select_prompt(*PLACEMENTS[cell["placement"]])
+            prompts[prompt_key] = build_inputs(samples[sample_key], prompt_type, cell["task"])
+        cell["sample_key"], cell["prompt_key"] = sample_key, prompt_key
+
+    # Cap the requests in flight per provider across all the cells it serves
+    limits = {
+        provider: spec["provider_limits"].get(provider, spec["default_provider_limit"])
+        for provider in {PROVIDERS[cell["model"]] for cell in cells}
+    }
+    limiters = {provider: threading.BoundedSemaphore(limit) for provider, limit in limits.items()}
+
+    def run_cell(cell):
+        provider = PROVIDERS[cell["model"]]
+        evaluate_cell(
+            samples[cell["sample_key"]],
+            prompts[cell["prompt_key"]],
+            cell["model"],
+            cell["task"],
+            cell["save_dir"],
+            resume=spec["resume"],
+            flush_every=spec["flush_every"],
+            preflight=spec["preflight"],
+            n=spec["n"],
+            compress=spec["compress"],
+            temp=spec["temp"],
+            num_workers=limits[provider],
+            cell=cell_record(cell),
+            limiter=limiters[provider],
+            mute_tqdm=True,
+        )
+
+    # Stages 4 and 5: responses and scores, all cells at once
+    failures = {}
+    with ThreadPoolExecutor(max_workers=len(cells)) as executor:
+        futures = {executor.submit(run_cell, cell): cell for cell in cells}
+        for future in as_completed(futures):
+            cell = futures[future]
+            try:
+                future.result()
+                print(f"    Success: {cell['save_dir']}")
+            except Exception:
+                failures[cell["save_dir"]] = traceback.format_exc()
+                print(f"    Error: {cell['save_dir']}\n{failures[cell['save_dir']]}")
+    return failures
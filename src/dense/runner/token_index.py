@@ -0,0 +1,241 @@
+"""
+Module: token_index
+
+Token positions of the answer items, in a sidecar index of every task file:
+
+    data/{task}.tokens.jsonl    one record per (tokenizer, context): the total number of
+                                tokens of the context and the token span of every item
+                                at a location of the instance
+
+`location` and `level` are in items (rows, equations, events), and `token_level` is
+nominal; the index gives the true token positions of the answers for the analyses of
+position bias. Records are keyed by tokenizer and context digest (see
+dense.storage.digests): a context is tokenized once per tokenizer, and models sharing a
+tokenizer share its records. The proxy tokenizer of a model that does not publish its
+own (claude, gemini; see dense.llm.tokens) only estimates its positions: its records are
+keyed by the model and flagged as estimated. Building the index only tokenizes
+the contexts missing from it, in parallel processes, appending their records as they
+complete, so an interrupted build resumes where it stopped.
+
+The spans are those of the lines of the context: the items must be one per line, with
+`location` indexing the lines (numbered contexts keep their numbers, which are part of
+their lines). A context with fewer lines than its locations, or whose lines at the
+locations are not its answers when the answers are the items (table_sql rows), is not
+indexed: the build fails with the instance it stopped at.
+"""
+
+import os
+import bisect
+import itertools
+import concurrent.futures
+
+from dense.llm.tokens import TOKENIZERS, token_starts
+from dense.storage import context_digest, context_text, find_task_file, iter_instances
+from .results import ResultLog, load_results
+
+# Contexts tokenized per job, and jobs in flight per process
+CHUNK_SIZE = 4
+JOBS_PER_WORKER = 2
+
+
+def token_index_path(task, data_dir="data"):
+    return os.path.join(data_dir, f"{task}.tokens.jsonl")
+
+
+def tokenizer_name(model):
+    """
+    Return the name of the tokenizer of a model key, which keys its records in the index.
+    """
+    _, name, exact = TOKENIZERS.get(model, (None, None, False))
+    if name is None:
+        return model
+    # The positions of a proxy tokenizer are estimates for this model only
+    return name if exact else f"{name}~{model}"
+
+
+def check_item_lines(elem, context):
+    """
+    Check that the items of an instance are the lines of its context, as its location indexes them.
+
+    The location must be within the lines of the context and, when the answers are the items themselves (e.g. the
+    rows of table_sql), the lines at the locations must be the answers.
+
+    Raises:
+        ValueError: If they are not.
+    """
+    lines = context.split("\n")
+    past = [location for location in elem["location"] if not 0 <= location < len(lines)]
+    if past:
+        raise ValueError(
+            f"Instance {elem.get('uuid')}: location {past[0]} is not one of the {len(lines)} lines of the context; "
+            "its items are not one per line."
+        )
+    answers = elem.get("answers", [])
+    if len(answers) == len(elem["location"]) and all(answer and answer in context for answer in answers):
+        located = sorted(lines[location] for location in elem["location"])
+        if located != sorted(answers):
+            raise ValueError(
+                f"Instance {elem.get('uuid')}: the lines at its locations are not its answers, "
+                f"e.g. line {elem['location'][0]} is {lines[elem['location'][0]][:100]!r}."
+            )
+
+
+def item_token_spans(context, locations, model):
+    """
+    Tokenize a context and return the token spans of the items (lines) at `locations`.
+
+    Returns:
+        Tuple[int, Dict[str, List[int]], bool]: The number of tokens of the context, the [start, end) token span of
+        every location, and whether the positions are estimated (see dense.llm.tokens.token_starts).
+    """
+    starts, estimated = token_starts(context, model)
+    line_starts = list(itertools.accumulate((len(line) + 1 for line in context.split("\n")), initial=0))
+    assert all(0 <= location < len(line_starts) - 1 for location in locations), "A location is past the lines of the context."
+    spans = {}
+    for location in locations:
+        first, last = line_starts[location], line_starts[location + 1] - 2
+        # The tokens holding the first and last characters of the item
+        spans[str(location)] = [bisect.bisect_right(starts, first) - 1, bisect.bisect_right(starts, max(last, first))]
+    return len(starts), spans, estimated
+
+
+def _index_chunk(jobs, model):
+    records = []
+    for key, digest, context, locations in jobs:
+        num_tokens, spans, estimated = item_token_spans(context, locations, model)
+        records.append({
+            "id": key,
+            "tokenizer": tokenizer_name(model),
+            "context_digest": digest,
+            "num_tokens": num_tokens,
+            "item_tokens": spans,
+            "estimated": estimated,
+        })
+    return records
+
+
+class TokenIndex:
+    """
+    The token index of a task file, for one tokenizer.
+
+    Args:
+        path (str): The path of the index, see `token_index_path`.
+        model (str): The model key whose tokenizer the positions are counted with, e.g. "gpt".
+    """
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self.tokenizer = tokenizer_name(model)
+        # Whether the tokenizer is available here to count exact positions
+        self.exact = not token_starts("", model)[1]
+        self.records = load_results(path)
+
+    def key(self, elem):
+        return f"{self.tokenizer}:{context_digest(elem)}"
+
+    def lookup(self, elem):
+        """
+        Return the token positions of the answer items of an instance, or None if they are not indexed.
+
+        Returns:
+            Dict[str, Any]: The number of tokens of the context ('num_tokens'), the [start, end) token span of the item
+            at every location of the instance, in the order of elem["location"] ('answer_tokens'), and whether the
+            positions are estimated.
+        """
+        record = self.records.get(self.key(elem))
+        if record is None or any(str(location) not in record["item_tokens"] for location in elem["location"]):
+            return None
+        return {
+            "num_tokens": record["num_tokens"],
+            "answer_tokens": [record["item_tokens"][str(location)] for location in elem["location"]],
+            "estimated": record["estimated"],
+        }
+
+    def missing(self, elem):
+        """
+        Whether the instance is not indexed, or only has estimated positions while the tokenizer is available.
+        """
+        found = self.lookup(elem)
+        return found is None or (found["estimated"] and self.exact)
+
+    def build(self, instances, num_workers=None, chunk_size=CHUNK_SIZE):
+        """
+        Tokenize the contexts of the instances that are missing from the index, in parallel, and append their records.
+
+        Args:
+            instances (Iterable[Dict]): The instances, e.g. streamed from the task file.
+            num_workers (int, optional): The number of processes. Defaults to the number of CPUs; 1 tokenizes in process.
+            chunk_size (int, optional): The number of contexts per job. Defaults to 4.
+
+        Returns:
+            Tuple[int, int]: The number of contexts tokenized, and of instances already indexed.
+        """
+        num_workers = num_workers or os.cpu_count() or 1
+        num_indexed = num_cached = 0
+        queued = set()
+
+        def jobs():
+            nonlocal num_cached
+            chunk = []
+            for elem in instances:
+                key = self.key(elem)
+                if not self.missing(elem) or key in queued:
+                    num_cached += 1
+                    continue
+                queued.add(key)
+                # Keep the spans already indexed for the other instances of the context
+                record = self.records.get(key)
+                locations = sorted(set(elem["location"]) | {int(location) for location in (record or {}).get("item_tokens", {})})
+                context = context_text(elem)
+                check_item_lines(elem, context)
+                chunk.append((key, context_digest(elem), context, locations))
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        with ResultLog(self.path, flush_every=1) as log:
+            def store(records):
+                nonlocal num_indexed
+                for record in records:
+                    self.records[record["id"]] = record
+                    log.append(record)
+                    num_indexed += 1
+
+            if num_workers == 1:
+                for chunk in jobs():
+                    store(_index_chunk(chunk, self.model))
+                return num_indexed, num_cached
+
+            with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+                pending = []
+                for chunk in jobs():
+                    pending.append(executor.submit(_index_chunk, chunk, self.model))
+                    # Bound the contexts in flight, so the file is read as fast as it is tokenized
+                    if len(pending) >= num_workers * JOBS_PER_WORKER:
+                        store(pending.pop(0).result())
+                for future in pending:
+                    store(future.result())
+        return num_indexed, num_cached
+
+
+def build_token_index(task, model, data_dir="data", num_workers=None):
+    """
+    Build or update the token index of a task file for the tokenizer of a model.
+
+    Returns:
+        Tuple[str, int, int]: The path of the index, the number of contexts tokenized, and of instances already indexed.
+    """
+    path = token_index_path(task, data_dir)
+    index = TokenIndex(path, model)
+    num_indexed, num_cached = index.build(iter_instances(find_task_file(task, data_dir)), num_workers=num_workers)
+    return path, num_indexed, num_cached
+
+
+def open_token_index(task, model, data_dir="data"):
+    """
+    Open the token index of a task file for the tokenizer of a model (empty if it was not built).
+    """
+    return TokenIndex(token_index_path(task, data_dir), model)
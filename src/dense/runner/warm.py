@@ -0,0 +1,124 @@
+"""
+Module: warm
+
+Seed the response cache from the results.json files of past runs, so that rerunning them
+(with a new metric, another save_dir, ...) costs no inference.
+
+The result directories follow the layout of eval.py and the sweeps:
+
+    {root}/{model}/{task}[_head|_tail][_{lower}-{upper}_seed{seed_num}]/results.json[.zst|.gz]
+
+The prompt of every instance is rebuilt exactly as the run built it (select_prompt and
+build_input), and its response is stored under the key the backend would look it up
+with. The generation parameters are not recorded in results.json, so they are given
+(llm_generate's defaults: temp=0.0, top_p=0.9).
+"""
+
+import os
+import re
+
+from dense.llm.llm import SINGLE_GENERATE
+from dense.storage import load_json
+from dense.storage.artifacts import find_artifact
+from .sweep import PLACEMENTS
+from .pipeline import Metric, build_input, select_prompt
+
+_SWEEP_SUFFIX = re.compile(r"_\d+-\d+_seed\d+$")
+
+
+def parse_result_dir(name):
+    """
+    Recover the task and placement of a result directory from its name.
+
+    Returns:
+        Tuple[str, str]: The task and the placement ("both", "head" or "tail"), or None if the
+        directory does not belong to a known task.
+    """
+    name = _SWEEP_SUFFIX.sub("", name)
+    for placement, suffix in (("head", "_head"), ("tail", "_tail"), ("both", "")):
+        if suffix and not name.endswith(suffix):
+            continue
+        task = name[:-len(suffix)] if suffix else name
+        if task in Metric:
+            return task, placement
+    return None
+
+
+def find_results(root="res"):
+    """
+    List the results of past runs under `root`.
+
+    Returns:
+        List[Dict[str, str]]: The model, task, placement and path of every results.json found.
+    """
+    found = []
+    if not os.path.isdir(root):
+        return found
+    for model in sorted(os.listdir(root)):
+        if model not in SINGLE_GENERATE or not os.path.isdir(os.path.join(root, model)):
+            continue
+        for name in sorted(os.listdir(os.path.join(root, model))):
+            parsed = parse_result_dir(name)
+            path = find_artifact(os.path.join(root, model, name, "results.json"))
+            if parsed is not None and path is not None:
+                found.append({"model": model, "task": parsed[0], "placement": parsed[1], "path": path})
+    return found
+
+
+def seed_results(results, model, task, placement, temp=0.0, top_p=0.9):
+    """
+    Seed the cache of a model's backend with the responses of one results.json.
+
+    Returns:
+        Tuple[int, int]: The number of responses stored, and of responses already cached. Failed
+        generations (no response) are skipped.
+    """
+    single_generate, model_name, native_n = SINGLE_GENERATE[model]
+    prompt_type = select_prompt(*PLACEMENTS[placement])
+    num_stored = num_cached = 0
+    for elem in results:
+        input_dict = build_input(elem, prompt_type, task)
+        if "llm_responses" in elem:
+            responses = elem["llm_responses"]
+            if not responses or any(response is None for response in responses):
+                continue
+            if native_n:
+                calls = [(responses, {"n": len(responses)})]
+            else:
+                calls = [(response, {"sample_id": k}) for k, response in enumerate(responses)]
+        else:
+            if elem.get("llm_response") is None:
+                continue
+            calls = [(elem["llm_response"], {})]
+
+        for value, kwargs in calls:
+            if single_generate.seed(value, input_dict, model=model_name, temp=temp, top_p=top_p, **kwargs):
+                num_stored += 1
+            else:
+                num_cached += 1
+    return num_stored, num_cached
+
+
+def warm_cache(root="res", models=None, tasks=None, temp=0.0, top_p=0.9):
+    """
+    Seed the response cache from every results.json under `root`.
+
+    Args:
+        root (str, optional): The result directory. Defaults to "res".
+        models (List[str], optional): Only these models (keys of llm_generate, e.g. "gpt"). Defaults to all.
+        tasks (List[str], optional): Only these tasks. Defaults to all.
+        temp (float, optional): The temperature the runs used. Defaults to 0.0.
+        top_p (float, optional): The top_p the runs used. Defaults to 0.9.
+
+    Returns:
+        Dict[str, Tuple[int, int]]: The (stored, already cached) counts of every results.json.
+    """
+    counts = {}
+    for run in find_results(root):
+        if (models and run["model"] not in models) or (tasks and run["task"] not in tasks):
+            continue
+        counts[run["path"]] = seed_results(
+            load_json(run["path"]), run["model"], run["task"], run["placement"], temp=temp, top_p=top_p
+        )
+        print(f"{run['path']}: {counts[run['path']][0]} responses stored, {counts[run['path']][1]} already cached.")
+    return counts
@@ -0,0 +1,11 @@
+from .codec import Codec, train_dictionary
+from .artifacts import dump_json, find_artifact, load_json
+from .cache import CacheMiss, ResponseCache, open_cache
+from .bundle import export_bundle, import_bundle, merge_bundles, verify_bundle
+from .remote import RemoteCache
+from .service import serve, start_service
+from .digests import context_digest, prompt_digests, strip_context_digest
+from .dataset import convert_to_jsonl, find_task_file, iter_instances
+from .frames import FramedDataset, convert_to_framed, open_framed
+from .columnar import ColumnarDataset, convert_to_columnar, open_columnar
+from .segments import SegmentStore, context_length, context_text, convert_to_segments, open_segment_store
@@ -0,0 +1,71 @@
+"""
+Module: artifacts
+
+JSON result artifacts, optionally compressed. A compressed artifact is written next to
+its uncompressed name with the suffix of its codec (results.json -> results.json.zst),
+and readers look the artifact up under any of these names, so compression is
+transparent to the code that reads results.
+"""
+
+import os
+import json
+
+from .codec import Codec, resolve_codec
+
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+
+def find_artifact(path):
+    """
+    Return the path under which the artifact `path` exists (plain or compressed), or None.
+    """
+    for suffix in ("", ".zst", ".gz"):
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+
+def dump_json(obj, path, compress=None, level=None, threads=-1):
+    """
+    Write a JSON artifact atomically, through a temporary file.
+
+    Args:
+        obj (Any): The JSON-serializable object.
+        path (str): The uncompressed path of the artifact, e.g. "res/gpt/table_sql_absolute/results.json".
+        compress (str, optional): None (indented JSON, as before), "zstd", "gzip" or "auto". Defaults to None.
+        level (int, optional): The compression level. Defaults to the level of the codec.
+        threads (int, optional): The number of zstd compression threads. Defaults to -1 (one per CPU).
+
+    Returns:
+        str: The path written, with the suffix of the codec.
+    """
+    codec = resolve_codec(compress) if compress is not None else "none"
+    final_path = path + SUFFIXES[codec]
+    with open(final_path + ".tmp", "wb") as file:
+        if codec == "none":
+            file.write(json.dumps(obj, indent=4).encode("utf-8"))
+        else:
+            # Indentation only inflates what the codec has to compress
+            data = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+            file.write(Codec(codec, level=level, threads=threads).compress(data))
+    os.replace(final_path + ".tmp", final_path)
+
+    # Remove the artifact written under another codec by a previous run
+    for suffix in set(SUFFIXES.values()) - {SUFFIXES[codec]}:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return final_path
+
+
+def load_json(path):
+    """
+    Read a JSON artifact written by `dump_json`, whatever its codec.
+
+    Args:
+        path (str): The uncompressed path of the artifact, or the path of a compressed variant.
+    """
+    found = path if os.path.exists(path) else find_artifact(path)
+    if found is None:
+        raise FileNotFoundError(f"No artifact found at {path} (plain or compressed).")
+    with open(found, "rb") as file:
+        return json.loads(Codec("none").decompress(file.read()))
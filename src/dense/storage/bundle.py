@@ -0,0 +1,254 @@
+"""
+Module: bundle
+
+Portable bundles of response cache entries, to share paid generations between machines
+and teammates instead of regenerating them.
+
+A bundle is a single compressed JSONL file:
+
+    {"format": "longpibench-cache-bundle", "version": 1, "created": ..., "filters": {...}}   header
+    {"sha256": "<digest of the entry>", "entry": {...}}                                     one line per entry
+    {"count": <number of entries>, "digest": "<digest of all the entry digests>"}            trailer
+
+Every entry carries its own checksum and the trailer covers the whole bundle, so a
+corrupted or truncated bundle is detected before anything is imported.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import datetime
+from fnmatch import fnmatch
+
+from .codec import DECOMPRESSION_ERRORS, open_compressed
+
+BUNDLE_FORMAT = "longpibench-cache-bundle"
+BUNDLE_VERSION = 1
+
+# Cache keys are sha256 hex digests; anything else could escape the cache directory
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def entry_digest(entry):
+    return hashlib.sha256(json.dumps(entry, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value)
+
+
+def _as_timestamp(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return datetime.datetime.fromisoformat(str(value)).timestamp()
+
+
+def make_filter(models=None, tasks=None, since=None, until=None):
+    """
+    Build a predicate selecting cache entries.
+
+    Args:
+        models (str or List[str], optional): API model names (e.g. "gpt-4o-mini"), as a list or a comma-separated
+            string. Shell-style wildcards are allowed, e.g. "qwen2.5-*". Defaults to None (all models).
+        tasks (str or List[str], optional): Task names, e.g. "table_sql_absolute", with the same syntax. Entries
+            without a task tag only match when no task filter is given. Defaults to None (all tasks).
+        since (str or float, optional): Only entries created at or after this date (ISO format, e.g. "2024-10-01",
+            or a Unix timestamp). Defaults to None.
+        until (str or float, optional): Only entries created before this date. Defaults to None.
+
+    Returns:
+        Callable[[Dict], bool]: The predicate.
+    """
+    models, tasks = _as_list(models), _as_list(tasks)
+    since, until = _as_timestamp(since), _as_timestamp(until)
+
+    def matches(entry):
+        if models is not None and not any(fnmatch(str(entry.get("model")), pattern) for pattern in models):
+            return False
+        if tasks is not None and not any(fnmatch(str(entry.get("task")), pattern) for pattern in tasks):
+            return False
+        if since is not None and entry.get("created", 0) < since:
+            return False
+        if until is not None and entry.get("created", 0) >= until:
+            return False
+        return True
+
+    return matches
+
+
+class BundleWriter:
+    """
+    Write a bundle atomically: it only appears at its path once it is complete.
+    """
+
+    def __init__(self, path, filters=None):
+        self.path = path
+        self.count = 0
+        self._digest = hashlib.sha256()
+        self._file = open_compressed(path + ".tmp", "wb")
+        self._write({
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "created": time.time(),
+            "filters": filters or {},
+        })
+
+    def _write(self, record):
+        self._file.write((json.dumps(record) + "\n").encode("utf-8"))
+
+    def add(self, entry):
+        digest = entry_digest(entry)
+        self._write({"sha256": digest, "entry": entry})
+        self._digest.update(digest.encode("ascii"))
+        self.count += 1
+
+    def close(self):
+        self._write({"count": self.count, "digest": self._digest.hexdigest()})
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self.path + ".tmp")
+
+
+def read_bundle(path, verify=True):
+    """
+    Iterate over the entries of a bundle.
+
+    With verify=True, the checksum of every entry is checked, and the trailer is checked once
+    the last entry has been read: a ValueError is raised on any mismatch, on a truncated
+    bundle or on an invalid key. Callers that must not act on a corrupted bundle should
+    consume it entirely (or call `verify_bundle`) before using its entries.
+    """
+    try:
+        yield from _read_bundle(path, verify)
+    except DECOMPRESSION_ERRORS as e:
+        raise ValueError(f"{path} is corrupted or truncated ({e}).")
+
+
+def _read_bundle(path, verify=True):
+    digest = hashlib.sha256()
+    count = 0
+    with open_compressed(path, "rb") as file:
+        try:
+            header = json.loads(file.readline())
+        except json.JSONDecodeError:
+            raise ValueError(f"{path} is not a cache bundle, or is truncated.")
+        if header.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"{path} is not a cache bundle.")
+        if header.get("version") != BUNDLE_VERSION:
+            raise ValueError(f"{path} has version {header.get('version')}, expected {BUNDLE_VERSION}.")
+
+        trailer = None
+        for line in file:
+            if trailer is not None:
+                raise ValueError(f"{path} has data after its trailer.")
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f"{path} is corrupted after {count} entries.")
+            if "entry" not in record:
+                trailer = record
+                continue
+            entry = record["entry"]
+            if verify:
+                if entry_digest(entry) != record.get("sha256"):
+                    raise ValueError(f"{path}: the checksum of entry {count} does not match.")
+                if not KEY_PATTERN.match(str(entry.get("key"))):
+                    raise ValueError(f"{path}: entry {count} has an invalid key {entry.get('key')!r}.")
+                digest.update(record["sha256"].encode("ascii"))
+            count += 1
+            yield entry
+
+    if verify:
+        if trailer is None:
+            raise ValueError(f"{path} is truncated: {count} entries and no trailer.")
+        if trailer.get("count") != count or trailer.get("digest") != digest.hexdigest():
+            raise ValueError(f"{path}: the trailer does not match its {count} entries.")
+
+
+def verify_bundle(path):
+    """
+    Check the integrity of a bundle.
+
+    Returns:
+        int: The number of entries.
+    """
+    return sum(1 for _ in read_bundle(path))
+
+
+def export_bundle(cache, path, models=None, tasks=None, since=None, until=None):
+    """
+    Export the cache entries selected by the filters (see `make_filter`) into a bundle.
+
+    Returns:
+        int: The number of entries exported.
+    """
+    filters = {"models": _as_list(models), "tasks": _as_list(tasks), "since": since, "until": until}
+    matches = make_filter(models, tasks, since, until)
+    with BundleWriter(path, filters) as writer:
+        for key in cache.keys():
+            entry = cache.get(key)
+            if entry is not None and matches(entry):
+                writer.add(entry)
+    return writer.count
+
+
+def import_bundle(cache, path, overwrite=False, models=None, tasks=None, since=None, until=None):
+    """
+    Import the entries of a bundle into a cache, after checking the integrity of the whole bundle.
+
+    Args:
+        cache (ResponseCache): The cache to import into.
+        path (str): The path of the bundle.
+        overwrite (bool, optional): Replace the entries the cache already has. Defaults to False.
+        models, tasks, since, until: Only import the selected entries, see `make_filter`.
+
+    Returns:
+        Tuple[int, int]: The number of entries imported, and of entries skipped because the cache had them.
+    """
+    verify_bundle(path)
+    matches = make_filter(models, tasks, since, until)
+    num_imported = num_skipped = 0
+    for entry in read_bundle(path, verify=False):
+        if not matches(entry):
+            continue
+        if not overwrite and os.path.exists(cache.path(entry["key"])):
+            num_skipped += 1
+            continue
+        cache.put_entry(entry)
+        num_imported += 1
+    return num_imported, num_skipped
+
+
+def merge_bundles(paths, output):
+    """
+    Merge bundles into one, after checking each of them. An entry found in several bundles
+    is kept from the first bundle that has it.
+
+    Returns:
+        int: The number of entries in the merged bundle.
+    """
+    for path in paths:
+        verify_bundle(path)
+    seen = set()
+    with BundleWriter(output, {"merged": [os.path.basename(path) for path in paths]}) as writer:
+        for path in paths:
+            for entry in read_bundle(path, verify=False):
+                if entry["key"] not in seen:
+                    seen.add(entry["key"])
+                    writer.add(entry)
+    return writer.count
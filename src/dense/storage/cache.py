@@ -0,0 +1,555 @@
+"""
+Module: cache
+
+A compressed, content-addressed cache of LLM responses, used by the backends in place
+of joblib's Memory:
+
+    memory = ResponseCache(".cache")
+
+    @memory.cache
+    def gpt_single_generate(input_dict, model="gpt-4o-mini", temp=0.0, ...):
+        ...
+
+The key of a call is a digest of the function name and of all its arguments (defaults
+included). When the input dictionary carries the digests of its prompt in its 'meta'
+tags (see dense.storage.digests.prompt_digests), they stand in for the prompt, so the
+key costs the same for a 1K and a 256K-token prompt. Entries cached before prompt digests
+were used are keyed by the full prompt: with LLM_CACHE_LEGACY_KEYS=1, a miss is looked up
+again under that key (hashing the prompt) and a hit is copied to the digest key, so each
+legacy entry is migrated on its first use. Each entry is one small file, {location}/responses/{key[:2]}/{key}, holding
+the compressed JSON of the response and its metadata (function, model, task, parameters
+and creation time); the prompt itself is not stored. The task is read from the optional
+'meta' tags of the input dictionary, which are not part of the key.
+
+Entries are compressed with zstd when it is installed (gzip otherwise), or as set by
+the LLM_CACHE_CODEC environment variable ("zstd", "gzip", "none"). Once the cache holds
+enough entries, `train_dictionary` trains a zstd dictionary on them: new entries are
+compressed with the latest dictionary, and every dictionary ever trained is kept in
+{location}/dictionaries/ so older entries stay readable.
+
+The size, model, task, last access and hit count of every entry are kept in an index
+({location}/index.sqlite, see index.py), which bounds the cache:
+
+    LLM_CACHE_MAX_SIZE="20G"                        # evict once the entries exceed 20 GiB
+    LLM_CACHE_EVICTION="lru"                        # or "lfu"
+    LLM_CACHE_TTL="gpt-4o-mini=30d,qwen2.5-*=7d"    # per model, first matching pattern wins
+
+Expired entries are misses, and are deleted together with evicted ones by `gc`, which
+runs while the cache is in use (and automatically when a run exceeds the size cap).
+
+Responses cached by joblib's Memory (older versions) are left in {location}/joblib/,
+which this cache does not read: `import_joblib` copies them into it, and opening a cache
+that still holds them warns once.
+"""
+
+import os
+import ast
+import json
+import time
+import uuid
+import pickle
+import random
+import hashlib
+import inspect
+import functools
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from .codec import Codec, dictionary_id, train_dictionary as train_zstd_dictionary
+from .index import POLICIES, CacheIndex, parse_size, parse_ttls, ttl_for
+
+# Puts between two checks of the size cap
+SIZE_CHECK_EVERY = 256
+# After an eviction, the cache is brought down to this fraction of its size cap
+LOW_WATER_MARK = 0.9
+# Temporary files older than this (in seconds) were left by crashed writers
+STALE_TMP_SECONDS = 3600
+# Directory of the responses cached by joblib's Memory, and the marker written once they are imported
+JOBLIB_DIR = "joblib"
+JOBLIB_IMPORTED = ".imported"
+
+# Signature of every cached function, by name, used to bind the arguments of imported calls
+_signatures = {}
+
+
+def legacy_keys_enabled():
+    """
+    Whether misses are looked up again under their legacy full-prompt key (LLM_CACHE_LEGACY_KEYS=1).
+    """
+    return os.environ.get("LLM_CACHE_LEGACY_KEYS", "0").lower() in ("1", "true", "yes")
+
+
+class CacheMiss(KeyError):
+    """
+    Raised by `lookup` when a call is not cached. Its `key` is the key of the call.
+    """
+
+    def __init__(self, key):
+        super().__init__(key)
+        self.key = key
+
+
+class BaseCache:
+    """
+    Base class of the response caches: the key of a call and the caching decorator.
+
+    Subclasses store the entries and implement `get(key)` and `put_entry(entry)`, and may
+    implement `prefetch(keys)` to fetch many entries at once before they are looked up.
+    """
+
+    def key(self, function_name, arguments):
+        """
+        Return the key of a call: a digest of the function name and its bound arguments.
+        """
+        payload = json.dumps({"function": function_name, "arguments": arguments}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put_entry(self, entry):
+        raise NotImplementedError
+
+    def put(self, key, value, metadata=None):
+        """
+        Store a value and its metadata under a key.
+        """
+        entry = {"key": key, "created": time.time(), **(metadata or {}), "value": value}
+        self.put_entry(entry)
+
+    def prefetch(self, keys):
+        pass
+
+    def cache(self, func):
+        """
+        Decorator caching the results of `func`, like joblib's `Memory.cache`.
+
+        The decorated function also exposes `func` (the undecorated function),
+        `cache_key(*args, **kwargs)` (the key a call would be stored under),
+        `prefetch(calls)`, which prefetches the entries of a list of (args, kwargs) calls,
+        `lookup(*args, **kwargs)`, which returns the cached result of a call without ever calling
+        `func` (raising CacheMiss if there is none), and `seed(value, *args, **kwargs)`, which
+        stores `value` as the result of a call.
+        """
+        signature = inspect.signature(func)
+        function_name = f"{func.__module__}.{func.__qualname__}"
+        _signatures[function_name] = signature
+
+        def bind(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            # The 'meta' tags of an input (e.g. its task) describe the entry but are not part of its key
+            input_dict = arguments.get("input_dict")
+            tags = {}
+            if isinstance(input_dict, dict) and "meta" in input_dict:
+                tags = input_dict["meta"]
+                arguments["input_dict"] = {name: arg for name, arg in input_dict.items() if name != "meta"}
+            return arguments, tags
+
+        def call_key(arguments, tags):
+            if "prompt" in tags:
+                arguments = dict(arguments, input_dict={"prompt": tags["prompt"]})
+            return self.key(function_name, arguments)
+
+        def find(key, arguments, tags):
+            entry = self.get(key)
+            if entry is None and "prompt" in tags and legacy_keys_enabled():
+                # Entries cached before prompt digests were used are keyed by the full prompt: hash it only
+                # on a miss, and copy the entry found to the digest key
+                entry = self.get(self.key(function_name, arguments))
+                if entry is not None:
+                    self.put_entry(dict(entry, key=key))
+            return entry
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments, tags = bind(args, kwargs)
+            key = call_key(arguments, tags)
+            entry = find(key, arguments, tags)
+            if entry is not None:
+                return entry["value"]
+            value = func(*args, **kwargs)
+            self.put(key, value, metadata(arguments, tags))
+            return value
+
+        def lookup(*args, **kwargs):
+            arguments, tags = bind(args, kwargs)
+            key = call_key(arguments, tags)
+            entry = find(key, arguments, tags)
+            if entry is None:
+                raise CacheMiss(key)
+            return entry["value"]
+
+        def metadata(arguments, tags):
+            params = {name: arg for name, arg in arguments.items() if name not in ("input_dict", "model")}
+            return {"function": function_name, "model": arguments.get("model"), "task": tags.get("task"), "params": params}
+
+        def seed(value, *args, **kwargs):
+            """
+            Store `value` as the result of a call, unless the call is cached already. Returns True if it was stored.
+            """
+            arguments, tags = bind(args, kwargs)
+            key = call_key(arguments, tags)
+            if self.get(key) is not None:
+                return False
+            self.put(key, value, metadata(arguments, tags))
+            return True
+
+        wrapper.func = func
+        wrapper.cache_key = lambda *args, **kwargs: call_key(*bind(args, kwargs))
+        wrapper.seed = seed
+        wrapper.lookup = lookup
+        wrapper.prefetch = lambda calls: self.prefetch([wrapper.cache_key(*args, **kwargs) for args, kwargs in calls])
+        return wrapper
+
+
+class ResponseCache(BaseCache):
+    """
+    Compressed on-disk cache of function results, keyed by a digest of the call.
+
+    Args:
+        location (str, optional): The cache directory. Defaults to ".cache".
+        codec (str, optional): "zstd", "gzip", "none" or "auto". Defaults to LLM_CACHE_CODEC, or "auto".
+        level (int, optional): The compression level. Defaults to the level of the codec.
+        max_size (int or str, optional): The size cap of the entries, e.g. "20G". Defaults to LLM_CACHE_MAX_SIZE,
+            or no cap.
+        policy (str, optional): The eviction policy, "lru" or "lfu". Defaults to LLM_CACHE_EVICTION, or "lru".
+        ttl (str or Dict[str, str], optional): Per-model TTLs, e.g. "gpt-4o-mini=30d,*=90d". Defaults to
+            LLM_CACHE_TTL, or no expiry.
+    """
+
+    def __init__(self, location=".cache", codec=None, level=None, max_size=None, policy=None, ttl=None):
+        self.location = location
+        self.entries_dir = os.path.join(location, "responses")
+        self.dictionaries_dir = os.path.join(location, "dictionaries")
+        self.codec_name = codec or os.environ.get("LLM_CACHE_CODEC", "auto")
+        self.level = level
+        self.max_size = parse_size(max_size or os.environ.get("LLM_CACHE_MAX_SIZE"))
+        self.policy = policy or os.environ.get("LLM_CACHE_EVICTION", "lru")
+        assert self.policy in POLICIES, f"Unknown eviction policy {self.policy}, expected one of {POLICIES}."
+        self.ttls = parse_ttls(ttl or os.environ.get("LLM_CACHE_TTL"))
+        self._codec = None
+        self._index = None
+        self._num_puts = 0
+        self._gc_lock = threading.Lock()
+
+    @property
+    def codec(self):
+        # Built on first use, so the dictionaries are read once per process rather than at import
+        if self._codec is None:
+            self._codec = self._load_codec()
+        return self._codec
+
+    def _load_codec(self):
+        dictionaries, latest = {}, None
+        if os.path.isdir(self.dictionaries_dir):
+            paths = sorted(
+                (os.path.join(self.dictionaries_dir, name) for name in os.listdir(self.dictionaries_dir)),
+                key=os.path.getmtime,
+            )
+            for path in paths:
+                with open(path, "rb") as file:
+                    latest = dictionaries[os.path.basename(path)] = file.read()
+        return Codec(self.codec_name, level=self.level, dictionary=latest, dictionaries=dictionaries)
+
+    @property
+    def index(self):
+        if self._index is None:
+            os.makedirs(self.location, exist_ok=True)
+            self._index = CacheIndex(os.path.join(self.location, "index.sqlite"))
+        return self._index
+
+    def path(self, key):
+        return os.path.join(self.entries_dir, key[:2], key)
+
+    def _read(self, key):
+        # The entry as stored, expired or not, without recording an access
+        try:
+            with open(self.path(key), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(self.codec.decompress(data))
+
+    def get(self, key):
+        """
+        Return the entry stored under a key (a dictionary with its 'value' and metadata), or None.
+        """
+        entry = self._read(key)
+        if entry is None or self._expired(entry):
+            return None
+        self.index.record_access(key)
+        return entry
+
+    def _expired(self, entry, now=None):
+        ttl = ttl_for(self.ttls, entry.get("model"))
+        return ttl is not None and entry.get("created", 0) + ttl < (now or time.time())
+
+    def _write(self, entry):
+        # Concurrent writers of the same key are safe: every write goes to a temporary file
+        # that atomically replaces the entry
+        path = self.path(entry["key"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        data = self.codec.compress(json.dumps(entry).encode("utf-8"))
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def put_entry(self, entry):
+        size = self._write(entry)
+        self.index.record_put(entry["key"], entry.get("model"), entry.get("task"), size, entry.get("created", time.time()))
+
+        self._num_puts += 1
+        if self.max_size and self._num_puts % SIZE_CHECK_EVERY == 0 and self.index.total_size() > self.max_size:
+            # One thread evicts while the others keep going
+            if self._gc_lock.acquire(blocking=False):
+                try:
+                    self.gc(reconcile=False)
+                finally:
+                    self._gc_lock.release()
+
+    def keys(self):
+        """
+        Iterate over the keys of all the entries.
+        """
+        if not os.path.isdir(self.entries_dir):
+            return
+        for prefix in sorted(os.listdir(self.entries_dir)):
+            for name in sorted(os.listdir(os.path.join(self.entries_dir, prefix))):
+                if not name.endswith(".tmp"):
+                    yield name
+
+    def _reconcile(self, num_workers):
+        """
+        Bring the index in line with the entry files: index the files it misses (e.g. entries written before
+        it existed), forget the entries whose file is gone and delete stale temporary files.
+        """
+        files = {}
+        now = time.time()
+        if os.path.isdir(self.entries_dir):
+            for prefix in os.scandir(self.entries_dir):
+                for file in os.scandir(prefix.path):
+                    if not file.name.endswith(".tmp"):
+                        files[file.name] = file.stat().st_size
+                    elif now - file.stat().st_mtime > STALE_TMP_SECONDS:
+                        self._remove_file(file.path)
+        indexed = self.index.sizes()
+        self.index.remove([key for key in indexed if key not in files])
+
+        def index_file(key):
+            try:
+                with open(self.path(key), "rb") as file:
+                    entry = json.loads(self.codec.decompress(file.read()))
+            except FileNotFoundError:
+                return
+            self.index.record_put(key, entry.get("model"), entry.get("task"), files[key], entry.get("created", now))
+
+        unindexed = [key for key, size in files.items() if indexed.get(key) != size]
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(index_file, unindexed))
+        return len(unindexed)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def gc(self, max_size=None, policy=None, ttl=None, num_workers=8, reconcile=True):
+        """
+        Delete the expired entries, then evict entries until the cache fits in its size cap (down to
+        LOW_WATER_MARK of it). Safe to run while other processes use the cache: an entry deleted under a
+        reader is a miss.
+
+        Args:
+            max_size (int or str, optional): The size cap. Defaults to the cap of the cache.
+            policy (str, optional): "lru" or "lfu". Defaults to the policy of the cache.
+            ttl (str or Dict[str, str], optional): Per-model TTLs. Defaults to the TTLs of the cache.
+            num_workers (int, optional): The number of threads deleting files. Defaults to 8.
+            reconcile (bool, optional): Rebuild the index from the entry files first. Defaults to True.
+
+        Returns:
+            Dict[str, int]: The number of entries indexed, expired and evicted, and the bytes reclaimed.
+        """
+        max_size = parse_size(max_size) if max_size is not None else self.max_size
+        policy = policy or self.policy
+        ttls = parse_ttls(ttl) if ttl is not None else self.ttls
+
+        self.index.flush()
+        num_indexed = self._reconcile(num_workers) if reconcile else 0
+        size_before = self.index.total_size()
+
+        expired = self.index.expired(ttls)
+        self._delete(expired, num_workers)
+        evicted = []
+        if max_size and self.index.total_size() > max_size:
+            evicted = self.index.victims(policy, self.index.total_size() - int(max_size * LOW_WATER_MARK))
+            self._delete(evicted, num_workers)
+        return {
+            "indexed": num_indexed,
+            "expired": len(expired),
+            "evicted": len(evicted),
+            "reclaimed_bytes": size_before - self.index.total_size(),
+        }
+
+    def _delete(self, keys, num_workers):
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(lambda key: self._remove_file(self.path(key)), keys))
+        self.index.remove(keys)
+
+    def stats(self):
+        """
+        Return the number of entries, their size and their hits, by (model, task).
+        """
+        self.index.flush()
+        return self.index.stats()
+
+    def train_dictionary(self, dict_size=112640, max_samples=5000, seed=0):
+        """
+        Train a zstd dictionary on a random sample of the entries and use it for new entries.
+
+        Returns:
+            str: The path of the dictionary.
+        """
+        keys = list(self.keys())
+        random.Random(seed).shuffle(keys)
+        samples = []
+        for key in keys[:max_samples]:
+            entry = self._read(key)
+            if entry is not None:
+                samples.append(json.dumps(entry).encode("utf-8"))
+        assert samples, f"The cache in {self.location} has no entries to train a dictionary on."
+
+        dictionary = train_zstd_dictionary(samples, dict_size)
+        os.makedirs(self.dictionaries_dir, exist_ok=True)
+        path = os.path.join(self.dictionaries_dir, str(dictionary_id(dictionary)))
+        with open(path, "wb") as file:
+            file.write(dictionary)
+        self._codec = None
+        return path
+
+    def recompress(self):
+        """
+        Rewrite every entry with the current codec and dictionary, e.g. after training a dictionary. Entries keep
+        their creation time and access statistics, expired ones included (gc deletes them).
+
+        Returns:
+            Tuple[int, int]: The total size of the entries in bytes, before and after.
+        """
+        before = after = 0
+        for key in list(self.keys()):
+            try:
+                size = os.path.getsize(self.path(key))
+            except FileNotFoundError:
+                continue
+            entry = self._read(key)
+            if entry is None:
+                # Deleted by a concurrent gc
+                continue
+            before += size
+            size = self._write(entry)
+            self.index.record_size(key, size)
+            after += size
+        return before, after
+
+    def joblib_entries(self):
+        """
+        Iterate over the calls cached by joblib's Memory in {location}/joblib/, as laid out by joblib:
+        {module path}/{function}/{call hash}/ holding output.pkl (the pickled result) and metadata.json (the repr of
+        every argument, defaults included).
+
+        Yields:
+            Tuple[str, Dict, Any, float]: The function name, the arguments, the result and the time of the call. Calls
+            whose arguments cannot be read back from their repr are yielded with None arguments.
+        """
+        root = os.path.join(self.location, JOBLIB_DIR)
+        for dirpath, _, filenames in os.walk(root):
+            if "output.pkl" not in filenames or "metadata.json" not in filenames:
+                continue
+            function_name = os.path.relpath(os.path.dirname(dirpath), root).replace(os.sep, ".")
+            with open(os.path.join(dirpath, "metadata.json")) as file:
+                metadata = json.load(file)
+            try:
+                arguments = {name: ast.literal_eval(arg) for name, arg in metadata["input_args"].items()}
+            except (KeyError, ValueError, SyntaxError):
+                arguments = None
+            # joblib pickles results that hold no numpy arrays with the standard pickle protocol
+            with open(os.path.join(dirpath, "output.pkl"), "rb") as file:
+                value = pickle.load(file)
+            created = metadata.get("time") or os.path.getmtime(os.path.join(dirpath, "output.pkl"))
+            yield function_name, arguments, value, created
+
+    def import_joblib(self, overwrite=False):
+        """
+        Copy the responses cached by joblib's Memory (see `joblib_entries`) into this cache, under the key their call
+        has here. The arguments are bound to the signature of the cached function when it is loaded, so parameters
+        added since (e.g. n=1) take their defaults. The entries are keyed by the full prompt, as entries written
+        before prompt digests were used: runs find them with LLM_CACHE_LEGACY_KEYS=1.
+
+        Returns:
+            Tuple[int, int]: The number of entries imported, and of calls skipped (already cached or unreadable).
+        """
+        num_imported = num_skipped = 0
+        for function_name, arguments, value, created in self.joblib_entries():
+            if arguments is None:
+                num_skipped += 1
+                continue
+            signature = _signatures.get(function_name)
+            if signature is not None:
+                bound = signature.bind_partial(**arguments)
+                bound.apply_defaults()
+                arguments = dict(bound.arguments)
+            key = self.key(function_name, arguments)
+            if not overwrite and self._read(key) is not None:
+                num_skipped += 1
+                continue
+            params = {name: arg for name, arg in arguments.items() if name not in ("input_dict", "model")}
+            metadata = {"function": function_name, "model": arguments.get("model"), "task": None, "params": params}
+            self.put_entry({"key": key, "created": created, **metadata, "value": value})
+            num_imported += 1
+        os.makedirs(os.path.join(self.location, JOBLIB_DIR), exist_ok=True)
+        with open(os.path.join(self.location, JOBLIB_DIR, JOBLIB_IMPORTED), "w") as file:
+            file.write(f"{num_imported}\n")
+        return num_imported, num_skipped
+
+    def check_legacy(self):
+        """
+        Warn if the cache directory holds responses cached by joblib that were never imported.
+        """
+        root = os.path.join(self.location, JOBLIB_DIR)
+        if os.path.isdir(root) and not os.path.exists(os.path.join(root, JOBLIB_IMPORTED)):
+            warnings.warn(
+                f"{root} holds responses cached by joblib (older versions), which are not read any more: "
+                f"import them with python eval/cache.py import_joblib --cache_dir {self.location}, then run with "
+                f"LLM_CACHE_LEGACY_KEYS=1 to use them"
+            )
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_cache(location=".cache"):
+    """
+    Open the response cache of the backends: the shared cache service at LLM_CACHE_URL if it
+    is set (see service.py), the on-disk cache in `location` otherwise.
+
+    All the backends of a process share one cache (and its index, size cap and LRU).
+    """
+    url = os.environ.get("LLM_CACHE_URL")
+    with _caches_lock:
+        name = url or os.path.abspath(location)
+        if name not in _caches:
+            if url:
+                from .remote import RemoteCache
+
+                _caches[name] = RemoteCache(url)
+            else:
+                _caches[name] = ResponseCache(location)
+                _caches[name].check_legacy()
+        return _caches[name]
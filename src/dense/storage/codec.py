@@ -0,0 +1,196 @@
+"""
+Module: codec
+
+Compression of cached responses and result artifacts.
+
+zstd (through the optional `zstandard` package) is used when it is installed, gzip
+from the standard library otherwise. Compressed data is self-describing: the codec
+is recognized from the magic number of the frame, and a zstd frame records the id
+of the dictionary it was compressed with. Uncompressed JSON is read back as is, so
+files written with any codec (or none) can always be read.
+
+Small, similar payloads such as cached responses compress much better with a zstd
+dictionary trained on samples of them (see `train_dictionary`).
+"""
+
+import io
+import gzip
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODECS = ("zstd", "gzip", "none")
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Errors raised when reading corrupted or truncated compressed data
+DECOMPRESSION_ERRORS = (EOFError, OSError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+# Default compression levels: fast enough to be transparent, much smaller than raw JSON
+DEFAULT_LEVELS = {"zstd": 3, "gzip": 6}
+
+
+def default_codec():
+    """
+    Return "zstd" when the zstandard package is installed, "gzip" otherwise.
+    """
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def resolve_codec(codec):
+    """
+    Resolve "auto" (or None) to the default codec and check that the codec is available.
+    """
+    if codec in (None, "auto"):
+        return default_codec()
+    assert codec in CODECS, f"Unknown codec {codec}, expected one of {CODECS} or 'auto'."
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("The zstd codec requires the zstandard package: pip install zstandard")
+    return codec
+
+
+def detect_codec(data):
+    """
+    Recognize the codec of a payload from its magic number.
+    """
+    if data[:4] == ZSTD_MAGIC:
+        return "zstd"
+    if data[:2] == GZIP_MAGIC:
+        return "gzip"
+    return "none"
+
+
+class Codec:
+    """
+    Compress and decompress payloads with one codec, and an optional zstd dictionary.
+
+    Args:
+        codec (str, optional): "zstd", "gzip", "none" or "auto". Defaults to "auto".
+        level (int, optional): The compression level. Defaults to DEFAULT_LEVELS[codec].
+        dictionary (bytes, optional): A zstd dictionary used to compress. Defaults to None.
+        dictionaries (Dict[int, bytes], optional): The zstd dictionaries that may be needed to decompress,
+            keyed by dictionary id. The compression dictionary is always included. Defaults to None.
+        threads (int, optional): The number of zstd compression threads, -1 for one per CPU. Only worth it
+            for large payloads. Defaults to 0 (compress in the calling thread).
+
+    zstd compressors are not thread-safe, and preparing one with a dictionary is costly, so
+    every thread reuses its own.
+    """
+
+    def __init__(self, codec="auto", level=None, dictionary=None, dictionaries=None, threads=0):
+        self.codec = resolve_codec(codec)
+        self.level = level if level is not None else DEFAULT_LEVELS.get(self.codec)
+        self.threads = threads
+        self.dictionaries = {}
+        self.dictionary = None
+        self._local = threading.local()
+        if zstandard is not None:
+            for data in (dictionaries or {}).values():
+                self._add_dictionary(data)
+            if dictionary is not None and self.codec == "zstd":
+                self.dictionary = self._add_dictionary(dictionary)
+
+    def _add_dictionary(self, data):
+        dictionary = zstandard.ZstdCompressionDict(data)
+        self.dictionaries[dictionary.dict_id()] = dictionary
+        return dictionary
+
+    def _compressor(self):
+        if not hasattr(self._local, "compressor"):
+            kwargs = {"level": self.level, "threads": self.threads}
+            if self.dictionary is not None:
+                kwargs["dict_data"] = self.dictionary
+            self._local.compressor = zstandard.ZstdCompressor(**kwargs)
+        return self._local.compressor
+
+    def _decompressor(self, dict_id):
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if dict_id not in decompressors:
+            kwargs = {}
+            if dict_id:
+                assert dict_id in self.dictionaries, f"The zstd dictionary {dict_id} needed to read this data is missing."
+                kwargs["dict_data"] = self.dictionaries[dict_id]
+            decompressors[dict_id] = zstandard.ZstdDecompressor(**kwargs)
+        return decompressors[dict_id]
+
+    def compress(self, data):
+        if self.codec == "zstd":
+            return self._compressor().compress(data)
+        if self.codec == "gzip":
+            return gzip.compress(data, compresslevel=self.level, mtime=0)
+        return data
+
+    def decompress(self, data):
+        codec = detect_codec(data)
+        if codec == "gzip":
+            return gzip.decompress(data)
+        if codec == "none":
+            return data
+        if zstandard is None:
+            raise ImportError("Reading zstd data requires the zstandard package: pip install zstandard")
+        decompressor = self._decompressor(zstandard.get_frame_parameters(data).dict_id)
+        # A streaming reader also handles frames that do not record their content size
+        with decompressor.stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+            return reader.read()
+
+
+def open_compressed(path, mode="rb", codec="auto", level=None):
+    """
+    Open a compressed file as a binary stream, e.g. to write or read a large JSONL file line by line.
+
+    Args:
+        path (str): The path of the file.
+        mode (str, optional): "rb" or "wb". Defaults to "rb".
+        codec (str, optional): The codec used to write; when reading, it is detected from the data. Defaults to "auto".
+        level (int, optional): The compression level. Defaults to the level of the codec.
+
+    Returns:
+        A binary file object, to be closed by the caller (or used as a context manager).
+    """
+    assert mode in ("rb", "wb"), f"Unsupported mode {mode}, expected 'rb' or 'wb'."
+    if mode == "wb":
+        codec = resolve_codec(codec)
+        level = level if level is not None else DEFAULT_LEVELS.get(codec)
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=level).stream_writer(open(path, "wb"))
+        if codec == "gzip":
+            return gzip.open(path, "wb", compresslevel=level)
+        return open(path, "wb")
+
+    with open(path, "rb") as file:
+        codec = detect_codec(file.read(4))
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading zstd data requires the zstandard package: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+        return io.BufferedReader(reader)
+    return open(path, "rb")
+
+
+def train_dictionary(samples, dict_size=112640):
+    """
+    Train a zstd dictionary on sample payloads (e.g. uncompressed cache entries).
+
+    Args:
+        samples (List[bytes]): The samples; a few hundred or more give a useful dictionary.
+        dict_size (int, optional): The maximum size of the dictionary in bytes. Defaults to 110 KiB.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    if zstandard is None:
+        raise ImportError("Training a zstd dictionary requires the zstandard package: pip install zstandard")
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
+
+
+def dictionary_id(data):
+    """
+    Return the id a zstd dictionary is recorded under in the frames compressed with it.
+    """
+    return zstandard.ZstdCompressionDict(data).dict_id()
@@ -0,0 +1,265 @@
+"""
+Module: columnar
+
+Columnar copies of the task files (Parquet, through pyarrow), in two parts:
+
+    data/{task}.meta.parquet    one small row per instance: the fields the slices are selected
+                                on (METADATA_FIELDS, e.g. token_level and seed_id), the seed
+                                number parsed once from seed_id, and the row group of the
+                                instance in the text file
+    data/{task}.text.parquet    the other fields (context, question, answers, prompts), in row
+                                groups of about ROW_GROUP_BYTES bytes, each of a single token
+                                level
+
+Selecting a slice reads the metadata file only, filters it with vectorized comparisons
+(no per-instance parsing or seed_id splitting), and then reads the row groups of the
+text file that hold a selected instance and nothing else. The metadata file is the
+row-group index of the text file. It also records the name, size and modification time
+of the data file converted: once that file changes, the columnar copy is stale and the
+loaders ignore it (see `open_columnar`) until it is converted again.
+
+pyarrow is optional: without it, the JSON and JSONL task files (see dataset.py) are used.
+"""
+
+import os
+import re
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from .dataset import iter_instances
+
+# Fields kept in the metadata file, when the instances have them
+METADATA_FIELDS = ("uuid", "token_level", "seed_id", "level", "location", "density", "range_level", "answer_locations")
+# Approximate size of a row group of the text file, before compression
+ROW_GROUP_BYTES = 32 * 2**20
+# Key of the field layout in the Parquet schema metadata
+SCHEMA_KEY = b"longpibench"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The columnar dataset format requires pyarrow: pip install pyarrow")
+
+
+def columnar_paths(base):
+    """
+    Return the metadata and text paths of a columnar task, e.g. base="data/table_sql_absolute".
+    """
+    return base + ".meta.parquet", base + ".text.parquet"
+
+
+def source_record(path):
+    """
+    Return the name, size and modification time of a data file, as recorded by `convert_to_columnar`.
+    """
+    stat = os.stat(path)
+    return {"file": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _column(values):
+    """
+    Build an Arrow column, falling back to JSON strings for values of mixed or nested types Arrow cannot infer.
+
+    Returns:
+        Tuple[pyarrow.Array, bool]: The column, and whether its values are JSON-encoded.
+    """
+    try:
+        return pa.array(values), False
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([json.dumps(value) for value in values], type=pa.large_string()), True
+
+
+def convert_to_columnar(path, output=None, row_group_bytes=ROW_GROUP_BYTES, compression="zstd"):
+    """
+    Convert a data file (JSON or JSONL, plain or compressed) to the columnar format, streaming.
+
+    Args:
+        path (str): The data file, e.g. "data/table_sql_absolute.json".
+        output (str, optional): The base path of the columnar files. Defaults to `path` without its extensions.
+        row_group_bytes (int, optional): The approximate size of a row group of the text file. Defaults to 32 MiB.
+        compression (str, optional): The Parquet compression codec. Defaults to "zstd".
+
+    Returns:
+        Tuple[str, str, int]: The metadata path, the text path and the number of instances.
+    """
+    _require_pyarrow()
+    base = output or re.sub(r"\.jsonl?(\.zst|\.gz)?$", "", path)
+    meta_path, text_path = columnar_paths(base)
+    # Recorded before reading, so a data file modified during the conversion leaves a stale copy
+    source = source_record(path)
+
+    fields = text_fields = text_schema = writer = None
+    json_fields = set()
+    meta_rows, num_groups = [], 0
+    # One pending row group per token level, so a slice of some levels reads none of the groups of the others
+    groups, group_bytes = {}, {}
+
+    def flush(token_level):
+        nonlocal num_groups
+        group = groups.pop(token_level, [])
+        group_bytes.pop(token_level, None)
+        if group:
+            columns = {"row": [row for row, _ in group]}
+            columns.update({field: [values[field] for _, values in group] for field in text_fields})
+            writer.write_table(pa.Table.from_pydict(columns, schema=text_schema), row_group_size=len(group))
+            for row, _ in group:
+                meta_rows[row]["row_group"] = num_groups
+            num_groups += 1
+
+    try:
+        for row, elem in enumerate(iter_instances(path)):
+            if fields is None:
+                # The layout is that of the first instance: strings are stored as is, other values as JSON
+                fields = list(elem)
+                text_fields = [field for field in fields if field not in METADATA_FIELDS]
+                json_fields = {field for field in text_fields if not isinstance(elem[field], str)}
+                text_schema = pa.schema(
+                    [("row", pa.int64())] + [(field, pa.large_string()) for field in text_fields],
+                    metadata={SCHEMA_KEY: json.dumps({"fields": fields, "json_fields": sorted(json_fields)})},
+                )
+                writer = pq.ParquetWriter(text_path + ".tmp", text_schema, compression=compression, use_dictionary=False)
+            if set(elem) != set(fields):
+                raise ValueError(f"Instance {row} of {path} has the fields {sorted(elem)}, expected {sorted(fields)}.")
+
+            meta = {field: elem[field] for field in fields if field in METADATA_FIELDS}
+            meta["seed"] = int(elem["seed_id"].split("_")[-1])
+            meta["row"], meta["row_group"] = row, None
+            meta_rows.append(meta)
+
+            values = {}
+            for field in text_fields:
+                if field in json_fields:
+                    values[field] = json.dumps(elem[field])
+                elif isinstance(elem[field], str):
+                    values[field] = elem[field]
+                else:
+                    raise ValueError(f"Field {field} of instance {row} of {path} is not a string, unlike the first instance.")
+            token_level = elem["token_level"]
+            groups.setdefault(token_level, []).append((row, values))
+            group_bytes[token_level] = group_bytes.get(token_level, 0) + sum(len(value) for value in values.values())
+            if group_bytes[token_level] >= row_group_bytes:
+                flush(token_level)
+        if writer is None:
+            raise ValueError(f"{path} holds no instance.")
+        for token_level in list(groups):
+            flush(token_level)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    columns, meta_json_fields = {}, []
+    for name in meta_rows[0]:
+        columns[name], encoded = _column([meta[name] for meta in meta_rows])
+        if encoded:
+            meta_json_fields.append(name)
+    metadata = {SCHEMA_KEY: json.dumps({"fields": fields, "json_fields": meta_json_fields, "source": source})}
+    pq.write_table(pa.table(columns).replace_schema_metadata(metadata), meta_path + ".tmp", compression=compression)
+
+    os.replace(text_path + ".tmp", text_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta_path, text_path, len(meta_rows)
+
+
+class ColumnarDataset:
+    """
+    A task in the columnar format, read slice by slice.
+
+    Args:
+        base (str): The base path of the columnar files, e.g. "data/table_sql_absolute".
+    """
+
+    def __init__(self, base):
+        _require_pyarrow()
+        meta_path, text_path = columnar_paths(base)
+        self.metadata = pq.read_table(meta_path)
+        meta_layout = json.loads(self.metadata.schema.metadata[SCHEMA_KEY])
+        self.meta_json_fields = set(meta_layout["json_fields"])
+        self.source = meta_layout.get("source")
+        self.text = pq.ParquetFile(text_path)
+        layout = json.loads(self.text.schema_arrow.metadata[SCHEMA_KEY])
+        self.fields, self.json_fields = layout["fields"], set(layout["json_fields"])
+
+    def __len__(self):
+        return self.metadata.num_rows
+
+    def is_stale(self, data_dir):
+        """
+        Whether the data file this copy was converted from is still in data_dir and has changed since. A copy whose
+        data file was removed (e.g. to save space) is not stale; one that records no data file (written by an older
+        version) is.
+        """
+        if self.source is None:
+            return True
+        path = os.path.join(data_dir, self.source["file"])
+        return os.path.exists(path) and source_record(path) != self.source
+
+    def rows(self, length_lower_bound, length_upper_bound, seed_num):
+        """
+        Return the rows of the instances whose token_level is within the bounds and whose seed is at most seed_num.
+        """
+        token_level = self.metadata["token_level"]
+        mask = pc.and_(
+            pc.and_(pc.greater_equal(token_level, length_lower_bound), pc.less_equal(token_level, length_upper_bound)),
+            pc.less_equal(self.metadata["seed"], seed_num),
+        )
+        return self.metadata["row"].filter(mask).to_pylist()
+
+    def read(self, rows):
+        """
+        Return the instances at the given rows, in row order, reading only the row groups that hold them.
+        """
+        rows = sorted(set(rows))
+        if not rows:
+            return []
+        groups = sorted(set(self.metadata["row_group"].take(rows).to_pylist()))
+        text = self.text.read_row_groups(groups)
+        position = {row: i for i, row in enumerate(text["row"].to_pylist())}
+        text_rows = text.take([position[row] for row in rows]).to_pylist()
+        meta_rows = self.metadata.take(rows).to_pylist()
+
+        instances = []
+        for meta, values in zip(meta_rows, text_rows):
+            elem = {}
+            for field in self.fields:
+                if field in meta:
+                    elem[field] = json.loads(meta[field]) if field in self.meta_json_fields else meta[field]
+                else:
+                    elem[field] = json.loads(values[field]) if field in self.json_fields else values[field]
+            instances.append(elem)
+        return instances
+
+    def select_slices(self, slices):
+        """
+        Select several slices, reading the text of every selected instance once.
+
+        Args:
+            slices (Iterable[Tuple[int, int, int]]): The (length_lower_bound, length_upper_bound, seed_num) of every slice.
+
+        Returns:
+            Dict[Tuple[int, int, int], List[Dict]]: The instances of every slice, in file order. An instance selected
+            by several slices is shared by them.
+        """
+        rows = {bounds: self.rows(*bounds) for bounds in slices}
+        instances = dict(zip(sorted({row for selected in rows.values() for row in selected}),
+                             self.read([row for selected in rows.values() for row in selected])))
+        return {bounds: [instances[row] for row in selected] for bounds, selected in rows.items()}
+
+
+def open_columnar(task, data_dir="data"):
+    """
+    Open the columnar files of a task, or return None if there are none, if they are stale (see
+    `ColumnarDataset.is_stale`) or if pyarrow is not installed.
+    """
+    base = os.path.join(data_dir, task)
+    if pa is None or not all(os.path.exists(path) for path in columnar_paths(base)):
+        return None
+    dataset = ColumnarDataset(base)
+    if dataset.is_stale(data_dir):
+        return None
+    return dataset
@@ -0,0 +1,153 @@
+"""
+Module: dataset
+
+Streaming readers of the task files. Selecting a slice of a task (a range of token
+levels and a number of seeds) then holds only that slice in memory, rather than every
+instance at every length tier, 256K-token contexts included.
+
+Three formats are read, plain or compressed (see codec.py), in this order of preference:
+
+    data/{task}.refs.jsonl    one instance per line, its context in a segment store (see segments.py)
+    data/{task}.jsonl         one instance per line (see `convert_to_jsonl`)
+    data/{task}.json          the original JSON array, parsed one instance at a time
+
+Either way, instances are decoded one by one and filtered as they are parsed. An
+instance that is not selected is dropped before the next one is read. A compressed
+JSONL file written in independent frames (see frames.py) is read here too, whole and
+in order; its frame index lets the loaders read a slice of it without the other frames.
+"""
+
+import io
+import os
+import re
+import json
+
+from .artifacts import SUFFIXES, find_artifact
+from .codec import open_compressed, resolve_codec
+
+# Characters read from the file at a time
+CHUNK_SIZE = 2**20
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+def find_task_file(task, data_dir="data"):
+    """
+    Return the path of the data file of a task: {task}.refs.jsonl, {task}.jsonl or {task}.json, the first that
+    exists (plain or compressed).
+    """
+    for extension in (".refs.jsonl", ".jsonl", ".json"):
+        path = find_artifact(os.path.join(data_dir, task + extension))
+        if path is not None:
+            return path
+    raise FileNotFoundError(f"No data file for {task} in {data_dir} ({task}.refs.jsonl, {task}.jsonl or {task}.json).")
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of a JSON array read from a text stream, one at a time.
+
+    The buffer holds one chunk plus the element being decoded, never the whole array.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def read_more(size):
+        nonlocal buffer, pos, eof
+        chunk = stream.read(size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def next_char():
+        # Skip whitespace, reading on when the buffer is exhausted; "" at the end of the stream
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            read_more(chunk_size)
+
+    if next_char() != "[":
+        raise ValueError("The data file is not a JSON array.")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+            # A number or literal cut at the end of the buffer decodes, but may go on in the next chunk
+            complete = end < len(buffer) or eof or buffer[end - 1] in '}]"'
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError(f"Invalid or truncated JSON array near character {pos} of the buffer.")
+            complete = False
+        if not complete:
+            # Grow the reads with the element, so a large element is decoded a bounded number of times
+            read_more(max(chunk_size, len(buffer)))
+            continue
+        pos = end
+        yield element
+        separator = next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' between the elements of the array, got {separator!r}.")
+        pos += 1
+
+
+def iter_jsonl(stream):
+    """
+    Yield the objects of a JSONL text stream, one per non-empty line.
+    """
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def is_jsonl(path):
+    return ".jsonl" in os.path.basename(path)
+
+
+def iter_instances(path, predicate=None):
+    """
+    Stream the instances of a data file (JSON array or JSONL, plain or compressed).
+
+    Args:
+        path (str): The path of the data file.
+        predicate (Callable[[Dict], bool], optional): Only yield the instances it accepts. Defaults to all.
+
+    Yields:
+        Dict: The instances, in file order.
+    """
+    with io.TextIOWrapper(open_compressed(path, "rb"), encoding="utf-8") as stream:
+        elements = iter_jsonl(stream) if is_jsonl(path) else iter_json_array(stream)
+        for elem in elements:
+            if predicate is None or predicate(elem):
+                yield elem
+
+
+def convert_to_jsonl(path, output=None, compress=None):
+    """
+    Convert a data file to JSONL, streaming, so files larger than memory can be converted.
+
+    Args:
+        path (str): The data file, e.g. "data/table_sql_absolute.json".
+        output (str, optional): The JSONL file to write. Defaults to `path` with the extension .jsonl.
+        compress (str, optional): None, "zstd", "gzip" or "auto"; its suffix is appended to `output`. Defaults to None.
+
+    Returns:
+        Tuple[str, int]: The path written and the number of instances.
+    """
+    codec = resolve_codec(compress) if compress is not None else "none"
+    if output is None:
+        base = re.sub(r"(\.zst|\.gz)$", "", path)
+        output = os.path.splitext(base)[0] + ".jsonl"
+    output += SUFFIXES[codec]
+    num_instances = 0
+    with open_compressed(output + ".tmp", "wb", codec=codec) as file:
+        for elem in iter_instances(path):
+            file.write(json.dumps(elem, ensure_ascii=False).encode("utf-8") + b"\n")
+            num_instances += 1
+    os.replace(output + ".tmp", output)
+    return output, num_instances
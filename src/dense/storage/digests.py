@@ -0,0 +1,60 @@
+"""
+Module: digests
+
+Digests identifying a prompt without hashing it. A LongPiBench prompt is a template
+(system prompt and user message with {context} and {query} fields) filled with the
+context and the question of an instance. The context is by far the largest part and is
+shared by the three prompt variants of an instance and by every model, so its digest
+is computed once per instance and memoized on it; templates are few and their digests
+are memoized by content. Which cell of a run first memoizes the digest of an instance
+varies, so it is dropped from the records saved (see `strip_context_digest`).
+"""
+
+import json
+import hashlib
+import functools
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def context_digest(elem):
+    """
+    Return the digest of the context of an instance, computed on first use and stored in elem["context_digest"].
+
+    Instances whose context is in a segment store (see segments.py) carry their digest from the conversion;
+    contexts assembled from a base instance are hashed once assembled.
+    """
+    if "context_digest" not in elem:
+        # Imported here: segments.py depends on this module
+        from .segments import context_text
+        elem["context_digest"] = text_digest(context_text(elem))
+    return elem["context_digest"]
+
+
+def strip_context_digest(elem):
+    """
+    Return an instance without the context digest memoized on it, e.g. to save it. Segmented instances (see
+    segments.py) keep theirs: it is part of their record from the conversion.
+    """
+    if "context_digest" not in elem or "context_segments" in elem:
+        return elem
+    return {name: value for name, value in elem.items() if name != "context_digest"}
+
+
+@functools.lru_cache(maxsize=1024)
+def template_digest(system_prompt, user_message):
+    return text_digest(json.dumps([system_prompt, user_message]))
+
+
+def prompt_digests(elem, prompt_type):
+    """
+    Return the digests that identify the prompt of an instance built from `prompt_type`.
+    """
+    template = elem[prompt_type]
+    return {
+        "context": context_digest(elem),
+        "template": template_digest(template["system_prompt"], template["user_message"]),
+        "question": elem["question"],
+    }
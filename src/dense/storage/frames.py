@@ -0,0 +1,233 @@
+"""
+Module: frames
+
+Compressed task files that can be read a slice at a time, in two parts:
+
+    data/{task}.jsonl.zst       the instances, one per line, compressed in independent frames
+    (or .jsonl.gz)              (zstd frames or gzip members) of about FRAME_BYTES of JSONL,
+                                each of a single token level
+    data/{task}.frames.json     the frame index: the offset and length of every frame in the
+                                file, and the token level and seeds of its instances
+
+Concatenated frames are a valid zstd or gzip stream, so the data file is also an ordinary
+compressed JSONL file, read sequentially by dataset.iter_instances wherever the index is
+missing. With the index, selecting a slice reads only the frames that may hold one of
+its instances (a positioned read of each, no decompression of the frames before it), and
+the frames are decompressed and parsed by a pool of threads: zlib and zstd release the
+GIL while they decompress, so the frames of a large slice are decompressed in parallel.
+At most a few frames per thread are in flight, so memory does not grow with the slice.
+
+zstd requires the optional `zstandard` package; gzip is used without it (see codec.py).
+"""
+
+import os
+import re
+import json
+import concurrent.futures
+
+from .artifacts import SUFFIXES
+from .codec import Codec, resolve_codec
+from .dataset import find_task_file, iter_instances
+
+# Approximate size of a frame before compression
+FRAME_BYTES = 8 * 2**20
+# Frames in flight per thread
+FRAMES_PER_WORKER = 2
+
+
+def frame_index_path(path):
+    """
+    Return the path of the frame index of a data file, e.g. "data/table_sql_absolute.jsonl.zst" ->
+    "data/table_sql_absolute.frames.json".
+    """
+    return re.sub(r"\.jsonl?(\.zst|\.gz)?$", "", path) + ".frames.json"
+
+
+def convert_to_framed(path, output=None, compress="auto", frame_bytes=FRAME_BYTES, threads=-1):
+    """
+    Convert a data file to framed, compressed JSONL and write its frame index, streaming.
+
+    Args:
+        path (str): The data file, e.g. "data/table_sql_absolute.json".
+        output (str, optional): The JSONL file to write, without the suffix of the codec. Defaults to `path` with
+            the extension .jsonl.
+        compress (str, optional): "zstd", "gzip" or "auto". Defaults to "auto".
+        frame_bytes (int, optional): The approximate size of a frame before compression. Defaults to 8 MiB.
+        threads (int, optional): The number of zstd compression threads. Defaults to -1 (one per CPU).
+
+    Returns:
+        Tuple[str, str, int]: The data file written, its frame index and the number of instances.
+    """
+    codec = resolve_codec(compress)
+    assert codec != "none", "Framed files are compressed: pass compress='zstd', 'gzip' or 'auto'."
+    if output is None:
+        output = re.sub(r"\.jsonl?(\.zst|\.gz)?$", "", path) + ".jsonl"
+    output += SUFFIXES[codec]
+    index_path = frame_index_path(output)
+    compressor = Codec(codec, threads=threads)
+
+    frames, lines, num_bytes, offset = [], [], 0, 0
+    token_level, seeds = None, set()
+
+    def flush(file):
+        nonlocal lines, num_bytes, offset, seeds
+        if not lines:
+            return
+        data = compressor.compress(b"".join(lines))
+        file.write(data)
+        frames.append({
+            "offset": offset,
+            "length": len(data),
+            "raw_length": num_bytes,
+            "num_instances": len(lines),
+            "token_level": token_level,
+            "seeds": sorted(seeds),
+        })
+        offset += len(data)
+        lines, num_bytes, seeds = [], 0, set()
+
+    with open(output + ".tmp", "wb") as file:
+        for elem in iter_instances(path):
+            # A new token level starts a new frame, so a slice of some levels reads none of the frames of the others
+            if elem["token_level"] != token_level:
+                flush(file)
+                token_level = elem["token_level"]
+            line = json.dumps(elem, ensure_ascii=False).encode("utf-8") + b"\n"
+            lines.append(line)
+            num_bytes += len(line)
+            seeds.add(int(elem["seed_id"].split("_")[-1]))
+            if num_bytes >= frame_bytes:
+                flush(file)
+        flush(file)
+    if not frames:
+        os.remove(output + ".tmp")
+        raise ValueError(f"{path} holds no instance.")
+
+    index = {"data_file": os.path.basename(output), "codec": codec, "size": offset, "frames": frames}
+    with open(index_path + ".tmp", "w") as file:
+        json.dump(index, file)
+    os.replace(output + ".tmp", output)
+    os.replace(index_path + ".tmp", index_path)
+    return output, index_path, sum(frame["num_instances"] for frame in frames)
+
+
+class FramedDataset:
+    """
+    A framed task file, read frame by frame.
+
+    Args:
+        index_path (str): The path of the frame index, e.g. "data/table_sql_absolute.frames.json".
+        num_workers (int, optional): The number of decompression threads. Defaults to the number of CPUs.
+
+    `bytes_read` counts the compressed bytes read from the data file so far.
+    """
+
+    def __init__(self, index_path, num_workers=None):
+        with open(index_path) as file:
+            index = json.load(file)
+        self.path = os.path.join(os.path.dirname(index_path), index["data_file"])
+        self.frames = index["frames"]
+        self.size = index["size"]
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.codec = Codec(index["codec"])
+        self.bytes_read = 0
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != self.size:
+            raise ValueError(f"{index_path} does not index {self.path}: the file is missing or was rewritten.")
+
+    def __len__(self):
+        return sum(frame["num_instances"] for frame in self.frames)
+
+    def select_frames(self, length_lower_bound, length_upper_bound, seed_num):
+        """
+        Return the positions of the frames that may hold an instance whose token_level is within the bounds and
+        whose seed is at most seed_num.
+        """
+        return [
+            i for i, frame in enumerate(self.frames)
+            if length_lower_bound <= frame["token_level"] <= length_upper_bound and frame["seeds"][0] <= seed_num
+        ]
+
+    def _read_frame(self, fd, i):
+        frame = self.frames[i]
+        data = os.pread(fd, frame["length"], frame["offset"])
+        if len(data) != frame["length"]:
+            raise ValueError(f"Frame {i} of {self.path} is truncated.")
+        return [json.loads(line) for line in self.codec.decompress(data).splitlines() if line.strip()]
+
+    def iter_frames(self, frames=None):
+        """
+        Decompress and parse frames in parallel.
+
+        Args:
+            frames (Iterable[int], optional): The positions of the frames. Defaults to all.
+
+        Yields:
+            List[Dict]: The instances of every frame, in the order of `frames`.
+        """
+        frames = range(len(self.frames)) if frames is None else frames
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.num_workers) as executor:
+                pending = []
+                for i in frames:
+                    self.bytes_read += self.frames[i]["length"]
+                    pending.append(executor.submit(self._read_frame, fd, i))
+                    # Bound the frames in flight, so memory holds a few frames per thread rather than the slice
+                    if len(pending) >= self.num_workers * FRAMES_PER_WORKER:
+                        yield pending.pop(0).result()
+                for future in pending:
+                    yield future.result()
+        finally:
+            os.close(fd)
+
+    def iter_instances(self, predicate=None):
+        """
+        Stream the instances of every frame, in file order, as dataset.iter_instances does.
+        """
+        for instances in self.iter_frames():
+            for elem in instances:
+                if predicate is None or predicate(elem):
+                    yield elem
+
+    def select_slices(self, slices):
+        """
+        Select several slices, reading and decompressing each frame that may hold one of their instances once.
+
+        Args:
+            slices (Iterable[Tuple[int, int, int]]): The (length_lower_bound, length_upper_bound, seed_num) of every slice.
+
+        Returns:
+            Dict[Tuple[int, int, int], List[Dict]]: The instances of every slice, in file order. An instance selected
+            by several slices is shared by them.
+        """
+        slices = list(slices)
+        frames = sorted({i for bounds in slices for i in self.select_frames(*bounds)})
+        selected = {bounds: [] for bounds in slices}
+        for instances in self.iter_frames(frames):
+            for elem in instances:
+                seed = int(elem["seed_id"].split("_")[-1])
+                for bounds in slices:
+                    length_lower_bound, length_upper_bound, seed_num = bounds
+                    if length_lower_bound <= elem["token_level"] <= length_upper_bound and seed <= seed_num:
+                        selected[bounds].append(elem)
+        return selected
+
+
+def open_framed(task, data_dir="data", num_workers=None):
+    """
+    Open the framed data file of a task, or return None if the data file of the task (see dataset.find_task_file)
+    has no up-to-date frame index.
+    """
+    try:
+        path = find_task_file(task, data_dir)
+    except FileNotFoundError:
+        return None
+    index_path = frame_index_path(path)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as file:
+        index = json.load(file)
+    # An index left behind by a data file since rewritten (e.g. by convert_to_jsonl) is ignored
+    if os.path.basename(path) != index["data_file"] or os.path.getsize(path) != index["size"]:
+        return None
+    return FramedDataset(index_path, num_workers=num_workers)
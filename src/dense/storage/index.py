@@ -0,0 +1,183 @@
+"""
+Module: index
+
+SQLite index of the entries of an on-disk response cache: the model, task, size,
+creation time, last access time and hit count of every entry. It backs the size cap,
+eviction, TTLs and statistics of the cache without reading the entries themselves.
+
+The entry files remain the source of truth: the index can be rebuilt from them at any
+time (see ResponseCache.gc), e.g. for entries written before it existed.
+"""
+
+import re
+import time
+import atexit
+import sqlite3
+import threading
+from fnmatch import fnmatch
+
+POLICIES = ("lru", "lfu")
+
+_SIZE_UNITS = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30, "t": 2**40}
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_size(value):
+    """
+    Parse a size in bytes, e.g. 1000000, "500M", "20G" or "1.5TB". None stays None.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)i?b?\s*", str(value).lower())
+    assert match, f"Invalid size {value}, expected e.g. 500M or 20G."
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def parse_duration(value):
+    """
+    Parse a duration in seconds, e.g. 3600, "12h", "30d" or "2w".
+    """
+    if isinstance(value, (int, float)):
+        return value
+    match = re.fullmatch(r"\s*([\d.]+)\s*([smhdw]?)\s*", str(value).lower())
+    assert match, f"Invalid duration {value}, expected e.g. 12h or 30d."
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or "s"]
+
+
+def parse_ttls(value):
+    """
+    Parse per-model TTLs: "gpt-4o-mini=30d,qwen2.5-*=7d,*=90d", or a mapping from model pattern to duration.
+
+    Returns:
+        List[Tuple[str, float]]: (model pattern, seconds) pairs; the first pattern matching a model applies.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = dict(item.split("=", 1) for item in value.split(",") if item.strip())
+    return [(pattern.strip(), parse_duration(duration)) for pattern, duration in value.items()]
+
+
+def ttl_for(ttls, model):
+    """
+    Return the TTL in seconds of the entries of a model, or None if they never expire.
+    """
+    for pattern, seconds in ttls:
+        if fnmatch(str(model), pattern):
+            return seconds
+    return None
+
+
+class CacheIndex:
+    """
+    The index of a response cache, stored in SQLite (WAL mode, so readers do not block the writer).
+
+    Accesses are buffered in memory and written in batches, so a cache hit costs no write.
+    """
+
+    def __init__(self, path, flush_every=256, flush_interval=30.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._accesses = {}
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, model TEXT, task TEXT, size INTEGER, "
+            "created REAL, last_access REAL, hits INTEGER DEFAULT 0)"
+        )
+
+    def _conn(self):
+        # sqlite3 connections cannot be shared between threads
+        if getattr(self._local, "conn", None) is None:
+            self._local.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        return self._local.conn
+
+    def record_put(self, key, model, task, size, created):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (key, model, task, size, created, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (key, model, task, size, created, time.time()),
+        )
+
+    def record_size(self, key, size):
+        """
+        Update the size of an entry rewritten in place, keeping its access statistics.
+        """
+        self._conn().execute("UPDATE entries SET size = ? WHERE key = ?", (size, key))
+
+    def record_access(self, key):
+        with self._lock:
+            _, hits = self._accesses.get(key, (0, 0))
+            self._accesses[key] = (time.time(), hits + 1)
+            due = len(self._accesses) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            accesses, self._accesses = self._accesses, {}
+            self._last_flush = time.monotonic()
+        if accesses:
+            self._conn().executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?), hits = hits + ? WHERE key = ?",
+                [(last_access, hits, key) for key, (last_access, hits) in accesses.items()],
+            )
+
+    def remove(self, keys):
+        self._conn().executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def sizes(self):
+        """
+        Return the indexed size of every entry, keyed by key.
+        """
+        return dict(self._conn().execute("SELECT key, size FROM entries"))
+
+    def total_size(self):
+        (total,) = self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return total
+
+    def expired(self, ttls, now=None):
+        """
+        Return the keys of the entries older than the TTL of their model.
+        """
+        if not ttls:
+            return []
+        now = now if now is not None else time.time()
+        expired = []
+        for key, model, created in self._conn().execute("SELECT key, model, created FROM entries"):
+            ttl = ttl_for(ttls, model)
+            if ttl is not None and created + ttl < now:
+                expired.append(key)
+        return expired
+
+    def victims(self, policy, bytes_to_free):
+        """
+        Return the keys to evict to free `bytes_to_free` bytes: least recently used first ("lru"),
+        or least frequently used first, ties broken by recency ("lfu").
+        """
+        assert policy in POLICIES, f"Unknown eviction policy {policy}, expected one of {POLICIES}."
+        order = "last_access" if policy == "lru" else "hits, last_access"
+        victims, freed = [], 0
+        for key, size in self._conn().execute(f"SELECT key, size FROM entries ORDER BY {order}"):
+            if freed >= bytes_to_free:
+                break
+            victims.append(key)
+            freed += size
+        return victims
+
+    def stats(self):
+        """
+        Return the number of entries, their size and their hits, by (model, task).
+        """
+        rows = self._conn().execute(
+            "SELECT model, task, COUNT(*), SUM(size), SUM(hits) FROM entries GROUP BY model, task ORDER BY SUM(size) DESC"
+        )
+        return [
+            {"model": model, "task": task, "entries": count, "bytes": size, "hits": hits}
+            for model, task, count, size, hits in rows
+        ]
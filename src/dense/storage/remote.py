@@ -0,0 +1,160 @@
+"""
+Module: remote
+
+Client of the shared cache service (see service.py), used by the backends in place of
+the on-disk cache when LLM_CACHE_URL is set:
+
+    LLM_CACHE_URL="http://cache-host:8765"
+    LLM_CACHE_LRU_SIZE=10000        # optional, entries kept in memory
+
+Entries are kept in a local in-memory LRU in front of the service, so repeated lookups
+do not leave the process, and the entries of a whole run are fetched in batches before
+it starts (see engine.generate_all). Each thread keeps one HTTP connection alive. The
+cache is best-effort: if the service is unreachable, lookups miss and writes are
+dropped with a warning, and generation goes on.
+"""
+
+import os
+import json
+import warnings
+import threading
+import http.client
+import urllib.parse
+from collections import OrderedDict
+
+from .cache import BaseCache
+
+# Keys sent per batch-get request
+BATCH_SIZE = 500
+# Errors of a request to an unreachable or misbehaving service: network errors, malformed HTTP responses
+# (http.client.HTTPException is not an OSError) and bodies that are not JSON
+REQUEST_ERRORS = (OSError, http.client.HTTPException, ValueError)
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU mapping, bounded by a number of entries.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RemoteCache(BaseCache):
+    """
+    Response cache stored by the cache service at `url`, with a local in-memory LRU.
+
+    Args:
+        url (str): The URL of the service, e.g. "http://cache-host:8765".
+        lru_size (int, optional): The number of entries kept in memory. Defaults to LLM_CACHE_LRU_SIZE, or 10000.
+        timeout (float, optional): The timeout of a request in seconds. Defaults to 10.
+    """
+
+    def __init__(self, url, lru_size=None, timeout=10.0):
+        parsed = urllib.parse.urlsplit(url)
+        assert parsed.scheme in ("http", "https"), f"Unsupported cache URL {url}, expected http://host:port."
+        self.url = url
+        self._connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._netloc = parsed.netloc
+        self._base_path = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.lru = LRUCache(lru_size or int(os.environ.get("LLM_CACHE_LRU_SIZE", 10000)))
+        self._local = threading.local()
+
+    def _connection(self, renew=False):
+        if renew or getattr(self._local, "connection", None) is None:
+            self._local.connection = self._connection_class(self._netloc, timeout=self.timeout)
+        return self._local.connection
+
+    def _request(self, method, path, obj=None):
+        """
+        Send a request and return (status, decoded JSON body or None). A dropped keep-alive connection is
+        reopened once; other errors (see REQUEST_ERRORS) are raised.
+        """
+        body = json.dumps(obj).encode("utf-8") if obj is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            connection = self._connection(renew=attempt > 0)
+            try:
+                connection.request(method, self._base_path + path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if attempt == 1:
+                    raise
+        return response.status, (json.loads(data) if data else None)
+
+    def _warn(self, action, error):
+        warnings.warn(f"The cache service at {self.url} failed to {action} ({error}); continuing without it.")
+
+    def get(self, key):
+        entry = self.lru.get(key)
+        if entry is not None:
+            return entry
+        try:
+            status, entry = self._request("GET", f"/entries/{key}")
+        except REQUEST_ERRORS as e:
+            self._warn("look up an entry", e)
+            return None
+        if status != 200:
+            return None
+        self.lru.put(key, entry)
+        return entry
+
+    def put_entry(self, entry):
+        self.lru.put(entry["key"], entry)
+        try:
+            status, body = self._request("PUT", f"/entries/{entry['key']}", entry)
+        except REQUEST_ERRORS as e:
+            self._warn("store an entry", e)
+            return
+        if status >= 300:
+            self._warn("store an entry", body)
+
+    def prefetch(self, keys):
+        """
+        Fetch the entries of many keys into the LRU, in batches of BATCH_SIZE keys.
+
+        Returns:
+            int: The number of entries found.
+        """
+        missing = list(dict.fromkeys(key for key in keys if key not in self.lru))
+        num_found = 0
+        for start in range(0, len(missing), BATCH_SIZE):
+            try:
+                status, body = self._request("POST", "/batch-get", {"keys": missing[start:start + BATCH_SIZE]})
+            except REQUEST_ERRORS as e:
+                self._warn("prefetch entries", e)
+                return num_found
+            if status != 200:
+                self._warn("prefetch entries", body)
+                return num_found
+            for key, entry in body["entries"].items():
+                self.lru.put(key, entry)
+                num_found += 1
+        return num_found
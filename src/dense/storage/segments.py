@@ -0,0 +1,260 @@
+"""
+Module: segments
+
+A deduplicated store of contexts. The instances of a task place the same relevant
+items at different positions in the same background material, so their contexts are
+mostly the same runs of lines. The store keeps every distinct run (segment) once:
+
+    {store}.bin    the unique segments, UTF-8, back to back
+    {store}.idx    the offsets of the segments in {store}.bin (uint64, one more than segments)
+
+and an instance refers to its context as the list of its segment ids, in
+elem["context_segments"], together with the absolute path of the store in
+elem["context_store"] and the length of the context in characters in elem["context_length"].
+Both files are memory-mapped: a segment is a zero-copy slice of the blob, and the context
+is assembled (one copy) only when the prompt is built, by `context_text`. A store appended
+to (e.g. by the conversion of another task) is mapped again on its next use.
+
+Contexts are cut into segments at line boundaries chosen by the content of the lines
+(content-defined chunking): a segment ends after a line whose hash is 0 modulo
+AVERAGE_SEGMENT_LINES. An inserted or moved line only changes the segment it lands
+in, and the surrounding segments are still shared.
+"""
+
+import os
+import re
+import json
+import mmap
+import zlib
+import hashlib
+import threading
+from array import array
+
+from .digests import text_digest
+from .dataset import iter_instances
+
+# Expected number of lines of a segment (a power of two); a segment has at most four times as many
+AVERAGE_SEGMENT_LINES = 16
+
+
+def split_segments(text, average_lines=AVERAGE_SEGMENT_LINES):
+    """
+    Cut a text into segments of whole lines, at boundaries that depend only on the lines themselves.
+
+    Returns:
+        List[str]: The segments; their concatenation is `text`.
+    """
+    assert average_lines & (average_lines - 1) == 0, "average_lines should be a power of two."
+    mask = average_lines - 1
+    max_lines = 4 * average_lines
+    segments, start, num_lines = [], 0, 0
+    position = 0
+    for line in text.splitlines(keepends=True):
+        position += len(line)
+        num_lines += 1
+        if num_lines >= max_lines or zlib.crc32(line.encode("utf-8")) & mask == 0:
+            segments.append(text[start:position])
+            start, num_lines = position, 0
+    if start < len(text):
+        segments.append(text[start:])
+    return segments
+
+
+class SegmentStore:
+    """
+    A memory-mapped, read-only segment store.
+
+    Args:
+        path (str): The path of the store, without the .bin and .idx suffixes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Stated before mapping: a store appended to after this has another version (see `open_segment_store`)
+        self.version = store_version(path)
+        with open(path + ".bin", "rb") as file:
+            # mmap cannot map an empty file
+            self._blob = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path + ".bin") else b""
+        with open(path + ".idx", "rb") as file:
+            self._index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.blob = memoryview(self._blob)
+        self.offsets = memoryview(self._index_map).cast("Q")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def segment(self, segment_id):
+        """
+        Return a segment as a zero-copy view of the blob.
+        """
+        return self.blob[self.offsets[segment_id]:self.offsets[segment_id + 1]]
+
+    def assemble(self, segment_ids):
+        """
+        Assemble a context from its segment ids, copying each segment once.
+        """
+        return b"".join([self.segment(segment_id) for segment_id in segment_ids]).decode("utf-8")
+
+    def size(self, segment_ids):
+        """
+        Return the size in bytes of a context, without assembling it.
+        """
+        return sum(self.offsets[segment_id + 1] - self.offsets[segment_id] for segment_id in segment_ids)
+
+
+class SegmentStoreWriter:
+    """
+    Add contexts to a segment store, storing each distinct segment once.
+
+    An existing store is appended to: its segments are hashed when the writer is opened, so
+    the contexts of other tasks keep their ids and share their segments with the new ones.
+    Use the writer as a context manager, so the index is written on exit.
+    """
+
+    def __init__(self, path, average_lines=AVERAGE_SEGMENT_LINES):
+        self.path = path
+        self.average_lines = average_lines
+        self.offsets = array("Q", [0])
+        self.digests = {}
+        if os.path.exists(path + ".bin") and os.path.exists(path + ".idx"):
+            with open(path + ".idx", "rb") as file:
+                self.offsets = array("Q", file.read())
+            with open(path + ".bin", "rb") as file:
+                blob = file.read(self.offsets[-1])
+            for segment_id in range(len(self.offsets) - 1):
+                self.digests[self._digest(blob[self.offsets[segment_id]:self.offsets[segment_id + 1]])] = segment_id
+        self._file = open(path + ".bin", "r+b" if os.path.exists(path + ".bin") else "wb")
+        # Drop the bytes appended after the last index was written (e.g. by an interrupted conversion)
+        self._file.truncate(self.offsets[-1])
+        self._file.seek(self.offsets[-1])
+        self.num_bytes = 0  # Bytes of the contexts added, before deduplication
+
+    @staticmethod
+    def _digest(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def add(self, text):
+        """
+        Add a context to the store.
+
+        Returns:
+            List[int]: The ids of its segments.
+        """
+        segment_ids = []
+        for segment in split_segments(text, self.average_lines):
+            data = segment.encode("utf-8")
+            digest = self._digest(data)
+            if digest not in self.digests:
+                self._file.write(data)
+                self.offsets.append(self.offsets[-1] + len(data))
+                self.digests[digest] = len(self.offsets) - 2
+            segment_ids.append(self.digests[digest])
+            self.num_bytes += len(data)
+        return segment_ids
+
+    @property
+    def unique_bytes(self):
+        return self.offsets[-1]
+
+    def close(self):
+        self._file.close()
+        with open(self.path + ".idx.tmp", "wb") as file:
+            self.offsets.tofile(file)
+        os.replace(self.path + ".idx.tmp", self.path + ".idx")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def store_version(path):
+    """
+    Return the size and modification time of the index of a store; they change whenever segments are appended.
+    """
+    stat = os.stat(path + ".idx")
+    return stat.st_size, stat.st_mtime_ns
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_segment_store(path):
+    """
+    Open a segment store once per process, and again once it has been appended to.
+    """
+    version = store_version(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None or store.version != version:
+            store = _stores[path] = SegmentStore(path)
+        return store
+
+
+def context_text(elem):
+    """
+    Return the context of an instance: elem["context"], its segments assembled from elem["context_store"], or
+    its items assembled from the base elem["context_base"] (a positional variant, see dense.synth.variants).
+    """
+    if "context" in elem:
+        return elem["context"]
+    if "context_base" in elem:
+        # Imported here: dense.synth reads its base instances through this module
+        from dense.synth.variants import assemble_variant
+
+        return assemble_variant(elem)
+    return open_segment_store(elem["context_store"]).assemble(elem["context_segments"])
+
+
+def context_length(elem):
+    """
+    Return the length in characters of the context of an instance, without assembling it when it was recorded.
+    """
+    if "context" in elem:
+        return len(elem["context"])
+    if "context_length" in elem:
+        return elem["context_length"]
+    return len(context_text(elem))
+
+
+def segment_instance(elem, writer):
+    """
+    Return a copy of an instance whose context is replaced by its segments in the store of `writer`.
+
+    The digest of the full context is kept in elem["context_digest"], so the cache keys of its prompts are unchanged,
+    and its length in elem["context_length"]. The store is referred to by its absolute path, so the instances can be
+    read from any working directory.
+    """
+    context = elem["context"]
+    segmented = {name: value for name, value in elem.items() if name != "context"}
+    segmented["context_store"] = os.path.abspath(writer.path)
+    segmented["context_segments"] = writer.add(context)
+    segmented["context_digest"] = elem.get("context_digest") or text_digest(context)
+    segmented["context_length"] = len(context)
+    return segmented
+
+
+def convert_to_segments(path, store, output=None):
+    """
+    Convert a data file to JSONL instances whose contexts are stored in a segment store, streaming.
+
+    Args:
+        path (str): The data file, e.g. "data/table_sql_absolute.json".
+        store (str): The path of the segment store, e.g. "data/contexts"; shared by several tasks, it also
+            deduplicates the segments they have in common.
+        output (str, optional): The instance file to write. Defaults to `path` with the extension .refs.jsonl.
+
+    Returns:
+        Tuple[str, int, int, int]: The path written, the number of instances, and the bytes of their contexts
+        before and after deduplication (the unique bytes of the whole store).
+    """
+    output = output or re.sub(r"\.jsonl?(\.zst|\.gz)?$", "", path) + ".refs.jsonl"
+    num_instances = 0
+    with SegmentStoreWriter(store) as writer, open(output + ".tmp", "w", encoding="utf-8") as file:
+        for elem in iter_instances(path):
+            file.write(json.dumps(segment_instance(elem, writer), ensure_ascii=False) + "\n")
+            num_instances += 1
+    os.replace(output + ".tmp", output)
+    return output, num_instances, writer.num_bytes, writer.unique_bytes
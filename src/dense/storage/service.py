@@ -0,0 +1,160 @@
+"""
+Module: service
+
+A small HTTP service sharing one response cache between the runs of a team or cluster.
+Entries are addressed by their key, the content digest of the call (see cache.py):
+
+    GET  /entries/{key}    200 with the entry as JSON, or 404
+    PUT  /entries/{key}    store the entry sent as JSON
+    POST /batch-get        {"keys": [...]} -> {"entries": {key: entry}}, only the keys found
+    GET  /stats            request and hit counters, and the number of entries (counted at start,
+                           then kept up to date by the puts of the service)
+
+The entries are stored in an on-disk ResponseCache (compressed, see codec.py), so the
+service can be restarted without losing them. Runs use it by setting LLM_CACHE_URL
+(see remote.py). It only depends on the standard library, so it can run anywhere,
+e.g. locally for tests:
+
+    python eval/cache.py serve --cache_dir .cache-service --port 8765
+"""
+
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .bundle import KEY_PATTERN
+from .cache import ResponseCache
+
+# Upper bound of a request body, to protect the service from runaway clients
+MAX_BODY_BYTES = 64 * 2**20
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive, so a client sends all its requests over one connection
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, obj=None):
+        body = json.dumps(obj).encode("utf-8") if obj is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            raise ValueError(f"The request body is larger than {MAX_BODY_BYTES} bytes.")
+        return json.loads(self.rfile.read(length))
+
+    def _entry_key(self):
+        key = self.path[len("/entries/"):] if self.path.startswith("/entries/") else None
+        return key if key is not None and KEY_PATTERN.match(key) else None
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+            return
+        key = self._entry_key()
+        if key is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        entry = self.server.cache.get(key)
+        self.server.count("gets", hits=entry is not None)
+        self._send_json(200, entry) if entry is not None else self._send_json(404, {"error": "miss"})
+
+    def do_PUT(self):
+        key = self._entry_key()
+        if key is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            entry = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        if not isinstance(entry, dict) or entry.get("key") != key or "value" not in entry:
+            self._send_json(400, {"error": "the body should be an entry with the key of the URL and a value"})
+            return
+        new = not os.path.exists(self.server.cache.path(key))
+        self.server.cache.put_entry(entry)
+        self.server.count("puts", new=new)
+        self._send_json(204)
+
+    def do_POST(self):
+        if self.path != "/batch-get":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            keys = self._read_json()["keys"]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"the body should be {{'keys': [...]}} ({e})"})
+            return
+        entries = {}
+        for key in keys:
+            entry = self.server.cache.get(key) if KEY_PATTERN.match(str(key)) else None
+            if entry is not None:
+                entries[key] = entry
+        self.server.count("batch_gets", num_keys=len(keys), hits=len(entries))
+        self._send_json(200, {"entries": entries})
+
+
+class CacheServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server over an on-disk ResponseCache, with request counters. The entries are counted once at
+    start, so /stats costs no directory listing.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, cache, verbose=False):
+        super().__init__(address, CacheRequestHandler)
+        self.cache = cache
+        self.verbose = verbose
+        self._counters = {"gets": 0, "batch_gets": 0, "keys": 0, "hits": 0, "puts": 0}
+        self._num_entries = sum(1 for _ in cache.keys())
+        self._lock = threading.Lock()
+
+    def count(self, request, num_keys=1, hits=0, new=False):
+        with self._lock:
+            self._counters[request] += 1
+            if request != "puts":
+                self._counters["keys"] += num_keys
+                self._counters["hits"] += int(hits)
+            self._num_entries += int(new)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=self._num_entries)
+
+
+def start_service(location=".cache-service", host="127.0.0.1", port=8765, verbose=False):
+    """
+    Start the cache service in a background thread, e.g. for tests.
+
+    Returns:
+        CacheServer: The running server. Its URL port is `server.server_address[1]` (useful with port=0),
+        and `server.shutdown()` stops it.
+    """
+    server = CacheServer((host, port), ResponseCache(location), verbose=verbose)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve(location=".cache-service", host="127.0.0.1", port=8765, verbose=False):
+    """
+    Run the cache service until interrupted.
+    """
+    server = CacheServer((host, port), ResponseCache(location), verbose=verbose)
+    print(f"Serving the response cache in {location} on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,3 @@
+from .tasks import TASKS, SyntheticTask
+from .generator import generate_instance, generate_task_file, iter_generated
+from .variants import VariantBase, positional_views, write_variants
@@ -0,0 +1,144 @@
+"""
+Module: generator
+
+Generate the task files of new synthetic instances, e.g. longer token levels or more
+seeds, in the schema of the data/{task}.json files:
+
+    uuid, token_level, seed_id, level, context, question, answers, location, density,
+    range_level, default_prompt, query_head_prompt, query_tail_prompt
+
+The answer_locations field of the original files is not produced: nothing in the
+pipeline reads it, and its values (e.g. "b") are not documented.
+
+A task file holds, for every token level and seed, one instance per level. Each
+instance is drawn from its own random generator, seeded by its task, token level,
+seed and level, so an instance is the same whichever other instances are generated
+with it (adding seeds or token levels leaves the existing ones unchanged). Instances
+are written to JSONL (see dense.storage.dataset) as they are generated: memory holds
+one instance, whatever the size of the file.
+"""
+
+import os
+import json
+import uuid
+import random
+
+from dense.llm.engine import CHARS_PER_TOKEN
+from dense.storage.artifacts import SUFFIXES
+from dense.storage.codec import open_compressed, resolve_codec
+from dense.storage.dataset import find_task_file
+from .tasks import TASKS
+from .placement import PLACEMENTS, interleave, place
+
+
+def split_task(task):
+    """
+    Split a task name into its synthetic task and its placement, e.g. "table_sql_absolute" -> ("table_sql", "absolute").
+    """
+    name, _, placement = task.rpartition("_")
+    if name not in TASKS or placement not in PLACEMENTS:
+        raise ValueError(f"Unknown task {task}: expected one of {sorted(TASKS)} followed by _absolute or _relative.")
+    return TASKS[name], placement
+
+
+def num_context_items(synthetic_task, token_level, chars_per_token=CHARS_PER_TOKEN):
+    """
+    Return the number of items of a context of about `token_level` tokens, prompt included.
+    """
+    template = synthetic_task.templates["default_prompt"]
+    budget = token_level * chars_per_token - len(template["system_prompt"]) - len(template["user_message"])
+    return max(int(budget / synthetic_task.item_chars), synthetic_task.num_relevant)
+
+
+def generate_instance(task, token_level, seed, level, num_levels=8, num_relevant=None, chars_per_token=CHARS_PER_TOKEN, salt=0):
+    """
+    Generate one instance.
+
+    Args:
+        task (str): The task, e.g. "table_sql_absolute".
+        token_level (int): The approximate number of tokens of the prompt.
+        seed (int): The seed of the instance (its seed_id is "seed_{seed}").
+        level (int): The level of the placement of the relevant items, in [0, num_levels).
+        num_levels (int, optional): The number of levels. Defaults to 8.
+        num_relevant (int, optional): The number of relevant items. Defaults to the task's.
+        chars_per_token (float, optional): The characters per token the context is sized with. Defaults to 4.
+        salt (int, optional): Draw a different dataset with the same parameters. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: The instance.
+    """
+    synthetic_task, placement = split_task(task)
+    num_relevant = num_relevant or synthetic_task.num_relevant
+    rng = random.Random(f"{salt}:{task}:{token_level}:{seed}:{level}:{num_levels}:{num_relevant}")
+
+    num_items = num_context_items(synthetic_task, token_level, chars_per_token)
+    relevant = synthetic_task.relevant(rng, num_relevant)
+    locations, density, range_level = place(num_items, num_relevant, placement, level, num_levels, rng)
+    background = synthetic_task.background(rng, num_items - num_relevant, relevant)
+
+    instance = {
+        "uuid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "token_level": token_level,
+        "seed_id": f"seed_{seed}",
+        "level": f"level {level}",
+        "context": synthetic_task.format_context(interleave(background, relevant.items, locations)),
+        "question": relevant.question,
+        "answers": synthetic_task.answers(relevant, locations),
+        "location": locations,
+        "density": density,
+        "range_level": range_level,
+    }
+    instance.update(synthetic_task.templates)
+    return instance
+
+
+def iter_generated(task, token_levels, num_seeds, num_levels=8, num_relevant=None, chars_per_token=CHARS_PER_TOKEN, salt=0):
+    """
+    Generate the instances of a task file: for every token level and seed (1 to num_seeds), one instance per level.
+
+    Yields:
+        Dict[str, Any]: The instances, see `generate_instance`.
+    """
+    split_task(task)
+    for token_level in token_levels:
+        for seed in range(1, num_seeds + 1):
+            for level in range(num_levels):
+                yield generate_instance(task, token_level, seed, level, num_levels, num_relevant, chars_per_token, salt)
+
+
+def generate_task_file(task, token_levels, num_seeds, output=None, data_dir="data", compress=None, **kwargs):
+    """
+    Generate a task file, writing the instances as they are generated.
+
+    Args:
+        task (str): The task, e.g. "table_sql_absolute".
+        token_levels (List[int]): The token levels, e.g. [512000, 1000000].
+        num_seeds (int): The number of seeds of every token level.
+        output (str, optional): The JSONL file to write. Defaults to {data_dir}/{task}.jsonl, provided data_dir
+            has no data file for the task yet.
+        data_dir (str, optional): The directory of the task files. Defaults to "data".
+        compress (str, optional): None, "zstd", "gzip" or "auto"; its suffix is appended to `output`. Defaults to None.
+        **kwargs: num_levels, num_relevant, chars_per_token and salt, see `generate_instance`.
+
+    Returns:
+        Tuple[str, int]: The path written and the number of instances.
+    """
+    codec = resolve_codec(compress) if compress is not None else "none"
+    if output is None:
+        # A second data file of the task would shadow the first one (see find_task_file)
+        try:
+            existing = find_task_file(task, data_dir)
+        except FileNotFoundError:
+            existing = None
+        if existing is not None:
+            raise FileExistsError(f"{data_dir} already has a data file for {task}: {existing}. Pass another output or data_dir.")
+        output = os.path.join(data_dir, f"{task}.jsonl")
+    output += SUFFIXES[codec]
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    num_instances = 0
+    with open_compressed(output + ".tmp", "wb", codec=codec) as file:
+        for elem in iter_generated(task, token_levels, num_seeds, **kwargs):
+            file.write(json.dumps(elem, ensure_ascii=False).encode("utf-8") + b"\n")
+            num_instances += 1
+    os.replace(output + ".tmp", output)
+    return output, num_instances
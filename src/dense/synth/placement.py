@@ -0,0 +1,80 @@
+"""
+Module: placement
+
+Where the relevant items of an instance go among the items of its context.
+
+Both task variants place `num_relevant` items among `num_items`, at one of `num_levels`
+levels:
+
+    absolute    the relevant items are contiguous, and the level moves the block from
+                the beginning (level 0) to the end (level num_levels - 1) of the context
+    relative    the relevant items are evenly spaced, and the level widens their span
+                from contiguous (level 0) to the whole context (level num_levels - 1);
+                the span starts at a random offset
+
+The locations of a level are computed arithmetically rather than drawn one at a time,
+so placing costs O(num_relevant) whatever the length of the context.
+"""
+
+PLACEMENTS = ("absolute", "relative")
+
+
+def absolute_locations(num_items, num_relevant, level, num_levels):
+    """
+    Return the locations of a contiguous block of relevant items at the given level.
+    """
+    start = round(level * (num_items - num_relevant) / max(num_levels - 1, 1))
+    return list(range(start, start + num_relevant))
+
+
+def relative_span(num_items, num_relevant, level, num_levels):
+    """
+    Return the number of items spanned by the relevant items at the given relative level.
+    """
+    return num_relevant + round(level * (num_items - num_relevant) / max(num_levels - 1, 1))
+
+
+def relative_locations(num_items, num_relevant, level, num_levels, rng):
+    """
+    Return the locations of evenly spaced relevant items spanning `relative_span` items from a random offset.
+    """
+    span = relative_span(num_items, num_relevant, level, num_levels)
+    offset = rng.randint(0, num_items - span)
+    if num_relevant == 1:
+        return [offset]
+    return [offset + round(k * (span - 1) / (num_relevant - 1)) for k in range(num_relevant)]
+
+
+def place(num_items, num_relevant, placement, level, num_levels, rng):
+    """
+    Place the relevant items of an instance.
+
+    Returns:
+        Tuple[List[int], float, int]: The sorted locations of the relevant items, their density (the
+        fraction of relevant items among the whole context (absolute) or their span (relative)), and the
+        range level (the level for relative placements, 0 for absolute ones).
+    """
+    assert placement in PLACEMENTS, f"placement should be one of {PLACEMENTS}."
+    assert 0 <= level < num_levels, f"level should be in [0, {num_levels})."
+    assert num_relevant <= num_items, "The context is too short for the relevant items."
+    if placement == "absolute":
+        return absolute_locations(num_items, num_relevant, level, num_levels), num_relevant / num_items, 0
+    span = relative_span(num_items, num_relevant, level, num_levels)
+    return relative_locations(num_items, num_relevant, level, num_levels, rng), num_relevant / span, level
+
+
+def interleave(background, relevant, locations):
+    """
+    Insert the relevant items into the background items at the given (sorted) locations.
+
+    The background is copied in slices between the locations, not item by item.
+    """
+    items, start = [], 0
+    for j, (location, item) in enumerate(zip(locations, relevant)):
+        # The location counts the j relevant items placed before it
+        end = location - j
+        items.extend(background[start:end])
+        items.append(item)
+        start = end
+    items.extend(background[start:])
+    return items
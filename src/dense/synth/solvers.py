@@ -0,0 +1,162 @@
+"""
+Module: solvers
+
+Reference solvers of the tasks: they answer the question of an instance from its
+context alone, and find the locations of the items the answer depends on.
+
+    table_sql            the rows whose Country column is the query
+    equation_solution    the equations connected to the queried variable, solved by
+                         propagating values from the equations with one unknown
+    history_reorder      the events of the queried person, sorted by year
+
+The items are scanned with whole-list operations (substring tests in comprehensions)
+rather than parsed field by field; only the items the answer depends on are parsed.
+
+The solvers read the formats of the task files (those of dense.synth, which follow the
+original data files), with some slack for spacing and LaTeX delimiters:
+
+    table_sql            rows of five columns, the Country first, e.g.
+                         "| China | Zhao Wei | 1982 | September | A |"
+    equation_solution    linear equations over variables x_{id}, e.g.
+                         "-5 x_{711} - 3 x_{674} = -1" or "\\(-5 x_{711} - 3 x_{674} = -1\\)"
+    history_reorder      events with a year and the name of their person, e.g.
+                         "In 1523, Ana Abe founded a school in Aldmoor."
+
+Items in other formats cannot be solved: `check_format` reports them before solving,
+so a file in another format is not mistaken for a file with wrong labels.
+"""
+
+import re
+from fractions import Fraction
+
+_VARIABLE = re.compile(r"x_\{(\d+)\}")
+_TERM = re.compile(r"([+-]?)(\d*)x_\{(\d+)\}")
+_EVENT_YEAR = re.compile(r"\b(\d{3,4})\b")
+# The LaTeX delimiters an equation or a variable may be written in
+_LATEX_DELIMITERS = re.compile(r"\\[()\[\]]|\$")
+
+ITEM_FORMATS = {
+    "table_sql": re.compile(r"^\s*\|(?:[^|]*\|){5}\s*$"),
+    "equation_solution": re.compile(r"^[-+\d\sx_{}]+=\s*-?\d+$"),
+    "history_reorder": re.compile(r"\b\d{3,4}\b"),
+}
+
+
+def strip_latex(text):
+    """
+    Remove the LaTeX delimiters of an equation or a variable, e.g. "\\( x_{711} \\)" -> "x_{711}".
+    """
+    return _LATEX_DELIMITERS.sub("", text).strip()
+
+
+def check_format(name, items, locations=None):
+    """
+    Check that the items of a context (or those at `locations`) are in the format the solver of a task reads.
+
+    Raises:
+        ValueError: If an item is not, with the first such item.
+    """
+    item_format = ITEM_FORMATS[name]
+    for i in locations if locations is not None else range(len(items)):
+        if not item_format.search(strip_latex(items[i]) if name == "equation_solution" else items[i]):
+            raise ValueError(f"Item {i} is not in the format of {name}: {items[i][:100]!r}.")
+
+
+def table_cells(row):
+    return [cell.strip() for cell in row.strip().strip("|").split("|")]
+
+
+def solve_table_sql(items, question):
+    """
+    Return the rows of the queried country and their locations.
+    """
+    country = question.strip()
+    # Substring test first; only the candidate rows are split into cells
+    locations = [i for i, item in enumerate(items) if country in item and table_cells(items[i])[0] == country]
+    return [items[i] for i in locations], locations
+
+
+def parse_equation(item):
+    """
+    Parse a linear equation, e.g. "-5 x_{711} - 3 x_{674} = -1".
+
+    Returns:
+        Tuple[Dict[str, int], int]: The coefficient of every variable and the constant.
+    """
+    left, right = strip_latex(item).replace(" ", "").split("=")
+    coefficients = {}
+    for sign, coefficient, variable in _TERM.findall(left):
+        value = int(coefficient or 1) * (-1 if sign == "-" else 1)
+        coefficients[variable] = coefficients.get(variable, 0) + value
+    return coefficients, int(right)
+
+
+def solve_equation_solution(items, question):
+    """
+    Solve the queried variable over the equations connected to it.
+
+    Raises:
+        ValueError: If the question is not a variable, or the connected equations do not determine it as an integer.
+    """
+    match = _VARIABLE.fullmatch(strip_latex(question))
+    if match is None:
+        raise ValueError(f"The question {question!r} is not a variable.")
+    target = match.group(1)
+
+    # Collect the connected component of the target, one substring scan of the equations per variable reached
+    component, variables, frontier = set(), {target}, [target]
+    while frontier:
+        term = f"x_{{{frontier.pop()}}}"
+        for i in [i for i, item in enumerate(items) if term in item]:
+            if i not in component:
+                component.add(i)
+                for variable in _VARIABLE.findall(items[i]):
+                    if variable not in variables:
+                        variables.add(variable)
+                        frontier.append(variable)
+
+    # Propagate the values of the equations with a single unknown until the target is known
+    equations = [parse_equation(items[i]) for i in sorted(component)]
+    values, progress = {}, True
+    while target not in values and progress:
+        progress = False
+        for coefficients, constant in equations:
+            unknown = [variable for variable, coefficient in coefficients.items() if variable not in values and coefficient]
+            if len(unknown) == 1:
+                known = sum(coefficient * values[variable] for variable, coefficient in coefficients.items() if variable in values)
+                values[unknown[0]] = Fraction(constant - known, coefficients[unknown[0]])
+                progress = True
+    if target not in values:
+        raise ValueError(f"{question} is not determined by the {len(component)} equations connected to it.")
+    if values[target].denominator != 1:
+        raise ValueError(f"{question} = {values[target]} is not an integer.")
+    return [str(values[target].numerator)], sorted(component)
+
+
+def solve_history_reorder(items, question):
+    """
+    Return the numbers of the events of the queried person in chronological order, and their locations.
+
+    Raises:
+        ValueError: If an event of the person has no year, or two have the same year (the order is ambiguous).
+    """
+    person = question.strip()
+    # The name of the person as a whole word: "Ana Abe" is not an event of "Ana Abel"
+    pattern = re.compile(rf"(?<!\w){re.escape(person)}(?!\w)")
+    locations = [i for i, item in enumerate(items) if person in item and pattern.search(item)]
+    years = {}
+    for i in locations:
+        match = _EVENT_YEAR.search(items[i])
+        if match is None:
+            raise ValueError(f"Event {i} of {question} has no year.")
+        years[i] = int(match.group(1))
+    if len(set(years.values())) < len(years):
+        raise ValueError(f"Several events of {question} have the same year.")
+    return [", ".join(str(i) for i in sorted(locations, key=years.get))], locations
+
+
+SOLVERS = {
+    "table_sql": solve_table_sql,
+    "equation_solution": solve_equation_solution,
+    "history_reorder": solve_history_reorder,
+}
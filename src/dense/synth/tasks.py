@@ -0,0 +1,309 @@
+"""
+Module: tasks
+
+The synthetic tasks: how the background items, the relevant items, the question and the
+answers of an instance are drawn, and the prompt templates they are asked with.
+
+    table_sql            a table of people; find the rows of a given country
+    equation_solution    a list of linear equations; solve a variable through a chain of
+                         equations ending in an equation of a single variable
+    history_reorder      a list of numbered events; give the events of a person in
+                         chronological order
+
+Items are drawn a column at a time (`random.Random.choices` and `sample`, which draw k
+values in one call) and formatted in one pass, rather than drawn field by field.
+"""
+
+import re
+import random
+import functools
+from abc import ABC, abstractmethod
+from typing import Any, List, NamedTuple
+
+COUNTRIES = [
+    "Argentina", "Australia", "Austria", "Belgium", "Brazil", "Canada", "Chile", "China", "Colombia", "Denmark",
+    "Egypt", "Finland", "France", "Germany", "Greece", "India", "Indonesia", "Ireland", "Italy", "Japan",
+    "Kenya", "Mexico", "Morocco", "Netherlands", "Nigeria", "Norway", "Peru", "Poland", "Portugal", "Russia",
+    "Singapore", "South Africa", "South Korea", "Spain", "Sweden", "Switzerland", "Thailand", "Turkey", "Vietnam",
+    "United Kingdom",
+]
+GIVEN_NAMES = [
+    "Ana", "Ben", "Chen", "Dara", "Elif", "Farah", "Gustav", "Hana", "Ivan", "Jun", "Kofi", "Lena", "Mateo", "Nia",
+    "Omar", "Priya", "Quinn", "Rosa", "Sven", "Tariq", "Uma", "Viktor", "Wei", "Ximena", "Yuki", "Zane", "Amara",
+    "Bruno", "Carmen", "Dmitri", "Esther", "Felix", "Greta", "Hugo", "Ines", "Jonas", "Kira", "Liam", "Mina", "Nikolai",
+]
+FAMILY_NAMES = [
+    "Abe", "Berg", "Costa", "Diaz", "Eriksen", "Fischer", "Garcia", "Hansen", "Ito", "Jensen", "Khan", "Lopez",
+    "Moreau", "Novak", "Okafor", "Petrov", "Rossi", "Silva", "Tanaka", "Ueda", "Varga", "Wang", "Yilmaz", "Zhou",
+    "Adler", "Bauer", "Conti", "Dubois", "Evans", "Ferrari", "Gomez", "Horvat", "Iqbal", "Kim", "Larsen", "Meyer",
+    "Nakamura", "Olsen", "Park", "Quispe",
+]
+MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+BLOOD_TYPES = ["A", "B", "AB", "O"]
+BIRTH_YEARS = [str(year) for year in range(1940, 2021)]
+ACTIONS = [
+    "founded a school", "signed a trade treaty", "led an expedition", "built a bridge", "published a chronicle",
+    "won a naval battle", "opened a hospital", "crossed the mountains", "negotiated a truce", "commissioned a cathedral",
+    "discovered a copper mine", "reformed the courts", "married into a noble family", "was exiled", "returned from exile",
+    "funded an observatory", "organized a census", "founded a guild", "lost a border war", "granted a charter",
+]
+PLACES = [
+    "Aldmoor", "Brisca", "Corvenna", "Dunhallow", "Elsport", "Farrowgate", "Glenmarch", "Highcastle", "Istrana",
+    "Jorvale", "Kestrel Bay", "Lowmere", "Marrowind", "Northwick", "Ostrava", "Pellamar", "Quarrydown", "Rivenhold",
+    "Saltmarsh", "Thornbury",
+]
+PEOPLE = [f"{given} {family}" for given in GIVEN_NAMES for family in FAMILY_NAMES]
+EVENT_YEARS = range(1000, 1900)
+COEFFICIENTS = [a for a in range(-9, 10) if a != 0]
+VALUES = range(-9, 10)
+CONSTANTS = range(-99, 100)
+
+# The first and following terms of a linear expression, e.g. "-5 x_" and " + 3 x_"
+_FIRST_TERM = {a: {1: "x_", -1: "-x_"}.get(a, f"{a} x_") for a in COEFFICIENTS}
+_NEXT_TERM = {a: (" + " if a > 0 else " - ") + ("x_" if abs(a) == 1 else f"{abs(a)} x_") for a in COEFFICIENTS}
+# The numbers formatted before the items of numbered contexts
+_EQUATION_NUMBER = re.compile(r"^Equation \d+: ", re.MULTILINE)
+_EVENT_NUMBER = re.compile(r"^\[\d+\] ", re.MULTILINE)
+
+
+def draw_excluding(rng, population, excluded, k):
+    """
+    Draw k indices of `population` (with replacement) different from the index `excluded`.
+    """
+    return [i + (i >= excluded) for i in rng.choices(range(len(population) - 1), k=k)]
+
+
+class Relevant(NamedTuple):
+    """
+    The relevant items of an instance, the question they answer, and what the task needs to draw the
+    background and the answers (e.g. the query, which the background must not match).
+    """
+    items: List[str]
+    question: str
+    key: Any
+
+
+class SyntheticTask(ABC):
+    """
+    Abstract base class for synthetic tasks.
+
+    Subclasses draw the background and relevant items and compute the answers; the prompts are
+    built from `system_prompt`, `context_name`, `query_instruction` (with a {query} field) and
+    `answer_instruction`.
+    """
+
+    name = None
+    num_relevant = 10
+    system_prompt = None
+    context_name = None
+    query_instruction = None
+    answer_instruction = None
+
+    @abstractmethod
+    def relevant(self, rng, num_relevant) -> Relevant:
+        """
+        Draw the relevant items of an instance and its question.
+        """
+
+    @abstractmethod
+    def background(self, rng, num_items, relevant) -> List[str]:
+        """
+        Draw `num_items` background items, none of which is relevant to the question.
+        """
+
+    @abstractmethod
+    def answers(self, relevant, locations) -> List[str]:
+        """
+        Return the answers of an instance whose relevant items are at `locations`, in the order of relevant.items.
+        """
+
+    def format_context(self, items):
+        return "\n".join(items)
+
+    def parse_context(self, context):
+        """
+        Split a context into its items, the inverse of `format_context`.
+        """
+        return context.split("\n")
+
+    def move_answers(self, answers, locations, new_locations):
+        """
+        Return the answers of an instance once its relevant items are moved from `locations` to `new_locations`.
+        """
+        return list(answers)
+
+    @functools.cached_property
+    def item_chars(self):
+        """
+        The average length of a background item in the context (newline included), measured on a sample.
+        """
+        rng = random.Random(self.name)
+        items = self.background(rng, 4096, self.relevant(rng, self.num_relevant))
+        return (len(self.format_context(items)) + 1) / len(items)
+
+    @functools.cached_property
+    def templates(self):
+        """
+        The prompt templates of the instances: the query before and after the context (default_prompt),
+        before it (query_head_prompt) or after it (query_tail_prompt).
+        """
+        context = f"Here is the {self.context_name}:\n\n{{context}}"
+        parts = {
+            "default_prompt": [self.query_instruction, context, self.query_instruction],
+            "query_head_prompt": [self.query_instruction, context],
+            "query_tail_prompt": [context, self.query_instruction],
+        }
+        return {
+            prompt_type: {"system_prompt": self.system_prompt, "user_message": "\n\n".join(part + [self.answer_instruction])}
+            for prompt_type, part in parts.items()
+        }
+
+
+class TableSQLTask(SyntheticTask):
+
+    name = "table_sql"
+    num_relevant = 10
+    system_prompt = (
+        "You are a helpful assistant. You are given a table of entries with the following columns: "
+        "Country, Name, Birth Year, Birth Month, Blood Type. "
+    )
+    context_name = "table"
+    query_instruction = "Your task is to find all the entries with the following Country: {query}"
+    answer_instruction = (
+        "You should return all the entries that match the query as a python list. For example, "
+        "['| China | Wei Wang | 1991 | August | A |', ...]. You should not generate anything else."
+    )
+
+    @staticmethod
+    def rows(countries, names, years, months, blood_types):
+        return [
+            f"| {country} | {name} | {year} | {month} | {blood_type} |"
+            for country, name, year, month, blood_type in zip(countries, names, years, months, blood_types)
+        ]
+
+    def relevant(self, rng, num_relevant):
+        country = rng.randrange(len(COUNTRIES))
+        rows = set()
+        while len(rows) < num_relevant:
+            # Distinct rows, so every answer is a distinct entry
+            k = num_relevant - len(rows)
+            rows.update(self.rows(
+                [COUNTRIES[country]] * k, rng.choices(PEOPLE, k=k), rng.choices(BIRTH_YEARS, k=k),
+                rng.choices(MONTHS, k=k), rng.choices(BLOOD_TYPES, k=k),
+            ))
+        items = sorted(rows)
+        rng.shuffle(items)
+        return Relevant(items, COUNTRIES[country], country)
+
+    def background(self, rng, num_items, relevant):
+        countries = [COUNTRIES[i] for i in draw_excluding(rng, COUNTRIES, relevant.key, num_items)]
+        return self.rows(
+            countries, rng.choices(PEOPLE, k=num_items), rng.choices(BIRTH_YEARS, k=num_items),
+            rng.choices(MONTHS, k=num_items), rng.choices(BLOOD_TYPES, k=num_items),
+        )
+
+    def answers(self, relevant, locations):
+        return list(relevant.items)
+
+
+class EquationSolutionTask(SyntheticTask):
+
+    name = "equation_solution"
+    num_relevant = 5
+    system_prompt = "You are a helpful assistant. You are given a list of numbered linear equations over integer variables. "
+    context_name = "list of equations"
+    query_instruction = "Your task is to find the value of the following variable: {query}"
+    answer_instruction = (
+        "Only some of the equations are needed: follow the equations that involve the variable until one has a single "
+        "variable. Solve them step by step, and end your response with 'Therefore, the answer is' followed by the "
+        "integer value of the variable."
+    )
+
+    def format_context(self, items):
+        return "\n".join([f"Equation {i}: {item}" for i, item in enumerate(items)])
+
+    def parse_context(self, context):
+        return _EQUATION_NUMBER.sub("", context).split("\n")
+
+    def relevant(self, rng, num_relevant):
+        # A chain x_0 -> x_1 -> ... -> x_{n-1}, each equation linking a variable to the next one, the last one alone
+        variables = rng.sample(range(100000), num_relevant)
+        values = rng.choices(VALUES, k=num_relevant)
+        a, b = rng.choices(COEFFICIENTS, k=num_relevant), rng.choices(COEFFICIENTS, k=num_relevant)
+        items = [
+            f"{_FIRST_TERM[a[k]]}{{{variables[k]}}}{_NEXT_TERM[b[k]]}{{{variables[k + 1]}}} = "
+            f"{a[k] * values[k] + b[k] * values[k + 1]}"
+            for k in range(num_relevant - 1)
+        ]
+        items.append(f"{_FIRST_TERM[a[-1]]}{{{variables[-1]}}} = {a[-1] * values[-1]}")
+        rng.shuffle(items)
+        return Relevant(items, f"x_{{{variables[0]}}}", (set(variables), values[0]))
+
+    def background(self, rng, num_items, relevant):
+        # Equations of two other variables (drawn above the ids of the chain when they collide)
+        chain = relevant.key[0]
+        first = [v + 100000 if v in chain else v for v in rng.choices(range(100000), k=num_items)]
+        second = [v + 100000 if v in chain else v for v in rng.choices(range(100000), k=num_items)]
+        a, b = rng.choices(COEFFICIENTS, k=num_items), rng.choices(COEFFICIENTS, k=num_items)
+        constants = rng.choices(CONSTANTS, k=num_items)
+        return [
+            f"{_FIRST_TERM[a[k]]}{{{first[k]}}}{_NEXT_TERM[b[k]]}{{{second[k]}}} = {constants[k]}"
+            for k in range(num_items)
+        ]
+
+    def answers(self, relevant, locations):
+        return [str(relevant.key[1])]
+
+
+class HistoryReorderTask(SyntheticTask):
+
+    name = "history_reorder"
+    num_relevant = 8
+    system_prompt = "You are a helpful assistant. You are given a numbered list of historical events. "
+    context_name = "list of events"
+    query_instruction = "Your task is to put all the events of the following person in chronological order: {query}"
+    answer_instruction = (
+        "You should return the numbers of the events of this person, from the earliest to the latest, separated by "
+        "commas. For example, 12, 3, 7. You should not generate anything else."
+    )
+
+    def format_context(self, items):
+        return "\n".join([f"[{i}] {item}" for i, item in enumerate(items)])
+
+    def parse_context(self, context):
+        return _EVENT_NUMBER.sub("", context).split("\n")
+
+    @staticmethod
+    def events(people, years, actions, places):
+        return [f"In {year}, {person} {action} in {place}." for person, year, action, place in zip(people, years, actions, places)]
+
+    def relevant(self, rng, num_relevant):
+        person = rng.randrange(len(PEOPLE))
+        # Distinct years, so the chronological order is unique; they come in random order
+        years = rng.sample(EVENT_YEARS, num_relevant)
+        items = self.events(
+            [PEOPLE[person]] * num_relevant, years, rng.choices(ACTIONS, k=num_relevant), rng.choices(PLACES, k=num_relevant)
+        )
+        return Relevant(items, PEOPLE[person], (person, years))
+
+    def background(self, rng, num_items, relevant):
+        people = [PEOPLE[i] for i in draw_excluding(rng, PEOPLE, relevant.key[0], num_items)]
+        return self.events(
+            people, rng.choices(EVENT_YEARS, k=num_items), rng.choices(ACTIONS, k=num_items), rng.choices(PLACES, k=num_items)
+        )
+
+    def answers(self, relevant, locations):
+        years = relevant.key[1]
+        order = sorted(range(len(years)), key=lambda k: years[k])
+        return [", ".join(str(locations[k]) for k in order)]
+
+    def move_answers(self, answers, locations, new_locations):
+        # The answer lists the numbers of the events, which are their locations
+        moved = {str(location): str(new_location) for location, new_location in zip(locations, new_locations)}
+        return [", ".join(moved[number] for number in answer.split(", ")) for answer in answers]
+
+
+TASKS = {task.name: task for task in (TableSQLTask(), EquationSolutionTask(), HistoryReorderTask())}
@@ -0,0 +1,154 @@
+"""
+Module: validate
+
+Check a task file before it is evaluated: every instance is solved from its context by
+the reference solver of its task (see solvers.py), and its answers and location are
+compared with the solution. Instances are streamed from the file and validated in
+parallel, in chunks, by a pool of processes; at most a few chunks per process are in
+flight, so memory does not grow with the file.
+
+The report counts the instances with each problem:
+
+    format        the relevant items are not in a format the solver reads (see solvers.py);
+                  the instance is not solved
+    unsolvable    the solver found no unique answer (e.g. an undetermined variable)
+    answers       the answers differ from the solution
+    location      the location differs from the items the solution depends on
+"""
+
+import os
+import time
+import concurrent.futures
+
+from dense.storage import context_text, find_task_file, iter_instances
+from .generator import split_task
+from .solvers import SOLVERS, check_format
+
+# Instances validated per job, and jobs in flight per process
+CHUNK_SIZE = 16
+JOBS_PER_WORKER = 4
+
+
+def validate_instance(elem, task):
+    """
+    Solve an instance and compare its labels with the solution.
+
+    Returns:
+        Dict[str, Any]: The uuid, token_level and level of the instance, its problems (empty if it is valid) and,
+        if it has any, the expected answers and location (or the reason it is unsolvable or not in a supported format).
+    """
+    synthetic_task, _ = split_task(task)
+    result = {"id": elem.get("uuid"), "token_level": elem.get("token_level"), "level": elem.get("level"), "problems": []}
+    items = synthetic_task.parse_context(context_text(elem))
+    try:
+        check_format(synthetic_task.name, items, [i for i in elem["location"] if 0 <= i < len(items)])
+    except ValueError as e:
+        result["problems"].append("format")
+        result["reason"] = str(e)
+        return result
+    try:
+        answers, locations = SOLVERS[synthetic_task.name](items, elem["question"])
+    except ValueError as e:
+        result["problems"].append("unsolvable")
+        result["reason"] = str(e)
+        return result
+
+    # The rows of table_sql may be listed in any order
+    same_answers = sorted(answers) == sorted(elem["answers"]) if synthetic_task.name == "table_sql" else answers == elem["answers"]
+    if not same_answers:
+        result["problems"].append("answers")
+        result["expected_answers"] = answers
+    if locations != sorted(elem["location"]):
+        result["problems"].append("location")
+        result["expected_location"] = locations
+    return result
+
+
+def _validate_chunk(chunk, task):
+    return [validate_instance(elem, task) for elem in chunk]
+
+
+def _chunks(instances, chunk_size):
+    chunk = []
+    for elem in instances:
+        if "context" not in elem:
+            # Contexts kept elsewhere (segment stores, variant bases) are assembled before being sent to a worker
+            elem = dict(elem, context=context_text(elem))
+        chunk.append(elem)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_instances(instances, task, num_workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Validate instances in parallel.
+
+    Args:
+        instances (Iterable[Dict]): The instances, e.g. streamed from a task file.
+        task (str): Their task, e.g. "table_sql_absolute".
+        num_workers (int, optional): The number of processes. Defaults to the number of CPUs; 1 validates in process.
+        chunk_size (int, optional): The number of instances per job. Defaults to 16.
+
+    Yields:
+        Dict[str, Any]: The result of every instance (see `validate_instance`), in order.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1:
+        for chunk in _chunks(instances, chunk_size):
+            yield from _validate_chunk(chunk, task)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        pending = []
+        for chunk in _chunks(instances, chunk_size):
+            pending.append(executor.submit(_validate_chunk, chunk, task))
+            # Bound the chunks in flight, so the file is read as fast as it is validated
+            if len(pending) >= num_workers * JOBS_PER_WORKER:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def validate_file(task, data_dir="data", path=None, num_workers=None, max_examples=20):
+    """
+    Validate every instance of a task file and summarize the problems found.
+
+    Args:
+        task (str): The task, e.g. "table_sql_absolute".
+        data_dir (str, optional): The directory of the task files. Defaults to "data".
+        path (str, optional): The data file. Defaults to the task's file in data_dir (see find_task_file).
+        num_workers (int, optional): The number of processes. Defaults to the number of CPUs.
+        max_examples (int, optional): The number of invalid instances listed in the report. Defaults to 20.
+
+    Returns:
+        Dict[str, Any]: The report: the number of instances and of valid ones (in total and per token level),
+        the number of instances with each problem, examples of invalid instances and the time taken.
+    """
+    path = path or find_task_file(task, data_dir)
+    start = time.time()
+    report = {
+        "task": task,
+        "path": path,
+        "num_instances": 0,
+        "num_valid": 0,
+        "problems": {"format": 0, "unsolvable": 0, "answers": 0, "location": 0},
+        "token_levels": {},
+        "invalid": [],
+    }
+    for result in validate_instances(iter_instances(path), task, num_workers=num_workers):
+        counts = report["token_levels"].setdefault(str(result["token_level"]), {"num_instances": 0, "num_valid": 0})
+        report["num_instances"] += 1
+        counts["num_instances"] += 1
+        if not result["problems"]:
+            report["num_valid"] += 1
+            counts["num_valid"] += 1
+            continue
+        for problem in result["problems"]:
+            report["problems"][problem] += 1
+        if len(report["invalid"]) < max_examples:
+            report["invalid"].append(result)
+    report["seconds"] = round(time.time() - start, 2)
+    return report
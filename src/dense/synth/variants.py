@@ -0,0 +1,173 @@
+"""
+Module: variants
+
+Positional variants of an instance, assembled on demand. The level variants of an
+instance share its background and relevant items and differ only in where the
+relevant items sit, so a variant is stored as its placement alone:
+
+    context_base                            its base: the segment store path and segment ids of
+                                            the base context (see dense.storage.segments), the
+                                            synthetic task and the location of the base
+    location                                the locations of its relevant items
+    level, density, range_level, answers    those of its placement, see placement.py
+    context_length                          the length of its context, that of the base
+
+and everything else (question, prompt templates, ...) is shared with the base. A variant
+is self-contained: its context is assembled from the segment store when its prompt is
+built (dense.storage.segments.context_text), in any process and from a variant file
+read back, and the items of a base are parsed once per process for all its variants.
+A grid of any number of levels costs no more memory than its base.
+
+The location of a base must index the items of its context (the lines of the context,
+without their numbers for numbered contexts), as in the generated task files.
+"""
+
+import os
+import json
+import uuid
+import random
+import functools
+
+from dense.storage.dataset import iter_instances
+from dense.storage.segments import SegmentStoreWriter, context_text, open_segment_store, segment_instance
+from .tasks import TASKS
+from .generator import split_task
+from .placement import PLACEMENTS, interleave, place
+
+# The fields of a base instance its variants do not share: the context, and where it is kept
+CONTEXT_FIELDS = ("context", "context_digest", "context_store", "context_segments", "context_length")
+
+
+def split_items(synthetic_task, context, location):
+    """
+    Split the items of a context into its background items and its relevant items (those at `location`).
+    """
+    items = synthetic_task.parse_context(context)
+    relevant = set(location)
+    return [item for i, item in enumerate(items) if i not in relevant], [items[i] for i in location]
+
+
+class VariantBase:
+    """
+    The background and relevant items of a base instance, parsed once and shared by its variants.
+
+    The context of the base must be in a segment store, which the variants refer to: an instance read from a
+    {task}.refs.jsonl file (see dense.storage.convert_to_segments), or any instance with a `writer` to add its
+    context to. The variants can be assembled once the writer is closed.
+
+    Args:
+        elem (Dict): The base instance.
+        task (str): Its task, e.g. "table_sql_absolute".
+        writer (SegmentStoreWriter, optional): The store to add the context of the base to, if it is not in one.
+    """
+
+    def __init__(self, elem, task, writer=None):
+        self.synthetic_task, _ = split_task(task)
+        self.key = f"{self.synthetic_task.name}/{elem['uuid']}"
+        context = context_text(elem)
+        if "context_segments" not in elem:
+            assert writer is not None, "The context of the base is not in a segment store: pass a SegmentStoreWriter."
+            elem = segment_instance(elem, writer)
+        self.fields = {field: value for field, value in elem.items() if field not in CONTEXT_FIELDS}
+        self.fields["context_base"] = {
+            "store": elem["context_store"],
+            "segments": elem["context_segments"],
+            "task": self.synthetic_task.name,
+            "location": elem["location"],
+        }
+        # The variants have the same items, numbered the same way: their contexts have the length of the base
+        self.fields["context_length"] = elem.get("context_length", len(context))
+        self.background, self.relevant = split_items(self.synthetic_task, context, elem["location"])
+        self.num_items = len(self.background) + len(self.relevant)
+
+    def view(self, placement, level, num_levels):
+        """
+        Return the variant with the relevant items placed at a level of a grid.
+
+        Args:
+            placement (str): "absolute" (a contiguous band moved along the context) or "relative" (evenly spaced
+                items over a span that widens with the level).
+            level (int): The level, in [0, num_levels).
+            num_levels (int): The number of levels of the grid; it may be much finer than the levels stored.
+
+        Returns:
+            Dict[str, Any]: The variant, an instance whose context is assembled from the base when it is read.
+        """
+        assert placement in PLACEMENTS, f"placement should be one of {PLACEMENTS}."
+        view_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.key}#{placement}:{level}/{num_levels}"))
+        # The random offset of a relative span is drawn from the id of the variant, so a view is reproducible
+        locations, density, range_level = place(
+            self.num_items, len(self.relevant), placement, level, num_levels, random.Random(view_id)
+        )
+        view = dict(self.fields)
+        view.update({
+            "uuid": view_id,
+            "level": f"level {level}",
+            "answers": self.synthetic_task.move_answers(self.fields["answers"], self.fields["location"], locations),
+            "location": locations,
+            "density": density,
+            "range_level": range_level,
+        })
+        return view
+
+
+@functools.lru_cache(maxsize=16)
+def _stored_items(store, segments, name, location):
+    return split_items(TASKS[name], open_segment_store(store).assemble(segments), location)
+
+
+def assemble_variant(elem):
+    """
+    Return the context of a variant: the items of its base, read from the segment store, with the relevant
+    items at elem["location"].
+    """
+    base = elem["context_base"]
+    background, relevant = _stored_items(base["store"], tuple(base["segments"]), base["task"], tuple(base["location"]))
+    return TASKS[base["task"]].format_context(interleave(background, relevant, elem["location"]))
+
+
+def positional_views(elem, task, placement, num_levels, levels=None, writer=None):
+    """
+    Return the positional variants of an instance at every level of a grid.
+
+    Args:
+        elem (Dict): The base instance.
+        task (str): Its task, e.g. "table_sql_absolute".
+        placement (str): "absolute" or "relative", see `VariantBase.view`.
+        num_levels (int): The number of levels of the grid.
+        levels (Iterable[int], optional): Only these levels. Defaults to all.
+        writer (SegmentStoreWriter, optional): The store to add the context of the base to, see `VariantBase`.
+
+    Returns:
+        List[Dict[str, Any]]: The variants, sharing the items of the base.
+    """
+    base = VariantBase(elem, task, writer)
+    return [base.view(placement, level, num_levels) for level in (levels if levels is not None else range(num_levels))]
+
+
+def write_variants(path, task, placement, num_levels, store, output, base_level="level 0"):
+    """
+    Write the positional variants of the instances of a data file to a JSONL task file, streaming.
+
+    Args:
+        path (str): The data file of the base instances.
+        task (str): Their task, e.g. "table_sql_absolute".
+        placement (str): "absolute" or "relative", see `VariantBase.view`.
+        num_levels (int): The number of levels of the grid of every base.
+        store (str): The segment store of the base contexts; those not in a store yet are added to it.
+        output (str): The JSONL file to write.
+        base_level (str, optional): Only the instances at this level are bases, e.g. one per token level and seed.
+            None uses every instance. Defaults to "level 0".
+
+    Returns:
+        int: The number of variants written.
+    """
+    num_variants = 0
+    # The variants can be read once the writer is closed and the index of the store written
+    with SegmentStoreWriter(store) as writer, open(output + ".tmp", "w", encoding="utf-8") as file:
+        for elem in iter_instances(path, lambda elem: base_level is None or elem["level"] == base_level):
+            for view in positional_views(elem, task, placement, num_levels, writer=writer):
+                file.write(json.dumps(view, ensure_ascii=False) + "\n")
+                num_variants += 1
+    os.replace(output + ".tmp", output)
+    return num_variants
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import uuid
+import random
+
+import pytest
+
+# The package is run from the source tree (PYTHONPATH=src), as the eval scripts are
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+# Importing dense.llm must not create API clients or need API keys
+os.environ.setdefault("LLM_OFFLINE", "1")
+
+
+COUNTRIES = ["China", "France", "Brazil", "Kenya", "Japan", "Peru"]
+TABLE_PROMPT = {
+    "system_prompt": "You are a helpful assistant. You are given a table of entries with the following columns: "
+                     "Country, Name, Birth Year, Birth Month, Blood Type. ",
+    "user_message": "Here is the table:\n\n{context}\n\nYour task is to find all the entry with the following Country:"
+                    "\n\n{query}\n\nYou should return all the entries that match the query as a python list.",
+}
+
+
+def table_instance(token_level, seed, level, num_rows=40, num_relevant=4):
+    """
+    A table_sql instance in the format of the task files: "| Country | Name | Year | Month | Blood type |" rows,
+    the rows of the queried country placed at `level`.
+    """
+    rng = random.Random(f"{token_level}:{seed}:{level}")
+
+    def row(country):
+        return f"| {country} | Name {rng.randrange(1000)} | {rng.randrange(1950, 2020)} | May | {rng.choice('ABO')} |"
+
+    start = level * (num_rows - num_relevant) // 3
+    location = list(range(start, start + num_relevant))
+    rows = [row("China") if i in location else row(rng.choice(COUNTRIES[1:])) for i in range(num_rows)]
+    return {
+        "uuid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "token_level": token_level,
+        "seed_id": f"seed_{seed}",
+        "level": f"level {level}",
+        "context": "\n".join(rows),
+        "question": "China",
+        "answers": [rows[i] for i in location],
+        "location": location,
+        "density": num_relevant / num_rows,
+        "range_level": 1,
+        "default_prompt": TABLE_PROMPT,
+        "query_head_prompt": TABLE_PROMPT,
+        "query_tail_prompt": TABLE_PROMPT,
+    }
+
+
+@pytest.fixture
+def instances():
+    return [
+        table_instance(token_level, seed, level)
+        for token_level in (1000, 2000) for seed in (1, 2, 3) for level in range(3)
+    ]
+
+
+@pytest.fixture
+def data_dir(tmp_path, instances):
+    """
+    A data directory holding data/table_sql_absolute.json.
+    """
+    path = tmp_path / "data"
+    path.mkdir()
+    with open(path / "table_sql_absolute.json", "w") as file:
+        json.dump(instances, file, indent=4)
+    return str(path)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Replace the generation of dense.runner.pipeline with a model answering the table queries correctly, and count
+    the prompts it is sent.
+    """
+    pytest.importorskip("dense.llm")
+    from dense.runner import pipeline
+
+    calls = []
+
+    def llm_generate(inputs, model, callback=None, n=1, **kwargs):
+        responses = []
+        for i in range(len(inputs)):
+            message = inputs[i]["user_message"]
+            calls.append(message)
+            query = message.rsplit("following Country:\n\n", 1)[1].split("\n")[0]
+            response = str([line for line in message.split("\n") if line.startswith(f"| {query} |")])
+            response = [response] * n if n > 1 else response
+            responses.append(response)
+            if callback is not None:
+                callback(i, response, None)
+        return responses
+
+    monkeypatch.setattr(pipeline, "llm_generate", llm_generate)
+    return calls
+
+
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    """
+    The on-disk response cache shared by the LLM backends, moved to a temporary directory for the test.
+    """
+    pytest.importorskip("dense.llm")
+    from dense.llm import gpt4omini
+
+    cache = gpt4omini.memory
+    location = str(tmp_path / "cache")
+    monkeypatch.setattr(cache, "location", location)
+    monkeypatch.setattr(cache, "entries_dir", os.path.join(location, "responses"))
+    monkeypatch.setattr(cache, "dictionaries_dir", os.path.join(location, "dictionaries"))
+    monkeypatch.setattr(cache, "_index", None)
+    monkeypatch.setattr(cache, "_codec", None)
+    return cache
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from dense.storage import ResponseCache, export_bundle, import_bundle, merge_bundles, verify_bundle
+from dense.storage.bundle import entry_digest
+from dense.storage.codec import open_compressed
+
+ESCAPING = {"key": "../../escaped", "value": ""}
+
+
+def key(i):
+    return f"{i:064x}"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    for i, (model, task) in enumerate([
+        ("gpt-4o-mini", "table_sql_absolute"),
+        ("gpt-4o-mini", "history_reorder_relative"),
+        ("qwen2.5-7b-instruct", "table_sql_absolute"),
+        ("qwen2.5-72b-instruct", None),
+    ]):
+        cache.put(key(i), f"response {i}", {"model": model, "task": task, "created": 1000.0 * i})
+    return cache
+
+
+def rewrite(path, edit):
+    with open_compressed(path) as file:
+        lines = file.read().decode("utf-8").splitlines()
+    with open_compressed(path, "wb") as file:
+        file.write(("\n".join(edit(lines)) + "\n").encode("utf-8"))
+
+
+def test_export_filters(cache, tmp_path):
+    path = str(tmp_path / "bundle.zst")
+    assert export_bundle(cache, path) == 4
+    assert export_bundle(cache, path, models="qwen2.5-*") == 2
+    assert export_bundle(cache, path, tasks="table_sql_*") == 2
+    assert export_bundle(cache, path, models="gpt-4o-mini", since=1000.0) == 1
+    assert export_bundle(cache, path, until=2000.0) == 2
+    assert verify_bundle(path) == 2
+
+
+def test_import_and_merge(cache, tmp_path):
+    first, second, merged = (str(tmp_path / name) for name in ("gpt.zst", "sql.zst", "merged.zst"))
+    export_bundle(cache, first, models="gpt-4o-mini")
+    export_bundle(cache, second, tasks="table_sql_absolute")
+    # The entry of gpt-4o-mini on table_sql_absolute is in both bundles
+    assert merge_bundles([first, second], merged) == 3
+
+    target = ResponseCache(str(tmp_path / "target"))
+    target.put(key(0), "kept", {"model": "gpt-4o-mini"})
+    assert import_bundle(target, merged) == (2, 1)
+    assert target.get(key(0))["value"] == "kept"
+    assert target.get(key(2))["value"] == "response 2"
+    assert import_bundle(target, merged, overwrite=True, models="gpt-4o-mini") == (2, 0)
+    assert target.get(key(0))["value"] == "response 0"
+
+
+@pytest.mark.parametrize("corrupt", [
+    # An entry modified after it was written
+    lambda lines: [lines[0], lines[1].replace("response", "Response")] + lines[2:],
+    # A bundle cut before its trailer
+    lambda lines: lines[:-1],
+    # An entry whose key would escape the cache directory
+    lambda lines: [lines[0], json.dumps({"sha256": entry_digest(ESCAPING), "entry": ESCAPING})] + lines[2:],
+])
+def test_corrupted_bundles_are_rejected(cache, tmp_path, corrupt):
+    path = str(tmp_path / "bundle.zst")
+    export_bundle(cache, path)
+    rewrite(path, corrupt)
+    with pytest.raises(ValueError):
+        verify_bundle(path)
+    target = ResponseCache(str(tmp_path / "target"))
+    with pytest.raises(ValueError):
+        import_bundle(target, path)
+    assert list(target.keys()) == []
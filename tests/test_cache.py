@@ -0,0 +1,113 @@
+import os
+import json
+import uuid
+import pickle
+import warnings
+
+import pytest
+
+from dense.storage import Codec, ResponseCache
+from dense.storage.codec import detect_codec, open_compressed, zstandard
+
+CODECS = ["gzip", "none"] + (["zstd"] if zstandard is not None else [])
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codec_round_trip(codec):
+    data = json.dumps({"value": "| China | Zhao Wei | 1982 | September | A |" * 50}).encode("utf-8")
+    compressed = Codec(codec).compress(data)
+    assert detect_codec(compressed) == codec
+    if codec != "none":
+        assert len(compressed) < len(data)
+    # The codec is detected from the data: a codec reads data written with the others
+    assert Codec("gzip" if codec == "zstd" else CODECS[-1]).decompress(compressed) == data
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_open_compressed(tmp_path, codec):
+    path = str(tmp_path / "data.jsonl")
+    with open_compressed(path, "wb", codec=codec) as file:
+        for i in range(100):
+            file.write(f'{{"i": {i}}}\n'.encode("utf-8"))
+    with open_compressed(path) as file:
+        assert [json.loads(line)["i"] for line in file] == list(range(100))
+
+
+def cached_call(cache):
+    @cache.cache
+    def single_generate(input_dict, model="m", temp=0.0, n=1):
+        single_generate.calls += 1
+        return f"response to {input_dict['user_message']}"
+
+    single_generate.calls = 0
+    return single_generate
+
+
+def test_response_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), codec="gzip")
+    single_generate = cached_call(cache)
+    input_dict = {"system_prompt": "s", "user_message": "u", "meta": {"task": "table_sql_absolute"}}
+    assert single_generate(input_dict) == "response to u"
+    assert single_generate(input_dict) == "response to u"
+    assert single_generate.calls == 1
+    # The 'meta' tags describe the entry but are not part of the key
+    assert single_generate.cache_key(dict(input_dict, meta={})) == single_generate.cache_key(input_dict)
+    entry = cache.get(single_generate.cache_key(input_dict))
+    assert entry["model"] == "m" and entry["task"] == "table_sql_absolute" and entry["params"] == {"temp": 0.0, "n": 1}
+    with open(cache.path(entry["key"]), "rb") as file:
+        assert detect_codec(file.read()) == "gzip"
+
+
+def test_recompress_keeps_expired_entries_and_statistics(tmp_path):
+    location = str(tmp_path / "cache")
+    cache = ResponseCache(location, codec="none", ttl="old=1d")
+    cache.put("a" * 64, "fresh " * 100, {"model": "new"})
+    cache.put("b" * 64, "expired " * 100, {"model": "old", "created": 0})
+    cache.get("a" * 64)
+    cache.index.flush()
+    assert cache.get("b" * 64) is None
+
+    recompressed = ResponseCache(location, codec="gzip", ttl="old=1d")
+    before, after = recompressed.recompress()
+    assert after < before
+    assert recompressed.get("a" * 64)["value"] == "fresh " * 100
+    assert recompressed._read("b" * 64)["value"] == "expired " * 100
+    stats = {row["model"]: row for row in recompressed.stats()}
+    assert stats["new"]["hits"] == 2 and stats["new"]["bytes"] == os.path.getsize(recompressed.path("a" * 64))
+    # The expired entry is still deleted by gc
+    assert recompressed.gc()["expired"] == 1
+
+
+def write_joblib_call(location, function_dir, arguments, output):
+    """
+    Write a call as joblib's Memory caches it: {location}/joblib/{module path}/{function}/{call hash}/.
+    """
+    path = os.path.join(location, "joblib", *function_dir.split("."), uuid.uuid4().hex)
+    os.makedirs(path)
+    with open(os.path.join(path, "metadata.json"), "w") as file:
+        json.dump({"duration": 1.0, "input_args": {name: repr(arg) for name, arg in arguments.items()}, "time": 1e9}, file)
+    with open(os.path.join(path, "output.pkl"), "wb") as file:
+        pickle.dump(output, file)
+
+
+def test_import_joblib(tmp_path):
+    location = str(tmp_path / "cache")
+    os.makedirs(location)
+    cache = ResponseCache(location, codec="gzip")
+    single_generate = cached_call(cache)
+    function_name = f"{single_generate.__module__}.{single_generate.__qualname__}"
+    input_dict = {"system_prompt": "s", "user_message": "u"}
+    # Cached before `n` was a parameter: the import binds it to its default
+    write_joblib_call(location, function_name, {"input_dict": input_dict, "model": "m", "temp": 0.0}, "old response")
+
+    with pytest.warns(UserWarning, match="import_joblib"):
+        cache.check_legacy()
+    assert cache.import_joblib() == (1, 0)
+    assert single_generate(input_dict) == "old response"
+    assert single_generate.calls == 0
+    assert cache.get(single_generate.cache_key(input_dict))["created"] == 1e9
+    # Imported once: no more warnings, and importing again skips the entries
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        cache.check_legacy()
+    assert cache.import_joblib() == (0, 1)
@@ -0,0 +1,68 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from dense.storage import ColumnarDataset, convert_to_columnar, open_columnar
+
+SLICES = [(1000, 1000, 2), (0, 128000, 1), (2000, 4000, 3)]
+
+
+def expected_slice(instances, bounds):
+    lower, upper, seed_num = bounds
+    return [
+        elem for elem in instances
+        if lower <= elem["token_level"] <= upper and int(elem["seed_id"].split("_")[-1]) <= seed_num
+    ]
+
+
+@pytest.fixture
+def columnar(data_dir):
+    convert_to_columnar(os.path.join(data_dir, "table_sql_absolute.json"), row_group_bytes=4096)
+    return open_columnar("table_sql_absolute", data_dir)
+
+
+def test_select_slices(columnar, instances):
+    assert len(columnar) == len(instances)
+    selected = columnar.select_slices(SLICES)
+    # Every field round-trips, with its type (answers and location are lists, density a float)
+    assert selected == {bounds: expected_slice(instances, bounds) for bounds in SLICES}
+    assert columnar.read([]) == []
+
+
+def test_row_groups_hold_one_token_level(columnar, instances):
+    groups = {}
+    for row_group, token_level in zip(columnar.metadata["row_group"].to_pylist(), columnar.metadata["token_level"].to_pylist()):
+        groups.setdefault(row_group, set()).add(token_level)
+    assert len(groups) > 2 and all(len(levels) == 1 for levels in groups.values())
+
+
+def test_stale_copies_are_ignored(data_dir, columnar, instances):
+    path = os.path.join(data_dir, "table_sql_absolute.json")
+    assert not columnar.is_stale(data_dir)
+    with open(path, "w") as file:
+        json.dump(instances[:3], file)
+    assert open_columnar("table_sql_absolute", data_dir) is None
+
+    convert_to_columnar(path)
+    assert len(open_columnar("table_sql_absolute", data_dir)) == 3
+    # Without its data file, the copy is the task
+    os.remove(path)
+    assert len(open_columnar("table_sql_absolute", data_dir)) == 3
+
+
+def test_load_task_slices_prefers_fresh_copies(data_dir, columnar, instances, monkeypatch):
+    pytest.importorskip("dense.llm")
+    from dense.runner.pipeline import load_task_slices
+
+    calls = []
+    monkeypatch.setattr(ColumnarDataset, "select_slices", lambda self, slices: calls.append(slices) or {})
+    load_task_slices("table_sql_absolute", SLICES, data_dir)
+    assert len(calls) == 1
+
+    with open(os.path.join(data_dir, "table_sql_absolute.json"), "w") as file:
+        json.dump(instances[:3], file)
+    selected = load_task_slices("table_sql_absolute", SLICES, data_dir)
+    assert len(calls) == 1 and selected[(0, 128000, 1)] == expected_slice(instances[:3], (0, 128000, 1))
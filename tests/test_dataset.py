@@ -0,0 +1,61 @@
+import io
+import os
+import json
+
+import pytest
+
+from dense.storage import convert_to_jsonl, find_task_file, iter_instances
+from dense.storage.dataset import iter_json_array
+
+SLICES = [(1000, 1000, 2), (0, 128000, 1), (2000, 4000, 3)]
+
+
+def expected_slice(instances, bounds):
+    lower, upper, seed_num = bounds
+    return [
+        elem for elem in instances
+        if lower <= elem["token_level"] <= upper and int(elem["seed_id"].split("_")[-1]) <= seed_num
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_iter_json_array(instances, chunk_size):
+    text = json.dumps(instances + [1.5, "]", [], {"a": [1, 2]}, None, 12345678], indent=2)
+    assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == json.loads(text)
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+
+
+@pytest.mark.parametrize("text", ["", "{}", "[1, 2", "[1 2]", '[{"a": 1}'])
+def test_iter_json_array_rejects_invalid_arrays(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), chunk_size=4))
+
+
+@pytest.mark.parametrize("compress", [None, "gzip"])
+def test_convert_to_jsonl(data_dir, instances, compress):
+    path = os.path.join(data_dir, "table_sql_absolute.json")
+    output, num_instances = convert_to_jsonl(path, compress=compress)
+    assert num_instances == len(instances)
+    assert output == path[:-len(".json")] + (".jsonl.gz" if compress else ".jsonl")
+    # The JSONL file is preferred to the JSON array
+    assert find_task_file("table_sql_absolute", data_dir) == output
+    assert list(iter_instances(output)) == instances
+    selected = lambda elem: elem["token_level"] == 2000
+    assert list(iter_instances(output, selected)) == [elem for elem in instances if selected(elem)]
+
+
+def test_find_task_file_missing(data_dir):
+    with pytest.raises(FileNotFoundError):
+        find_task_file("history_reorder_absolute", data_dir)
+
+
+@pytest.mark.parametrize("convert", [False, True])
+def test_load_task_slices(data_dir, instances, convert):
+    pytest.importorskip("dense.llm")
+    from dense.runner.pipeline import load_task_slice, load_task_slices
+
+    if convert:
+        convert_to_jsonl(os.path.join(data_dir, "table_sql_absolute.json"), compress="gzip")
+    selected = load_task_slices("table_sql_absolute", SLICES, data_dir)
+    assert selected == {bounds: expected_slice(instances, bounds) for bounds in SLICES}
+    assert load_task_slice("table_sql_absolute", *SLICES[0], data_dir=data_dir) == expected_slice(instances, SLICES[0])
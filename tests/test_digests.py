@@ -0,0 +1,74 @@
+import os
+import copy
+import json
+
+import pytest
+
+from dense.storage import ResponseCache, context_digest, prompt_digests, strip_context_digest
+
+
+def test_prompt_digests(instances):
+    elem = instances[0]
+    digests = prompt_digests(elem, "default_prompt")
+    # The same prompt from another copy of the instance, e.g. in another process
+    assert prompt_digests(copy.deepcopy(elem), "default_prompt") == digests
+    assert prompt_digests(instances[1], "default_prompt")["context"] != digests["context"]
+    assert prompt_digests(elem, "query_tail_prompt")["context"] == digests["context"]
+
+
+def test_strip_context_digest(instances):
+    elem = instances[0]
+    context_digest(elem)
+    assert "context_digest" not in strip_context_digest(elem)
+    segmented = {"context_segments": [0], "context_digest": "d"}
+    assert strip_context_digest(segmented) is segmented
+
+
+def cached_generate(cache):
+    @cache.cache
+    def single_generate(input_dict, model="m"):
+        single_generate.calls += 1
+        return "new"
+
+    single_generate.calls = 0
+    return single_generate
+
+
+def test_legacy_full_prompt_keys(tmp_path, monkeypatch, instances):
+    cache = ResponseCache(str(tmp_path / "cache"), codec="none")
+    single_generate = cached_generate(cache)
+    elem = instances[0]
+    input_dict = {"system_prompt": "s", "user_message": elem["context"]}
+    # Cached before prompt digests were used: keyed by the full prompt
+    single_generate.seed("old", input_dict)
+    tagged = dict(input_dict, meta={"prompt": prompt_digests(elem, "default_prompt")})
+
+    monkeypatch.delenv("LLM_CACHE_LEGACY_KEYS", raising=False)
+    with pytest.raises(KeyError):
+        single_generate.lookup(tagged)
+
+    monkeypatch.setenv("LLM_CACHE_LEGACY_KEYS", "1")
+    assert single_generate.lookup(tagged) == "old"
+    # Migrated to the digest key on first use
+    monkeypatch.delenv("LLM_CACHE_LEGACY_KEYS")
+    assert single_generate(tagged) == "old"
+    assert single_generate.calls == 0
+
+
+def test_saved_results_do_not_depend_on_the_cells_run(tmp_path, instances):
+    pytest.importorskip("dense.llm")
+    from dense.runner.pipeline import build_input, save_results
+
+    paths = []
+    for name, built in (("built", instances[:3]), ("not_built", copy.deepcopy(instances[:3]))):
+        if name == "built":
+            for elem in built:
+                build_input(elem, "default_prompt", "table_sql_absolute")
+        save_dir = tmp_path / name
+        save_dir.mkdir()
+        (save_dir / "generates.jsonl").write_text("")
+        save_results(built, str(save_dir), str(save_dir / "generates.jsonl"))
+        paths.append(save_dir / "results.json")
+    first, second = (json.loads(path.read_text()) for path in paths)
+    assert first == second
+    assert not os.path.exists(tmp_path / "built" / "generates.jsonl")
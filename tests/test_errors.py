@@ -0,0 +1,158 @@
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.llm.engine import generate_all
+from dense.llm.errors import (
+    active_retry_budget,
+    classify_exception,
+    error_record,
+    provider_error_code,
+    retry_budget_scope,
+    retry_time_budget,
+)
+
+
+class APIStatusError(Exception):
+    """
+    Shaped like the OpenAI client's errors: the message, the HTTP status, and the 'error' object of the body with
+    its code and type as attributes.
+    """
+
+    def __init__(self, message, status_code, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+        self.code = (body or {}).get("code")
+        self.type = (body or {}).get("type")
+
+
+class BadRequestError(APIStatusError):
+    pass
+
+
+class RateLimitError(APIStatusError):
+    pass
+
+
+class InternalServerError(APIStatusError):
+    pass
+
+
+class APIRequestFailedError(Exception):
+    """
+    Shaped like zhipuai's errors: the body of the response is only in the message.
+    """
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+def openai_error(cls, status_code, message, code=None, error_type="invalid_request_error", param=None):
+    body = {"message": message, "type": error_type, "param": param, "code": code}
+    return cls(f"Error code: {status_code} - {{'error': {body}}}", status_code, body)
+
+
+CASES = [
+    # OpenAI: prompt over the context window
+    (openai_error(
+        BadRequestError, 400,
+        "This model's maximum context length is 128000 tokens. However, your messages resulted in 131209 tokens. "
+        "Please reduce the length of the messages.",
+        code="context_length_exceeded", param="messages",
+    ), "context_length"),
+    # OpenAI: an invalid max_tokens is a bad request, not a context-length error
+    (openai_error(
+        BadRequestError, 400,
+        "max_tokens is too large: 200000. This model supports at most 16384 completion tokens, whereas you provided 200000.",
+        code="invalid_value", param="max_tokens",
+    ), "bad_request"),
+    # A bad parameter named after safety settings is not a content filter
+    (openai_error(
+        BadRequestError, 400, "Invalid value for 'safety_settings': expected an array.", code="invalid_value", param="safety_settings",
+    ), "bad_request"),
+    # Azure OpenAI content filter
+    (openai_error(
+        BadRequestError, 400,
+        "The response was filtered due to the prompt triggering Azure OpenAI's content management policy.",
+        code="content_filter", param="prompt",
+    ), "content_filter"),
+    # DashScope (qwen) content inspection
+    (openai_error(
+        BadRequestError, 400, "Input data may contain inappropriate content.", code="data_inspection_failed",
+    ), "content_filter"),
+    # DeepSeek: OpenAI-compatible context-length error without a code
+    (openai_error(
+        BadRequestError, 400,
+        "This model's maximum context length is 65536 tokens. However, you requested 70321 tokens "
+        "(69809 in the messages, 512 in the completion). Please reduce the length of the messages or completion.",
+    ), "context_length"),
+    # Rate limit and exhausted quota, both 429
+    (openai_error(
+        RateLimitError, 429, "Rate limit reached for gpt-4o-mini on tokens per min (TPM).", code="rate_limit_exceeded", error_type="tokens",
+    ), "rate_limit"),
+    (openai_error(
+        RateLimitError, 429, "You exceeded your current quota, please check your plan and billing details.",
+        code="insufficient_quota", error_type="insufficient_quota",
+    ), "auth"),
+    # A server error mentioning the context length is still a server error
+    (openai_error(
+        InternalServerError, 500, "The server had an error processing your request (context length check failed).",
+        error_type="server_error",
+    ), "server"),
+    (InternalServerError("Internal error", 503), "server"),
+    # Zhipu: the JSON body is in the message
+    (APIRequestFailedError(
+        'Error code: 400, with error text {"error":{"code":"1301","message":"系统检测到输入或生成内容可能包含不安全或敏感内容，请您避免输入易产生敏感内容的提示语，感谢您的配合。"}}',
+        400,
+    ), "content_filter"),
+    (APIRequestFailedError('Error code: 400, with error text {"error":{"code":"1261","message":"Prompt 超长"}}', 400), "context_length"),
+    (APIRequestFailedError('Error code: 429, with error text {"error":{"code":"1302","message":"您当前使用该API的并发数过高"}}', 429), "rate_limit"),
+    (APIRequestFailedError('Error code: 400, with error text {"error":{"code":"1214","message":"messages 参数非法"}}', 400), "bad_request"),
+    # Anthropic through an OpenAI-compatible gateway
+    (APIStatusError("prompt is too long: 210345 tokens > 200000 maximum", 400), "context_length"),
+    (APITimeoutError("Request timed out."), "timeout"),
+    (ConnectionError("Connection reset by peer"), "connection"),
+    (KeyError("choices"), "programming"),
+]
+
+
+@pytest.mark.parametrize("exception, expected", CASES, ids=[f"{type(e).__name__}-{expected}" for e, expected in CASES])
+def test_classify_exception(exception, expected):
+    assert classify_exception(exception) == expected
+
+
+def test_provider_error_code():
+    assert provider_error_code(CASES[0][0]) == "context_length_exceeded"
+    assert provider_error_code(APIRequestFailedError('{"error":{"code":"1301","message":"..."}}', 400)) == "1301"
+    assert provider_error_code(APIStatusError("Bad request", 400, {"error": {"code": "content_filter"}})) == "content_filter"
+    assert provider_error_code(ValueError("no code")) is None
+
+
+def test_error_record():
+    record = error_record(CASES[6][0])
+    assert record["type"] == "rate_limit" and record["retryable"]
+    record = error_record(CASES[0][0])
+    assert record["type"] == "context_length" and not record["retryable"]
+    assert record["exception"] == "BadRequestError"
+
+
+def test_every_run_has_its_own_retry_budget():
+    def single_generate(input_dict, **kwargs):
+        # Sent from a thread of generate_all: the budget is that of the run it belongs to
+        active_retry_budget().consume(10)
+        return active_retry_budget()
+
+    inputs = [{"system_prompt": "", "user_message": "x"}] * 3
+    with retry_budget_scope(20) as first:
+        assert set(generate_all(single_generate, inputs, mute_tqdm=True, num_workers=2)) == {first}
+    assert first.exhausted()
+    with retry_budget_scope(20) as second:
+        generate_all(single_generate, inputs[:1], mute_tqdm=True)
+    assert second.spent == 10 and not second.exhausted()
+    assert active_retry_budget() is retry_time_budget and retry_time_budget.spent == 0
@@ -0,0 +1,94 @@
+import os
+import time
+
+import pytest
+
+from dense.storage import ResponseCache
+from dense.storage.index import parse_duration, parse_size, parse_ttls, ttl_for
+
+
+def key(i):
+    return f"{i:064x}"
+
+
+def test_parse():
+    assert parse_size("500M") == 500 * 2**20
+    assert parse_size("1.5TB") == int(1.5 * 2**40)
+    assert parse_size(1000) == 1000 and parse_size(None) is None
+    assert parse_duration("12h") == 12 * 3600 and parse_duration("2w") == 14 * 86400
+    ttls = parse_ttls("gpt-4o-mini=30d, qwen2.5-*=7d,*=90d")
+    assert ttl_for(ttls, "gpt-4o-mini") == 30 * 86400
+    assert ttl_for(ttls, "qwen2.5-72b-instruct") == 7 * 86400
+    assert ttl_for(ttls, "glm-4-air") == 90 * 86400
+    assert ttl_for([], "glm-4-air") is None
+    with pytest.raises(AssertionError):
+        parse_size("20 parsecs")
+
+
+def filled_cache(location, policy, num_entries=10):
+    cache = ResponseCache(location, codec="none", policy=policy)
+    for i in range(num_entries):
+        cache.put(key(i), "x" * 1000, {"model": "m"})
+    return cache
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_gc_evicts_by_policy(tmp_path, policy):
+    cache = filled_cache(str(tmp_path / "cache"), policy)
+    size = os.path.getsize(cache.path(key(0)))
+    # Entry 0 is the oldest but used often, entry 9 the most recently used once
+    for _ in range(3):
+        cache.get(key(0))
+    time.sleep(0.01)
+    cache.get(key(9))
+
+    result = cache.gc(max_size=5 * size)
+    # Brought down to LOW_WATER_MARK of the cap: 4 entries
+    assert result["evicted"] == 6 and result["reclaimed_bytes"] > 5 * size
+    assert cache.index.total_size() <= 0.9 * 5 * size
+    kept = {int(name, 16) for name in cache.keys()}
+    assert len(kept) == 4 and {0, 9} <= kept
+    if policy == "lru":
+        assert kept == {0, 7, 8, 9}
+
+
+def test_size_cap_is_enforced_while_writing(tmp_path, monkeypatch):
+    from dense.storage import cache as cache_module
+
+    monkeypatch.setattr(cache_module, "SIZE_CHECK_EVERY", 4)
+    cache = ResponseCache(str(tmp_path / "cache"), codec="none", max_size=8 * 1100)
+    for i in range(20):
+        cache.put(key(i), "x" * 1000, {"model": "m"})
+    assert len(list(cache.keys())) <= 12
+    assert cache.get(key(19)) is not None
+
+
+def test_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), codec="none", ttl="old-*=1d")
+    cache.put(key(0), "expired", {"model": "old-model", "created": time.time() - 2 * 86400})
+    cache.put(key(1), "fresh", {"model": "old-model"})
+    cache.put(key(2), "never expires", {"model": "new-model", "created": 0})
+    # Expired entries are misses before gc deletes them
+    assert cache.get(key(0)) is None
+    assert cache.get(key(1))["value"] == "fresh" and cache.get(key(2))["value"] == "never expires"
+    assert cache.gc()["expired"] == 1
+    assert sorted(cache.keys()) == [key(1), key(2)]
+
+
+def test_gc_reconciles_the_index(tmp_path):
+    location = str(tmp_path / "cache")
+    cache = filled_cache(location, "lru", num_entries=4)
+    # An entry deleted behind the index, a stale temporary file and an index rebuilt from scratch
+    os.remove(cache.path(key(0)))
+    stale = cache.path(key(1)) + ".0.tmp"
+    with open(stale, "w") as file:
+        file.write("partial")
+    os.utime(stale, (0, 0))
+    cache.index.flush()
+    os.remove(os.path.join(location, "index.sqlite"))
+
+    rebuilt = ResponseCache(location, codec="none")
+    assert rebuilt.gc()["indexed"] == 3
+    assert not os.path.exists(stale)
+    size = sum(os.path.getsize(rebuilt.path(key(i))) for i in range(1, 4))
+    assert rebuilt.stats() == [{"model": "m", "task": None, "entries": 3, "bytes": size, "hits": 0}]
@@ -0,0 +1,84 @@
+import os
+import json
+
+import pytest
+
+from dense.storage import FramedDataset, convert_to_framed, convert_to_jsonl, iter_instances, open_framed
+from dense.storage.codec import zstandard
+
+CODECS = ["gzip"] + (["zstd"] if zstandard is not None else [])
+
+
+def in_slice(elem, bounds):
+    length_lower_bound, length_upper_bound, seed_num = bounds
+    return length_lower_bound <= elem["token_level"] <= length_upper_bound and int(elem["seed_id"].split("_")[-1]) <= seed_num
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_convert_to_framed(data_dir, instances, codec):
+    path = os.path.join(data_dir, "table_sql_absolute.json")
+    output, index_path, num_instances = convert_to_framed(path, compress=codec, frame_bytes=8 * 1024)
+    assert num_instances == len(instances) and output.endswith(".jsonl" + (".zst" if codec == "zstd" else ".gz"))
+    with open(index_path) as file:
+        index = json.load(file)
+    assert index["codec"] == codec and index["size"] == os.path.getsize(output)
+    # Several frames, each of a single token level
+    assert len(index["frames"]) > 2
+    assert {frame["token_level"] for frame in index["frames"]} == {1000, 2000}
+    # The frames are an ordinary compressed JSONL stream
+    assert list(iter_instances(output)) == instances
+
+
+def test_select_slices(data_dir, instances):
+    path = os.path.join(data_dir, "table_sql_absolute.json")
+    _, index_path, _ = convert_to_framed(path, compress="gzip", frame_bytes=4 * 1024)
+    dataset = FramedDataset(index_path, num_workers=2)
+    assert len(dataset) == len(instances)
+    slices = [(1000, 1000, 2), (1000, 2000, 1), (2000, 2000, 3)]
+    selected = dataset.select_slices(slices)
+    for bounds in slices:
+        assert selected[bounds] == [elem for elem in instances if in_slice(elem, bounds)]
+
+    # A slice of one token level reads none of the frames of the other
+    dataset = FramedDataset(index_path)
+    assert len(dataset.select_slices([(1000, 1000, 3)])[(1000, 1000, 3)]) == 9
+    assert dataset.bytes_read == sum(frame["length"] for frame in dataset.frames if frame["token_level"] == 1000)
+    assert dataset.bytes_read < dataset.size
+
+
+def test_stale_and_truncated_frames(data_dir):
+    path = os.path.join(data_dir, "table_sql_absolute.json")
+    output, index_path, _ = convert_to_framed(path, compress="gzip", frame_bytes=8 * 1024)
+    os.remove(path)
+    assert open_framed("table_sql_absolute", data_dir) is not None
+    assert open_framed("code_run_absolute", data_dir) is None
+
+    # A frame past the end of the file
+    with open(index_path) as file:
+        index = json.load(file)
+    index["frames"][-1]["length"] += 100
+    with open(index_path, "w") as file:
+        json.dump(index, file)
+    with pytest.raises(ValueError, match="truncated"):
+        list(FramedDataset(index_path).iter_frames())
+
+    # The data file rewritten since the index was written: the index is ignored
+    convert_to_jsonl(output, compress="gzip")
+    assert open_framed("table_sql_absolute", data_dir) is None
+    with pytest.raises(ValueError, match="rewritten"):
+        FramedDataset(index_path)
+
+
+def test_load_task_slices_reads_the_frames(data_dir, instances, monkeypatch):
+    pytest.importorskip("dense.llm")
+    from dense.runner import pipeline
+
+    path = os.path.join(data_dir, "table_sql_absolute.json")
+    convert_to_framed(path, compress="gzip", frame_bytes=8 * 1024)
+    os.remove(path)
+    # Read from the frames, not by streaming the whole file
+    monkeypatch.setattr(pipeline, "iter_instances", None)
+    bounds = (2000, 2000, 2)
+    assert pipeline.load_task_slices("table_sql_absolute", [bounds], data_dir)[bounds] == [
+        elem for elem in instances if in_slice(elem, bounds)
+    ]
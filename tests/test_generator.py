@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.eval import EquationSolutionMetric, HistoryReorderMetric, SQLMetric
+from dense.storage import iter_instances
+from dense.synth import TASKS, generate_instance, generate_task_file, iter_generated
+from dense.synth.generator import split_task
+from dense.synth.placement import absolute_locations, interleave, place
+
+FIELDS = {
+    "uuid", "token_level", "seed_id", "level", "context", "question", "answers", "location", "density",
+    "range_level", "default_prompt", "query_head_prompt", "query_tail_prompt",
+}
+TASK_NAMES = [f"{name}_{placement}" for name in TASKS for placement in ("absolute", "relative")]
+
+
+def perfect_response(elem, task):
+    if task.startswith("table_sql"):
+        return str(elem["answers"])
+    if task.startswith("equation_solution"):
+        return f"Therefore, the answer is {elem['answers'][0]}."
+    return elem["answers"][0]
+
+
+@pytest.mark.parametrize("task", TASK_NAMES)
+def test_generated_instances(task):
+    synthetic_task, placement = split_task(task)
+    metric = {"table_sql": SQLMetric, "equation_solution": EquationSolutionMetric, "history_reorder": HistoryReorderMetric}
+    for level in range(4):
+        elem = generate_instance(task, 4000, 1, level, num_levels=4)
+        assert set(elem) == FIELDS
+        assert elem["seed_id"] == "seed_1" and elem["level"] == f"level {level}"
+        items = synthetic_task.parse_context(elem["context"])
+        # About token_level tokens of 4 characters, prompt included
+        length = len(elem["context"]) + len(elem["default_prompt"]["user_message"])
+        assert 0.8 * 4000 * 4 < length < 1.2 * 4000 * 4
+        assert len(elem["location"]) == synthetic_task.num_relevant
+        # Only relevant items mention the question
+        mentions = [i for i, item in enumerate(items) if elem["question"] in item]
+        assert mentions and set(mentions) <= set(elem["location"])
+        assert elem["range_level"] == (level if placement == "relative" else 0)
+        assert metric[synthetic_task.name]().evaluate([perfect_response(elem, task)], [elem["answers"]]) == [1.0]
+
+
+def test_instances_do_not_depend_on_the_others():
+    elem = generate_instance("history_reorder_relative", 2000, 2, 3)
+    assert generate_instance("history_reorder_relative", 2000, 2, 3) == elem
+    # Adding token levels and seeds leaves the existing instances unchanged
+    generated = list(iter_generated("history_reorder_relative", [1000, 2000], 3, num_levels=8))
+    assert len(generated) == 2 * 3 * 8
+    assert generated[8 * 3 + 8 + 3] == elem
+    assert generate_instance("history_reorder_relative", 2000, 2, 3, salt=1)["context"] != elem["context"]
+
+
+def test_placement():
+    assert absolute_locations(100, 10, 0, 8) == list(range(10))
+    assert absolute_locations(100, 10, 7, 8) == list(range(90, 100))
+    rng = random.Random(0)
+    spans = []
+    for level in range(8):
+        locations, density, range_level = place(100, 10, "relative", level, 8, rng)
+        assert len(set(locations)) == 10 and 0 <= locations[0] and locations[-1] < 100
+        spans.append(locations[-1] - locations[0] + 1)
+        assert density == pytest.approx(10 / spans[-1], rel=0.05)
+    # The relevant items spread from contiguous to the whole context
+    assert spans[0] == 10 and spans[-1] == 100 and spans == sorted(spans)
+    assert interleave(["a", "b", "c"], ["X", "Y"], [0, 3]) == ["X", "a", "b", "Y", "c"]
+
+
+def test_unknown_task():
+    with pytest.raises(ValueError):
+        split_task("table_sql_middle")
+    with pytest.raises(ValueError):
+        list(iter_generated("code_run_absolute", [1000], 1))
+
+
+@pytest.mark.parametrize("compress", [None, "gzip"])
+def test_generate_task_file(tmp_path, compress):
+    data_dir = str(tmp_path / "data")
+    path, num_instances = generate_task_file("table_sql_absolute", [1000], 2, data_dir=data_dir, compress=compress, num_levels=3)
+    assert num_instances == 6 and path.endswith(".jsonl" if compress is None else ".jsonl.gz")
+    assert list(iter_instances(path)) == list(iter_generated("table_sql_absolute", [1000], 2, num_levels=3))
+    # A second data file of the task would shadow the first one
+    with pytest.raises(FileExistsError):
+        generate_task_file("table_sql_absolute", [2000], 1, data_dir=data_dir)
+    other, _ = generate_task_file("table_sql_absolute", [2000], 1, output=str(tmp_path / "more.jsonl"), num_levels=3)
+    assert [elem["token_level"] for elem in iter_instances(other)] == [2000] * 3
@@ -0,0 +1,45 @@
+import os
+import json
+
+import pytest
+
+
+def test_offline_cell_is_served_from_the_cache(tmp_path, instances, response_cache):
+    from dense.llm.errors import CacheMissError
+    from dense.llm.llm import SINGLE_GENERATE
+    from dense.runner.pipeline import build_inputs, evaluate_cell, select_prompt
+
+    single_generate, model_name, _ = SINGLE_GENERATE["gpt"]
+    prompt_type = select_prompt(True, False)
+    sampled_data = instances[:4]
+    inputs = build_inputs(sampled_data, prompt_type, "table_sql_absolute")
+    for i in range(3):
+        single_generate.seed(str(sampled_data[i]["answers"]), inputs[i], model=model_name, temp=0.0, top_p=0.9)
+
+    save_dir = str(tmp_path / "res")
+    with pytest.raises(CacheMissError) as error:
+        evaluate_cell(sampled_data, inputs, "gpt", "table_sql_absolute", save_dir, preflight="off", offline=True, mute_tqdm=True)
+    # Every miss is named, and nothing was generated
+    assert error.value.misses == [sampled_data[3]["uuid"]]
+
+    single_generate.seed("[]", inputs[3], model=model_name, temp=0.0, top_p=0.9)
+    evaluate_cell(sampled_data, inputs, "gpt", "table_sql_absolute", save_dir, resume=True, preflight="off", offline=True, mute_tqdm=True)
+    with open(os.path.join(save_dir, "results.json")) as file:
+        results = json.load(file)
+    assert [elem["score"] for elem in results] == [1.0, 1.0, 1.0, 0.0]
+
+
+def test_generate_cached_reports_all_misses(response_cache):
+    from dense.llm.engine import generate_cached
+    from dense.llm.errors import CacheMissError
+    from dense.llm.llm import SINGLE_GENERATE
+
+    single_generate, model_name, _ = SINGLE_GENERATE["qwen_7b"]
+    inputs = [{"system_prompt": "s", "user_message": str(i)} for i in range(4)]
+    for i in (0, 2):
+        for k in range(2):
+            single_generate.seed(f"{i}-{k}", inputs[i], model=model_name, sample_id=k)
+    with pytest.raises(CacheMissError) as error:
+        generate_cached(single_generate, inputs, mute_tqdm=True, n=2, model=model_name)
+    assert error.value.misses == [1, 3]
+    assert generate_cached(single_generate, inputs[::2], mute_tqdm=True, n=2, model=model_name) == [["0-0", "0-1"], ["2-0", "2-1"]]
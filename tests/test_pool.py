@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from dense.llm.pool import ClientPool, Endpoint
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def make_pool(weights, strategy="least_outstanding"):
+    return ClientPool([Endpoint(f"client-{i}", weight=w, name=str(i)) for i, w in enumerate(weights)], strategy=strategy)
+
+
+def test_least_outstanding_balances_in_flight_requests():
+    pool = make_pool([1, 1])
+    with pool.client() as first, pool.client() as second:
+        assert {first, second} == {"client-0", "client-1"}
+    assert [e["outstanding"] for e in pool.stats()] == [0, 0]
+
+
+@pytest.mark.parametrize("strategy", ["least_outstanding", "weighted"])
+def test_zero_weight_disables_an_endpoint(strategy):
+    pool = make_pool([0, 1], strategy=strategy)
+    for _ in range(20):
+        with pool.client() as client:
+            assert client == "client-1"
+
+
+def test_weights_are_validated():
+    with pytest.raises(AssertionError):
+        make_pool([0, 0])
+    with pytest.raises(AssertionError):
+        make_pool([-1, 1])
+
+
+def test_rate_limited_endpoint_cools_down():
+    pool = make_pool([1, 1])
+    with pytest.raises(RateLimitError):
+        with pool.client():
+            raise RateLimitError()
+    stats = pool.stats()
+    assert sum(e["rate_limited"] for e in stats) == 1
+    limited = next(e for e in stats if e["rate_limited"])
+    assert limited["cooldown_remaining"] > 0
+    for _ in range(5):
+        with pool.client() as client:
+            assert client != f"client-{limited['name']}"
+
+
+def test_slot_released_on_keyboard_interrupt():
+    pool = make_pool([1])
+    with pytest.raises(KeyboardInterrupt):
+        with pool.client():
+            raise KeyboardInterrupt()
+    assert pool.stats()[0]["outstanding"] == 0
+    assert pool.stats()[0]["cooldown_remaining"] == 0
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.llm import tokens
+from dense.runner import preflight as preflight_module
+from dense.runner.pipeline import run_preflight
+from dense.runner.preflight import preflight_check, summarize_preflight
+
+
+def make_input(num_chars):
+    return {"system_prompt": "", "user_message": "x" * num_chars}
+
+
+@pytest.fixture
+def exact_tokenizer(monkeypatch):
+    # One token per character, counted "exactly"
+    monkeypatch.setattr(preflight_module, "has_tokenizer", lambda model: True)
+    monkeypatch.setattr(preflight_module, "count_prompt_tokens", lambda input_dict, model: len(input_dict["user_message"]))
+
+
+@pytest.fixture
+def no_tokenizer(monkeypatch):
+    monkeypatch.setattr(preflight_module, "has_tokenizer", lambda model: False)
+    monkeypatch.setattr(preflight_module, "count_prompt_tokens", lambda input_dict, model: len(input_dict["user_message"]))
+
+
+def test_check_against_the_context_window(exact_tokenizer):
+    window = tokens.CONTEXT_WINDOWS["gpt"]
+    checks = preflight_check([make_input(100), make_input(window - 100), make_input(window)], "gpt", output_budget=200)
+    assert [check["fits"] for check in checks] == [True, False, False]
+    assert not any(check["estimated"] for check in checks)
+
+
+def test_reject_on_exact_counts(exact_tokenizer, tmp_path):
+    window = tokens.CONTEXT_WINDOWS["gpt"]
+    data = [{"uuid": "a", "token_level": 1}, {"uuid": "b", "token_level": 2}]
+    rejected_path = str(tmp_path / "preflight_rejected.json")
+    kept, inputs = run_preflight(data, [make_input(10), make_input(window)], "gpt", "reject", rejected_path)
+    assert [elem["uuid"] for elem in kept] == ["a"]
+    assert len(inputs) == 1
+    with open(rejected_path) as file:
+        assert [record["id"] for record in json.load(file)] == ["b"]
+
+
+def test_estimated_counts_only_flag(no_tokenizer, tmp_path):
+    window = tokens.CONTEXT_WINDOWS["gpt"]
+    data = [{"uuid": "a", "token_level": 1}, {"uuid": "b", "token_level": 2}]
+    rejected_path = tmp_path / "preflight_rejected.json"
+    kept, inputs = run_preflight(data, [make_input(10), make_input(window)], "gpt", "reject", str(rejected_path))
+    assert [elem["uuid"] for elem in kept] == ["a", "b"]
+    assert len(inputs) == 2
+    assert kept[1]["preflight"]["estimated"] and not kept[1]["preflight"]["fits"]
+    assert "preflight" not in kept[0]
+    assert not rejected_path.exists()
+
+
+def test_summary_counts_estimated_exceeding_instances(no_tokenizer):
+    window = tokens.CONTEXT_WINDOWS["gpt"]
+    data = [{"token_level": 1}, {"token_level": 1}]
+    checks = preflight_check([make_input(10), make_input(window)], "gpt")
+    assert summarize_preflight(data, checks) == {1: {"total": 2, "exceed": 1, "estimated": 1, "max_prompt_tokens": window}}
+
+
+def test_estimate_without_tokenizer(monkeypatch):
+    monkeypatch.setattr(tokens, "get_tokenizer", lambda model: None)
+    assert not tokens.has_tokenizer("gpt")
+    assert tokens.count_tokens("x" * 40, "gpt") == 10
+    assert tokens.token_starts("x" * 10, "unknown_model") == ([0, 4, 8], True)
+
+
+def test_proxy_tokenizers_only_flag(monkeypatch, tmp_path):
+    # Claude is counted with an OpenAI encoding, available here: the counts are still estimates
+    class Encoding:
+        def encode(self, text, disallowed_special=()):
+            return list(text)
+
+        def decode_with_offsets(self, tokens):
+            return "".join(tokens), list(range(len(tokens)))
+
+    monkeypatch.setattr(tokens, "get_tokenizer", lambda model: len)
+    monkeypatch.setattr(tokens, "load_tokenizer", lambda model: ("tiktoken", Encoding()))
+    assert tokens.has_tokenizer("gpt") and not tokens.has_tokenizer("claude")
+    assert tokens.token_starts("abc", "gpt") == ([0, 1, 2], False)
+    assert tokens.token_starts("abc", "claude") == ([0, 1, 2], True)
+    monkeypatch.setattr(preflight_module, "has_tokenizer", tokens.has_tokenizer)
+    window = tokens.CONTEXT_WINDOWS["claude"]
+    data = [{"uuid": "a", "token_level": 1}]
+    kept, _ = run_preflight(data, [make_input(window)], "claude", "reject", str(tmp_path / "preflight_rejected.json"))
+    assert kept[0]["preflight"]["estimated"] and not kept[0]["preflight"]["fits"]
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from dense.storage import ResponseCache
+
+
+@pytest.fixture
+def pipeline():
+    pytest.importorskip("dense.llm")
+    from dense.runner import pipeline
+
+    return pipeline
+
+
+def test_prompt_list(pipeline, instances):
+    inputs = pipeline.build_inputs(instances, "query_head_prompt", "table_sql_absolute")
+    assert len(inputs) == len(instances)
+    assert inputs[2] == pipeline.build_input(instances[2], "query_head_prompt", "table_sql_absolute")
+    assert list(inputs[1:3]) == [inputs[1], inputs[2]]
+    taken = pipeline.take_inputs(inputs, [5, 0])
+    assert isinstance(taken, pipeline.PromptList) and list(taken) == [inputs[5], inputs[0]]
+    assert pipeline.take_inputs(list(inputs), [5, 0]) == [inputs[5], inputs[0]]
+
+    for i in range(len(inputs)):
+        prompt = inputs[i]
+        # Within the length of the {context} and {query} placeholders of the template
+        assert 0 <= inputs.num_chars(i) - len(prompt["system_prompt"]) - len(prompt["user_message"]) <= len("{context}{query}")
+
+
+def test_key_input_has_the_cache_key_of_the_prompt(pipeline, instances, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+
+    @cache.cache
+    def single_generate(input_dict, model="m"):
+        return ""
+
+    inputs = pipeline.build_inputs(instances, "default_prompt", "table_sql_absolute")
+    for i in range(len(inputs)):
+        assert single_generate.cache_key(inputs.key_input(i)) == single_generate.cache_key(inputs[i])
+        assert "user_message" not in inputs.key_input(i)
+
+
+def test_prompts_are_built_when_dispatched(pipeline, instances):
+    from dense.llm.engine import generate_all
+
+    built = []
+
+    class CountingPromptList(pipeline.PromptList):
+        def __getitem__(self, i):
+            built.append(i)
+            return super().__getitem__(i)
+
+    inputs = CountingPromptList(instances, "default_prompt")
+    lock = threading.Lock()
+    in_flight = []
+
+    def single_generate(input_dict, model="m"):
+        with lock:
+            # Every prompt built so far is in flight or answered
+            in_flight.append(len(built))
+        return input_dict["user_message"][-10:]
+
+    responses = generate_all(single_generate, inputs, mute_tqdm=True, num_workers=2)
+    assert sorted(built) == list(range(len(instances)))
+    assert responses == [pipeline.build_input(elem, "default_prompt")["user_message"][-10:] for elem in instances]
+    assert in_flight[0] <= 2
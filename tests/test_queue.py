@@ -0,0 +1,109 @@
+import pytest
+
+from dense.runner.queue import RedisQueue, SQLiteQueue, open_queue
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisQueue(fakeredis.FakeRedis(), max_attempts=2)
+
+
+def expire(queue, lease):
+    # Move the expiry of a lease to the past, as if the worker had stopped sending heartbeats
+    assert queue.heartbeat(lease, lease_seconds=-1)
+
+
+def test_lease_complete(queue):
+    queue.put({"a": {"cell": 1}, "b": {"cell": 2}})
+    queue.put({"a": {"cell": 3}})
+    first = queue.lease("w1")
+    second = queue.lease("w2")
+    assert {first.unit_id, second.unit_id} == {"a", "b"}
+    assert first.payload == {"cell": 1 if first.unit_id == "a" else 2}
+    assert queue.lease("w3") is None
+    assert queue.heartbeat(first)
+    assert queue.complete(first) and queue.complete(second)
+    assert queue.is_done(["a", "b"])
+    assert queue.stats()["done"] == 2
+
+
+def test_expired_lease_is_lost(queue):
+    queue.put({"a": {}})
+    stale = queue.lease("w1")
+    expire(queue, stale)
+    fresh = queue.lease("w2")
+    assert fresh.unit_id == "a" and fresh.attempts == 2
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale)
+    assert not queue.fail(stale, "late")
+    assert queue.complete(fresh)
+    assert queue.is_done(["a"])
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    queue.put({"a": {}})
+    lease = queue.lease("w1")
+    assert queue.fail(lease, "boom")
+    lease = queue.lease("w1")
+    assert lease.attempts == 2
+    assert queue.fail(lease, "boom")
+    assert queue.lease("w1") is None
+    assert queue.stats()["failed"] == 1
+    assert not queue.is_done(["a"])
+
+
+def test_expired_leases_count_as_attempts(queue):
+    queue.put({"a": {}})
+    for _ in range(2):
+        expire(queue, queue.lease("w1"))
+    # The unit was leased max_attempts times, by workers that all died: it is not leased again
+    assert queue.lease("w2") is None
+    stats = queue.stats()
+    assert stats["failed"] == 1 and not stats.get("expired")
+
+
+def test_claim(queue):
+    assert queue.claim("merge:cell")
+    assert not queue.claim("merge:cell")
+    assert queue.claim("merge:other")
+
+
+def test_sqlite_queue_is_shared_across_instances(tmp_path):
+    url = f"sqlite:///{tmp_path / 'queue.db'}"
+    open_queue(url).put({"a": {}})
+    lease = open_queue(url).lease("w1", lease_seconds=60)
+    assert lease.unit_id == "a" and lease.payload == {}
+    assert open_queue(url).lease("w2") is None
+    assert lease.attempts == 1
+
+
+def test_open_queue_rejects_unknown_urls():
+    with pytest.raises(ValueError):
+        open_queue("postgres://localhost/queue")
+
+
+def test_redis_put_is_atomic():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    queue = RedisQueue(fakeredis.FakeRedis(server=server))
+    other = RedisQueue(fakeredis.FakeRedis(server=server))
+    transaction = queue.client.transaction
+
+    def racing_transaction(func, *watches, **kwargs):
+        def racing(pipe):
+            # Another client submits the same unit between the read of the units and the writes
+            hmget = pipe.hmget
+            pipe.hmget = lambda *args: (hmget(*args), other.put({"a": {"cell": 2}}))[0]
+            return func(pipe)
+
+        return transaction(racing, *watches, **kwargs)
+
+    queue.client.transaction = racing_transaction
+    queue.put({"a": {"cell": 1}, "b": {"cell": 3}})
+    assert queue.stats()["pending"] == 2
+    leases = [queue.lease("w1"), queue.lease("w2")]
+    assert sorted((lease.unit_id, lease.payload["cell"]) for lease in leases) == [("a", 2), ("b", 3)]
+    assert queue.lease("w3") is None
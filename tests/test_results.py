@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from dense.runner.results import ResultLog, instance_id, load_results
+
+
+def test_log_round_trip(tmp_path):
+    path = str(tmp_path / "generates.jsonl")
+    with ResultLog(path, flush_every=2) as log:
+        for i in range(5):
+            log.append({"id": f"u{i}", "llm_response": str(i)})
+    records = load_results(path)
+    assert list(records) == [f"u{i}" for i in range(5)]
+    assert records["u3"]["llm_response"] == "3"
+
+
+def test_flush_every(tmp_path):
+    path = str(tmp_path / "generates.jsonl")
+    log = ResultLog(path, flush_every=2, flush_interval=3600)
+    log.append({"id": "a"})
+    assert load_results(path) == {}
+    log.append({"id": "b"})
+    assert set(load_results(path)) == {"a", "b"}
+    log.close()
+
+
+def test_partial_last_line_is_dropped_and_truncated(tmp_path):
+    path = tmp_path / "generates.jsonl"
+    path.write_text(json.dumps({"id": "a"}) + "\n" + '{"id": "b", "llm_res')
+    assert set(load_results(str(path))) == {"a"}
+    with ResultLog(str(path)) as log:
+        log.append({"id": "c"})
+    assert set(load_results(str(path))) == {"a", "c"}
+    assert all(json.loads(line) for line in path.read_text().splitlines())
+
+
+def test_log_is_flushed_on_exception(tmp_path):
+    path = str(tmp_path / "generates.jsonl")
+    with pytest.raises(KeyboardInterrupt):
+        with ResultLog(path, flush_every=100) as log:
+            log.append({"id": "a"})
+            raise KeyboardInterrupt()
+    assert set(load_results(path)) == {"a"}
+
+
+def test_instance_id():
+    assert instance_id({"uuid": "x", "seed_id": "seed_1"}) == "x"
+    elem = {"seed_id": "seed_1", "token_level": 32000, "level": "level 0", "question": "q"}
+    assert instance_id(elem) == instance_id(dict(elem))
+    assert instance_id(elem) != instance_id(dict(elem, level="level 1"))
+
+
+def test_generate_all_reports_every_response():
+    pytest.importorskip("dense.llm")
+    from dense.llm.engine import generate_all
+
+    inputs = [{"system_prompt": "s", "user_message": "m" * i} for i in range(6)]
+    seen = {}
+    responses = generate_all(
+        lambda input_dict, **kwargs: len(input_dict["user_message"]),
+        inputs, mute_tqdm=True, num_workers=3,
+        callback=lambda i, response, error: seen.setdefault(i, (response, error)),
+    )
+    assert responses == list(range(6))
+    assert seen == {i: (i, None) for i in range(6)}
@@ -0,0 +1,41 @@
+import pytest
+
+from dense.eval import SQLMetric
+
+
+def test_evaluate_samples():
+    labels = [["| China | Zhao Wei | 1982 | September | A |", "| China | Wang Wei | 1961 | May | O |"]]
+    samples = [["['| China | Zhao Wei | 1982 | September | A |']", "[]", str(labels[0])]]
+    assert SQLMetric().evaluate_samples(samples, labels) == [[0.5, 0.0, 1.0]]
+
+
+def test_sample_calls():
+    pytest.importorskip("dense.llm")
+    from dense.llm.engine import sample_calls
+
+    input_dict = {"system_prompt": "s", "user_message": "u"}
+    assert sample_calls(input_dict, 1, False, {"temp": 0.7}) == [((input_dict,), {"temp": 0.7})]
+    assert sample_calls(input_dict, 3, True, {"temp": 0.7}) == [((input_dict,), {"temp": 0.7, "n": 3})]
+    assert sample_calls(input_dict, 2, False, {"temp": 0.7}) == [
+        ((input_dict,), {"temp": 0.7, "sample_id": 0}),
+        ((input_dict,), {"temp": 0.7, "sample_id": 1}),
+    ]
+
+
+@pytest.mark.parametrize("native_n", [False, True])
+def test_generate_all_draws_n_samples(native_n):
+    pytest.importorskip("dense.llm")
+    from dense.llm.engine import generate_all
+
+    calls = []
+
+    def single_generate(input_dict, n=None, sample_id=0, **kwargs):
+        calls.append((n, sample_id))
+        if n is not None:
+            return [f"{input_dict['user_message']}-{k}" for k in range(n)]
+        return f"{input_dict['user_message']}-{sample_id}"
+
+    inputs = [{"system_prompt": "", "user_message": message} for message in ("a", "b")]
+    responses = generate_all(single_generate, inputs, mute_tqdm=True, n=3, native_n=native_n)
+    assert responses == [["a-0", "a-1", "a-2"], ["b-0", "b-1", "b-2"]]
+    assert len(calls) == (2 if native_n else 6)
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.llm.engine import estimate_cost, estimate_costs, generate_all, schedule_order, simulate_makespan
+
+
+def test_estimate_cost():
+    assert estimate_cost({"system_prompt": "a" * 40, "user_message": "b" * 60}, 10) == 35
+
+
+def test_schedule_order():
+    costs = [1, 5, 3]
+    assert schedule_order(costs, 1) == [0, 1, 2]
+    assert schedule_order(costs, 4) == [1, 2, 0]
+    assert schedule_order(costs, 4, "fifo") == [0, 1, 2]
+    assert schedule_order(costs, 1, "longest_first") == [1, 2, 0]
+    with pytest.raises(AssertionError):
+        schedule_order(costs, 1, "shortest_first")
+
+
+def test_longest_first_shortens_the_makespan():
+    costs = [1, 1, 1, 1, 4]
+    assert simulate_makespan(costs, 2) == 6
+    assert simulate_makespan([costs[i] for i in schedule_order(costs, 2)], 2) == 4
+    assert simulate_makespan(costs, 10) == 4
+    assert simulate_makespan([], 2) == 0
+
+
+def test_requests_are_dispatched_longest_first():
+    inputs = [{"system_prompt": "", "user_message": "x" * (400 * size)} for size in (1, 3, 2)]
+    started = []
+    lock = threading.Lock()
+
+    def single_generate(input_dict, **kwargs):
+        with lock:
+            started.append(len(input_dict["user_message"]) // 400)
+        return "ok"
+
+    # One worker at a time keeps the dispatch order observable; the schedule is forced
+    generate_all(single_generate, inputs, mute_tqdm=True, num_workers=1, schedule="longest_first")
+    assert started == [3, 2, 1]
+    assert estimate_costs(inputs, 0) == [100, 300, 200]
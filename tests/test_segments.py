@@ -0,0 +1,56 @@
+import os
+import json
+
+from dense.storage import context_length, context_text, convert_to_segments, iter_instances, open_segment_store
+from dense.storage.segments import split_segments
+
+
+def write_task(path, instances):
+    with open(path, "w") as file:
+        json.dump(instances, file)
+
+
+def test_split_segments(instances):
+    text = "\n".join(elem["context"] for elem in instances)
+    segments = split_segments(text, average_lines=4)
+    assert "".join(segments) == text
+    assert all(segment.endswith("\n") for segment in segments[:-1])
+    # A line inserted at the start only changes the first segments
+    shifted = split_segments("| Inserted | row | 2000 | May | A |\n" + text, average_lines=4)
+    assert len(set(segments) & set(shifted)) >= len(segments) - 2
+
+
+def test_convert_to_segments(tmp_path, monkeypatch, instances):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    # Contexts shared by several instances are stored once; some contexts have non-ASCII characters
+    instances = instances + [dict(elem, question="France") for elem in instances[:6]]
+    instances += [dict(elem, context=elem["context"].replace("May", "Mañana")) for elem in instances[:3]]
+    write_task("data/table_sql_absolute.json", instances)
+    output, num_instances, num_bytes, unique_bytes = convert_to_segments("data/table_sql_absolute.json", "data/contexts")
+    assert num_instances == len(instances)
+    assert unique_bytes < num_bytes
+
+    # The instances refer to the store by an absolute path, so they are read from any working directory
+    monkeypatch.chdir(tmp_path / "data")
+    segmented = list(iter_instances(os.path.basename(output)))
+    assert os.path.isabs(segmented[0]["context_store"])
+    for elem, original in zip(segmented, instances):
+        assert "context" not in elem
+        assert context_text(elem) == original["context"]
+        # In characters, as for an inline context
+        assert context_length(elem) == len(original["context"])
+
+
+def test_appended_store_is_mapped_again(tmp_path, instances):
+    store = str(tmp_path / "contexts")
+    first, second = str(tmp_path / "first.json"), str(tmp_path / "second.json")
+    write_task(first, instances[:3])
+    write_task(second, [dict(elem, context=elem["context"].upper()) for elem in instances[3:6]])
+
+    output, *_ = convert_to_segments(first, store)
+    num_segments = len(open_segment_store(store))
+    output, *_ = convert_to_segments(second, store)
+    assert len(open_segment_store(store)) > num_segments
+    for elem, original in zip(iter_instances(output), instances[3:6]):
+        assert context_text(elem) == original["context"].upper()
@@ -0,0 +1,88 @@
+import socket
+import threading
+
+import pytest
+
+from dense.storage import RemoteCache, ResponseCache, start_service
+
+
+def key(i):
+    return f"{i:064x}"
+
+
+@pytest.fixture
+def service(tmp_path):
+    location = str(tmp_path / "service")
+    ResponseCache(location).put(key(0), "stored before start", {"model": "m"})
+    server = start_service(location, port=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_cache(service):
+    url = f"http://127.0.0.1:{service.server_address[1]}"
+    cache = RemoteCache(url)
+    assert cache.get(key(0))["value"] == "stored before start"
+    assert cache.get(key(1)) is None
+    cache.put(key(1), "new", {"model": "m"})
+    cache.put(key(1), "overwritten", {"model": "m"})
+
+    # A second client has an empty LRU: it reads through the service
+    other = RemoteCache(url)
+    assert other.prefetch([key(0), key(1), key(2)]) == 2
+    assert key(1) in other.lru and key(2) not in other.lru
+    assert other.get(key(1))["value"] == "overwritten"
+
+    stats = cache._request("GET", "/stats")[1]
+    assert stats["entries"] == 2
+    assert stats["puts"] == 2 and stats["gets"] == 2 and stats["hits"] == 3
+
+
+def misbehaving_server(reply):
+    """
+    A TCP server answering every request with `reply`, and its URL.
+    """
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            with connection:
+                connection.recv(65536)
+                connection.sendall(reply)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener, f"http://127.0.0.1:{listener.getsockname()[1]}"
+
+
+@pytest.mark.parametrize("reply", [
+    # Not HTTP: http.client raises BadStatusLine, which is not an OSError
+    b"garbage\r\n\r\n",
+    # HTTP, but the body is not JSON
+    b"HTTP/1.1 200 OK\r\nContent-Length: 8\r\nConnection: close\r\n\r\nnot json",
+])
+def test_misbehaving_service_is_a_miss(reply):
+    listener, url = misbehaving_server(reply)
+    try:
+        cache = RemoteCache(url, timeout=2.0)
+        with pytest.warns(UserWarning):
+            assert cache.get(key(0)) is None
+        with pytest.warns(UserWarning):
+            cache.put(key(0), "value")
+        with pytest.warns(UserWarning):
+            assert cache.prefetch([key(1)]) == 0
+    finally:
+        listener.close()
+
+
+def test_unreachable_service_is_a_miss():
+    listener = socket.create_server(("127.0.0.1", 0))
+    url = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    listener.close()
+    cache = RemoteCache(url, timeout=2.0)
+    with pytest.warns(UserWarning):
+        assert cache.get(key(0)) is None
@@ -0,0 +1,115 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.runner import preflight as preflight_module
+from dense.runner.distributed import Worker, submit_sweep
+from dense.runner.pipeline import build_inputs, evaluate_cell
+from dense.runner.queue import SQLiteQueue
+from dense.runner.results import instance_id
+from dense.runner.shards import merge_shards, partition, run_shard, shard_paths
+from dense.runner.sweep import expand_cells, load_spec
+from dense.storage import load_json
+
+TASK = "table_sql_absolute"
+
+
+def test_partition(instances):
+    inputs = build_inputs(instances, "default_prompt", TASK)
+    shards = partition(instances, inputs, 4)
+    assert sorted(i for positions in shards for i in positions) == list(range(len(instances)))
+    # The prompts of the instances are about the same length: so are the shards
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+    # Every shard job computes the same partition, whatever the order it was given the instances in
+    reversed_shards = partition(instances[::-1], inputs[::-1], 4)
+    ids = [{instance_id(instances[i]) for i in positions} for positions in shards]
+    assert ids == [{instance_id(instances[::-1][i]) for i in positions} for positions in reversed_shards]
+
+
+def run_shards(instances, save_dir, num_shards, preflight="off"):
+    inputs = build_inputs(instances, "default_prompt", TASK)
+    for shard in range(num_shards):
+        run_shard(instances, inputs, "gpt", save_dir, shard, num_shards, preflight=preflight)
+    return inputs
+
+
+def test_merged_shards_match_an_unsharded_run(tmp_path, instances, fake_llm):
+    save_dir = str(tmp_path / "sharded")
+    inputs = run_shards(instances, save_dir, 3)
+    assert merge_shards(instances, inputs, TASK, save_dir, 3) == len(instances)
+    assert sorted(os.listdir(save_dir)) == ["results.json"]
+
+    evaluate_cell(instances, build_inputs(instances, "default_prompt", TASK), "gpt", TASK, str(tmp_path / "whole"), preflight="off")
+    assert load_json(f"{save_dir}/results.json") == load_json(str(tmp_path / "whole" / "results.json"))
+
+
+def test_merge_checks_the_shards(tmp_path, instances, fake_llm):
+    save_dir = str(tmp_path / "sharded")
+    inputs = run_shards(instances, save_dir, 3)
+    log_path = shard_paths(save_dir, 1, 3)[0]
+    with open(log_path) as file:
+        lines = file.readlines()
+
+    # A shard cut short
+    with open(log_path, "w") as file:
+        file.writelines(lines[:-1])
+    with pytest.raises(ValueError, match="have no response"):
+        merge_shards(instances, inputs, TASK, save_dir, 3)
+    # An instance logged by two shards, one of which it is not assigned to
+    with open(log_path, "w") as file:
+        file.writelines(lines)
+    with open(shard_paths(save_dir, 2, 3)[0], "a") as file:
+        file.write(lines[0])
+    with pytest.raises(ValueError, match="several shards.*not assigned"):
+        merge_shards(instances, inputs, TASK, save_dir, 3)
+    # Shards run with another number of shards
+    with pytest.raises(ValueError, match="no result log"):
+        merge_shards(instances, inputs, TASK, save_dir, 4)
+    assert not os.path.exists(os.path.join(save_dir, "results.json"))
+
+
+def test_merge_combines_the_rejections(tmp_path, monkeypatch, instances, fake_llm):
+    # Exact counts, and the prompts of the 2000-token instances do not fit
+    monkeypatch.setattr(preflight_module, "has_tokenizer", lambda model: True)
+    monkeypatch.setattr(preflight_module, "count_prompt_tokens", lambda input_dict, model: 10 ** 9 if "| oversized |" in input_dict["user_message"] else 10)
+    for elem in instances:
+        if elem["token_level"] == 2000:
+            elem["context"] += "\n| oversized |"
+    save_dir = str(tmp_path / "sharded")
+    inputs = run_shards(instances, save_dir, 2, preflight="reject")
+    calls = len(fake_llm)
+
+    monkeypatch.setattr(preflight_module, "count_prompt_tokens", None)
+    assert merge_shards(instances, inputs, TASK, save_dir, 2) == 9
+    assert len(fake_llm) == calls == 9
+    rejected = load_json(os.path.join(save_dir, "preflight_rejected.json"))
+    assert sorted(check["id"] for check in rejected) == sorted(instance_id(elem) for elem in instances if elem["token_level"] == 2000)
+    assert all(elem["token_level"] == 1000 for elem in load_json(os.path.join(save_dir, "results.json")))
+
+
+def test_distributed_workers(tmp_path, data_dir, fake_llm):
+    path = tmp_path / "spec.json"
+    path.write_text(json.dumps({
+        "models": ["gpt"],
+        "tasks": [TASK],
+        "length_ranges": [[1000, 2000]],
+        "seed_nums": [3],
+        "preflight": "off",
+        "save_root": str(tmp_path / "res"),
+    }))
+    spec = load_spec(str(path))
+    queue = SQLiteQueue(str(tmp_path / "queue.sqlite"))
+    assert submit_sweep(queue, spec, num_shards=3) == 3
+    workers = [Worker(queue, data_dir=data_dir, worker_id=f"worker-{i}") for i in range(2)]
+    assert workers[0].run(max_units=2) == 2
+    assert workers[1].run() == 1
+
+    (cell,) = expand_cells(spec)
+    results = load_json(f"{cell['save_dir']}/results.json")
+    assert len(results) == 18 and all(elem["score"] == 1.0 for elem in results)
+    # The shard logs are merged; the cell they were run for is kept next to the results
+    assert sorted(os.listdir(cell["save_dir"])) == ["cell.json", "results.json"]
+    assert len(fake_llm) == 18
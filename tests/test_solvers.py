@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.synth import generate_instance
+from dense.synth.solvers import check_format, solve_equation_solution, solve_history_reorder, solve_table_sql
+from dense.synth.validate import validate_file, validate_instance
+
+ROWS = [
+    "| Country | Name | Birth Year | Birth Month | Blood Type |",
+    "| China | Zhao Wei | 1982 | September | A |",
+    "| Chinese Taipei | Lin Hui | 1990 | May | B |",
+    "|  China|Li Na|1975|March|O|",
+    "| France | China Smith | 1960 | June | AB |",
+]
+
+
+def test_table_rows():
+    answers, locations = solve_table_sql(ROWS, "China")
+    # Matched on the Country column, whatever the spacing of the row
+    assert locations == [1, 3]
+    assert answers == [ROWS[1], ROWS[3]]
+    check_format("table_sql", ROWS)
+
+
+def test_equations():
+    items = [
+        "\\(-5 x_{711} - 3 x_{674} = -1\\)",
+        "3 x_{674} = -9",
+        "x_{12} + 2 x_{13} = 7",
+    ]
+    assert solve_equation_solution(items, "\\( x_{711} \\)") == (["2"], [0, 1])
+    with pytest.raises(ValueError, match="not determined"):
+        solve_equation_solution(items, "x_{12}")
+    check_format("equation_solution", items)
+
+
+def test_history_events():
+    items = [
+        "In 1523, Ana Abel founded a school in Aldmoor.",
+        "Ana Abe led an expedition to Brisca in 1498.",
+        "In 1510, Ana Abe built a bridge in Lowmere.",
+    ]
+    # "Ana Abel" is another person
+    assert solve_history_reorder(items, "Ana Abe") == (["1, 2"], [1, 2])
+
+
+def test_unsupported_formats_are_reported(instances):
+    elem = dict(instances[0])
+    assert validate_instance(elem, "table_sql_absolute")["problems"] == []
+    elem["context"] = elem["context"].replace(" | May |", " |")
+    result = validate_instance(elem, "table_sql_absolute")
+    assert result["problems"] == ["format"] and "table_sql" in result["reason"]
+
+
+def test_validate_generated_and_corrupted(tmp_path):
+    instances = [generate_instance("equation_solution_relative", 2000, 1, level) for level in range(3)]
+    instances[1]["answers"] = ["12345"]
+    instances[2]["location"] = instances[2]["location"][1:] + [len(instances[2]["context"])]
+    path = tmp_path / "equation_solution_relative.json"
+    path.write_text(json.dumps(instances))
+    report = validate_file("equation_solution_relative", path=str(path), num_workers=1)
+    assert report["num_instances"] == 3 and report["num_valid"] == 1
+    assert report["problems"] == {"format": 0, "unsolvable": 0, "answers": 1, "location": 1}
+
+
+def test_validate_task_file(data_dir):
+    # The task files of the tests are in the format of the original table_sql files
+    report = validate_file("table_sql_absolute", data_dir=data_dir, num_workers=2)
+    assert report["num_instances"] == report["num_valid"] == 18
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.runner.sweep import expand_cells, load_spec, run_sweep
+from dense.storage import load_json
+
+
+def write_spec(tmp_path, **fields):
+    spec = {"models": ["gpt", "qwen_7b"], "tasks": ["table_sql_absolute"], "save_root": str(tmp_path / "res"), **fields}
+    path = tmp_path / "spec.json"
+    path.write_text(json.dumps(spec))
+    return load_spec(str(path))
+
+
+def test_expand_cells(tmp_path):
+    spec = write_spec(tmp_path, length_ranges=[[1000, 1000], [2000, 2000]], placements=["both", "head"])
+    cells = expand_cells(spec)
+    assert len(cells) == 2 * 2 * 2
+    assert len({cell["save_dir"] for cell in cells}) == len(cells)
+    assert all(cell["save_dir"].endswith("_seed20") for cell in cells)
+
+
+def test_spec_is_validated(tmp_path):
+    with pytest.raises(AssertionError):
+        write_spec(tmp_path, placements=["middle"])
+    with pytest.raises(AssertionError):
+        write_spec(tmp_path, models=[])
+
+
+def test_run_sweep(tmp_path, data_dir, fake_llm):
+    spec = write_spec(tmp_path, length_ranges=[[1000, 1000]], seed_nums=[2], preflight="off")
+    assert run_sweep(spec, data_dir=data_dir) == {}
+    for cell in expand_cells(spec):
+        results = load_json(f"{cell['save_dir']}/results.json")
+        assert len(results) == 2 * 3
+        assert all(elem["token_level"] == 1000 and elem["score"] == 1.0 for elem in results)
+    # Both models were sent the 6 prompts of the shared sample once
+    assert len(fake_llm) == 2 * 6
+
+    # A second run skips the complete cells
+    assert run_sweep(spec, data_dir=data_dir) == {}
+    assert len(fake_llm) == 2 * 6
+
+
+def test_results_of_another_slice_are_not_reused(tmp_path, data_dir, fake_llm):
+    # A debug sweep, then the real one into the same save_root: their save_dirs are the same
+    debug = write_spec(tmp_path, length_ranges=[[1000, 1000]], seed_nums=[1], preflight="off")
+    assert run_sweep(debug, data_dir=data_dir) == {}
+    spec = write_spec(tmp_path, length_ranges=[[1000, 1000]], seed_nums=[3], preflight="off")
+    assert [cell["save_dir"] for cell in expand_cells(spec)] == [cell["save_dir"] for cell in expand_cells(debug)]
+    with pytest.raises(ValueError, match="another cell"):
+        run_sweep(spec, data_dir=data_dir)
+    assert len(fake_llm) == 2 * 3
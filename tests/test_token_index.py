@@ -0,0 +1,69 @@
+import re
+import json
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.runner import token_index
+from dense.runner.token_index import build_token_index, check_item_lines, open_token_index
+from dense.synth import generate_instance
+
+
+@pytest.fixture
+def word_tokenizer(monkeypatch):
+    # Exact positions: one token per word and per run of spaces or punctuation
+    def token_starts(text, model):
+        return [match.start() for match in re.finditer(r"\w+|[^\w\n]+|\n", text)], False
+
+    monkeypatch.setattr(token_index, "token_starts", token_starts)
+    return token_starts
+
+
+def test_spans_of_the_answer_rows(data_dir, instances, word_tokenizer):
+    path, num_indexed, num_cached = build_token_index("table_sql_absolute", "gpt", data_dir=data_dir, num_workers=1)
+    assert (num_indexed, num_cached) == (18, 0)
+    index = open_token_index("table_sql_absolute", "gpt", data_dir=data_dir)
+    for elem in instances:
+        found = index.lookup(elem)
+        starts, _ = word_tokenizer(elem["context"], "gpt")
+        assert found["num_tokens"] == len(starts) and not found["estimated"]
+        for answer, (start, end) in zip(elem["answers"], found["answer_tokens"]):
+            # The tokens of the span are those of the row
+            text = elem["context"][starts[start]:starts[end] if end < len(starts) else None]
+            assert text.rstrip("\n") == answer
+    # Built again, nothing is tokenized
+    assert build_token_index("table_sql_absolute", "gpt", data_dir=data_dir, num_workers=1)[1:] == (0, 18)
+
+
+def test_numbered_contexts(word_tokenizer):
+    elem = generate_instance("history_reorder_relative", 1000, 1, 2)
+    check_item_lines(elem, elem["context"])
+    _, spans, _ = token_index.item_token_spans(elem["context"], elem["location"], "gpt")
+    starts, _ = word_tokenizer(elem["context"], "gpt")
+    for location in elem["location"]:
+        start = spans[str(location)][0]
+        assert elem["context"][starts[start]:].startswith(f"[{location}] In ")
+
+
+def test_items_that_are_not_lines(tmp_path, instances, word_tokenizer):
+    # The rows of an instance joined by spaces: the location no longer indexes lines
+    joined = dict(instances[0], context=instances[0]["context"].replace("\n", " "))
+    with pytest.raises(ValueError, match="not one of the 1 lines"):
+        check_item_lines(joined, joined["context"])
+    # A location shifted by one line
+    shifted = dict(instances[0], location=[location + 1 for location in instances[0]["location"]])
+    with pytest.raises(ValueError, match="not its answers"):
+        check_item_lines(shifted, shifted["context"])
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "table_sql_absolute.json").write_text(json.dumps([instances[1], shifted]))
+    with pytest.raises(ValueError):
+        build_token_index("table_sql_absolute", "gpt", data_dir=str(data_dir), num_workers=1)
+
+
+def test_proxy_tokenizers_are_not_shared():
+    # Gemini is tokenized with the encoding of gpt as a proxy: its positions are its own estimates
+    assert token_index.tokenizer_name("gpt") == "o200k_base"
+    assert token_index.tokenizer_name("gemini") not in {"o200k_base", token_index.tokenizer_name("claude")}
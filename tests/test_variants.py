@@ -0,0 +1,69 @@
+import multiprocessing
+import concurrent.futures
+
+import pytest
+
+pytest.importorskip("dense.llm")
+
+from dense.eval import HistoryReorderMetric
+from dense.storage import context_text, convert_to_segments, iter_instances
+from dense.storage.segments import SegmentStoreWriter
+from dense.synth import generate_instance, generate_task_file, positional_views, write_variants
+from dense.synth.validate import validate_instance
+from dense.synth.variants import _stored_items
+
+
+def test_views(tmp_path):
+    elem = generate_instance("history_reorder_absolute", 2000, 1, 0)
+    with SegmentStoreWriter(str(tmp_path / "contexts")) as writer:
+        views = positional_views(elem, "history_reorder_absolute", "relative", 20, writer=writer)
+    assert len({view["uuid"] for view in views}) == 20
+    assert all("context" not in view for view in views)
+    for view in views:
+        context = context_text(view)
+        assert len(context) == view["context_length"] == len(elem["context"])
+        # The relevant items are at their new locations, and the answers follow them
+        assert validate_instance(view, "history_reorder_relative")["problems"] == []
+        assert HistoryReorderMetric().evaluate([view["answers"][0]], [view["answers"]]) == [1.0]
+    assert views[0]["location"] != views[-1]["location"]
+    # A view is reproducible
+    with SegmentStoreWriter(str(tmp_path / "contexts")) as writer:
+        assert positional_views(elem, "history_reorder_absolute", "relative", 20, levels=[5], writer=writer) == [views[5]]
+
+
+def test_a_base_should_be_in_a_segment_store():
+    elem = generate_instance("table_sql_absolute", 1000, 1, 0)
+    with pytest.raises(AssertionError):
+        positional_views(elem, "table_sql_absolute", "absolute", 4)
+
+
+def test_views_are_read_in_other_processes(tmp_path):
+    data_dir = tmp_path / "data"
+    path, _ = generate_task_file("equation_solution_absolute", [1000], 2, data_dir=str(data_dir), num_levels=2)
+    # Bases read from a segmented task file refer to their store already
+    refs, _, _, _ = convert_to_segments(path, str(data_dir / "contexts"))
+    output = str(tmp_path / "variants.jsonl")
+    assert write_variants(refs, "equation_solution_absolute", "absolute", 6, str(data_dir / "contexts"), output) == 2 * 6
+    views = list(iter_instances(output))
+    _stored_items.cache_clear()
+
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(2, mp_context=context) as executor:
+        contexts = list(executor.map(context_text, views))
+    assert contexts == [context_text(view) for view in views]
+    assert all(validate_instance(view, "equation_solution_absolute")["problems"] == [] for view in views)
+
+
+def test_variants_are_loaded_as_a_task(tmp_path, data_dir):
+    pytest.importorskip("dense.llm")
+    from dense.runner.pipeline import load_task_slice
+
+    output_dir = tmp_path / "variants"
+    output_dir.mkdir()
+    output = str(output_dir / "table_sql_relative.jsonl")
+    # One base per token level and seed, at level 0
+    write_variants(f"{data_dir}/table_sql_absolute.json", "table_sql_absolute", "relative", 10, f"{data_dir}/contexts", output)
+    sampled = load_task_slice("table_sql_relative", 1000, 1000, 3, data_dir=str(output_dir))
+    assert len(sampled) == 3 * 10
+    assert all("context" not in elem for elem in sampled)
+    assert all(validate_instance(elem, "table_sql_relative")["problems"] == [] for elem in sampled)
@@ -0,0 +1,52 @@
+import os
+import json
+
+import pytest
+
+
+def write_results(root, model, name, results):
+    path = os.path.join(root, model, name)
+    os.makedirs(path)
+    with open(os.path.join(path, "results.json"), "w") as file:
+        json.dump(results, file)
+
+
+def test_parse_result_dir():
+    pytest.importorskip("dense.llm")
+    from dense.runner.warm import parse_result_dir
+
+    assert parse_result_dir("table_sql_absolute") == ("table_sql_absolute", "both")
+    assert parse_result_dir("history_reorder_relative_head") == ("history_reorder_relative", "head")
+    assert parse_result_dir("equation_solution_absolute_tail_1000-4000_seed3") == ("equation_solution_absolute", "tail")
+    assert parse_result_dir("unknown_task") is None
+
+
+def test_warm_cache(tmp_path, instances, response_cache):
+    from dense.llm.llm import SINGLE_GENERATE
+    from dense.runner.pipeline import build_input, select_prompt
+    from dense.runner.warm import warm_cache
+
+    root = str(tmp_path / "res")
+    answered = [dict(elem, llm_response=f"response {i}") for i, elem in enumerate(instances[:3])]
+    failed = dict(instances[3], llm_response=None)
+    write_results(root, "gpt", "table_sql_absolute", answered + [failed])
+    sampled = [dict(elem, llm_responses=[f"sample {k}" for k in range(2)]) for elem in instances[4:6]]
+    write_results(root, "qwen_7b", "table_sql_absolute_tail_1000-2000_seed3", sampled)
+
+    counts = warm_cache(root)
+    assert sorted(counts.values()) == [(3, 0), (4, 0)]
+
+    gpt_single_generate, model_name, _ = SINGLE_GENERATE["gpt"]
+    prompt_type = select_prompt(True, True)
+    for i, elem in enumerate(instances[:3]):
+        input_dict = build_input(elem, prompt_type, "table_sql_absolute")
+        assert gpt_single_generate.lookup(input_dict, model=model_name) == f"response {i}"
+    with pytest.raises(KeyError):
+        gpt_single_generate.lookup(build_input(instances[3], prompt_type, "table_sql_absolute"), model=model_name)
+
+    qwen_single_generate, model_name, _ = SINGLE_GENERATE["qwen_7b"]
+    input_dict = build_input(instances[4], select_prompt(False, True), "table_sql_absolute")
+    assert qwen_single_generate.lookup(input_dict, model=model_name, sample_id=1) == "sample 1"
+
+    # Warming again stores nothing
+    assert sorted(warm_cache(root).values()) == [(0, 3), (0, 4)]
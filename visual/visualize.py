@@ -8,6 +8,8 @@ import matplotlib.cm as cm
 import matplotlib.colors as mcolors
 import re
 
+from dense.storage import find_artifact, load_json
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
@@ -73,13 +75,13 @@ def analyze_task_model(task, model):
     Returns:
     dict: Average scores for each level.
     """
-    path = f'res/{model}/{task}/results.json'
-    if not os.path.exists(path):
-        logging.warning(f"File does not exist: {path}")
+    # The results may be compressed (results.json.zst or .gz)
+    path = find_artifact(f'res/{model}/{task}/results.json')
+    if path is None:
+        logging.warning(f"File does not exist: res/{model}/{task}/results.json")
         return None
     try:
-        with open(path, 'r') as f:
-            data = json.load(f)
+        data = load_json(path)
     except json.JSONDecodeError as e:
         logging.error(f"JSON parsing error in file {path}: {e}")
         return None
@@ -7,6 +7,8 @@ from matplotlib import rcParams
 import matplotlib.colors as mcolors
 import re
 
+from dense.storage import find_artifact, load_json
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
@@ -67,13 +69,13 @@ def analyze_task_model(task, model):
     Returns:
     dict: Average scores for each level.
     """
-    res_dir = f'res/{model}/{task}/results.json'
-    if not os.path.exists(res_dir):
-        logging.warning(f"File does not exist: {res_dir}")
+    # The results may be compressed (results.json.zst or .gz)
+    res_dir = find_artifact(f'res/{model}/{task}/results.json')
+    if res_dir is None:
+        logging.warning(f"File does not exist: res/{model}/{task}/results.json")
         return None
     try:
-        with open(res_dir, 'r') as f:
-            data = json.load(f)
+        data = load_json(res_dir)
     except json.JSONDecodeError as e:
         logging.error(f"Error parsing JSON in file {res_dir}: {e}")
         return None